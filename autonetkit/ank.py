@@ -5,6 +5,7 @@ import itertools
 from collections import namedtuple
 import autonetkit
 
+import autonetkit.anm.node_index as node_index
 import autonetkit.log as log
 import networkx as nx
 from ank_utils import unwrap_graph, unwrap_nodes
@@ -89,6 +90,8 @@ def set_node_default(nm_graph, nbunch=None, **kwargs):
         for (key, val) in kwargs.items():
             if key not in graph.node[node]:
                 graph.node[node][key] = val
+                node_index.set_value(nm_graph._anm, nm_graph._overlay_id,
+                                     node, key, val)
 
 # TODO: also add ability to copy multiple attributes
 
@@ -163,6 +166,8 @@ def copy_attr_from(overlay_src, overlay_dst, src_attr, dst_attr=None,
 
             if node in graph_dst:
                 graph_dst.node[node][dst_attr] = val
+                node_index.set_value(overlay_dst._anm, overlay_dst._overlay_id,
+                                     node, dst_attr, val)
 
 
 def copy_int_attr_from(overlay_src, overlay_dst, src_attr, dst_attr=None,
@@ -0,0 +1,194 @@
+"""Binary archive format for saved network models and device models.
+
+An alternative to the gzipped JSON of ank_json, selected with the
+archive_format setting. An archive is:
+
+    MAGIC, format version (unsigned short)
+    sections, each a zlib-compressed pickle of one graph
+    index of the sections: JSON {name: [offset, length]}
+    offset of the index (unsigned long long)
+
+Each overlay of a network model is a section, so a single overlay can be
+loaded without reading or decoding the others. Graphs are stored as their
+graph, node and edge data, rather than as NetworkX objects, and pickled
+with the C pickler. Attribute keys shared by nodes are stored once per
+section by the pickle memo. IPAddress and IPNetwork values are stored as
+typed (value, prefixlen, version) encodings, and the objects that
+ank_json.AnkEncoder converts to strings, such as NmNode, are stored in
+that converted form. Unlike JSON, tuples, sets, integer keys and
+ConfigStanzas are restored as they were saved.
+"""
+
+import cPickle as pickle
+import glob
+import json
+import os
+import struct
+import zlib
+from cStringIO import StringIO
+
+import autonetkit.config
+import autonetkit.log as log
+import autonetkit.nidb
+import autonetkit.render2
+import netaddr
+import networkx as nx
+from autonetkit.ank_json import AnkEncoder
+from autonetkit.exception import AnkIncorrectFileFormat
+
+MAGIC = "ANKARCHIVE"
+VERSION = 1
+EXTENSION = ".ank"
+
+_header = struct.Struct(">%ssH" % len(MAGIC))
+_footer = struct.Struct(">Q")
+
+
+def binary_format():
+    """Returns if the archive_format setting selects this format"""
+    return autonetkit.config.settings['General']['archive_format'] == "binary"
+
+
+def saved_files(directory):
+    """Returns the files saved to directory, in either format, oldest
+    first (by the timestamp in the filename)"""
+    filenames = (glob.glob(os.path.join(directory, "*.json.gz"))
+                 + glob.glob(os.path.join(directory, "*" + EXTENSION)))
+    return sorted(filenames, key=os.path.basename)
+
+
+def is_archive(filename):
+    return filename.endswith(EXTENSION)
+
+
+def _persistent_id(obj):
+    """Typed encodings for objects that aren't pickled as they are.
+    Called by the pickler only for instances, not builtin types"""
+    if isinstance(obj, netaddr.IPAddress):
+        return ("IPAddress", int(obj), obj.version)
+    if isinstance(obj, netaddr.IPNetwork):
+        return ("IPNetwork", int(obj.ip), obj.prefixlen, obj.version)
+    if isinstance(obj, _pickled_types):
+        return None
+    try:
+        # as saved to JSON, eg str(obj) for an NmNode
+        return ("value", _encoder.default(obj))
+    except TypeError:
+        return None
+
+_pickled_types = (set, frozenset, autonetkit.nidb.ConfigStanza,
+                  autonetkit.render2.NodeRender)
+_encoder = AnkEncoder()
+
+
+def _persistent_load(pid):
+    kind = pid[0]
+    if kind == "IPAddress":
+        return netaddr.IPAddress(pid[1], pid[2])
+    if kind == "IPNetwork":
+        return netaddr.IPNetwork(pid[1:3], version=pid[3])
+    if kind == "value":
+        return pid[1]
+    raise AnkIncorrectFileFormat("Unknown archive value type %s" % kind)
+
+
+def dumps_graph(graph):
+    """Returns the compressed section for graph"""
+    if graph.is_multigraph():
+        edges = graph.edges(keys=True, data=True)
+    else:
+        edges = graph.edges(data=True)
+    data = (graph.is_directed(), graph.is_multigraph(), graph.graph,
+            graph.node.items(), edges)
+
+    fh = StringIO()
+    pickler = pickle.Pickler(fh, pickle.HIGHEST_PROTOCOL)
+    pickler.inst_persistent_id = _persistent_id
+    pickler.dump(data)
+    return zlib.compress(fh.getvalue())
+
+
+def loads_graph(section):
+    """Returns the graph of the compressed section"""
+    unpickler = pickle.Unpickler(StringIO(zlib.decompress(section)))
+    unpickler.persistent_load = _persistent_load
+    directed, multigraph, graph_data, nodes, edges = unpickler.load()
+
+    if directed:
+        graph = nx.MultiDiGraph() if multigraph else nx.DiGraph()
+    else:
+        graph = nx.MultiGraph() if multigraph else nx.Graph()
+    graph.graph = graph_data
+    graph.add_nodes_from(nodes)
+    graph.add_edges_from(edges)
+    return graph
+
+
+def save(filename, graphs):
+    """Saves graphs, [(section name, graph)], to the archive filename"""
+    log.debug("Saving to %s" % filename)
+    index = {}
+    with open(filename, "wb") as fh:
+        fh.write(_header.pack(MAGIC, VERSION))
+        for name, graph in graphs:
+            section = dumps_graph(graph)
+            index[name] = [fh.tell(), len(section)]
+            fh.write(section)
+        index_offset = fh.tell()
+        fh.write(json.dumps(index, sort_keys=True))
+        fh.write(_footer.pack(index_offset))
+
+
+def read_index(fh):
+    """Returns the section index, {name: [offset, length]}, of the open
+    archive fh"""
+    header = fh.read(_header.size)
+    if len(header) != _header.size:
+        raise AnkIncorrectFileFormat("Not an AutoNetkit archive")
+    magic, version = _header.unpack(header)
+    if magic != MAGIC:
+        raise AnkIncorrectFileFormat("Not an AutoNetkit archive")
+    if version != VERSION:
+        raise AnkIncorrectFileFormat("Unsupported archive version %s, "
+                                     "expected %s" % (version, VERSION))
+    fh.seek(-_footer.size, os.SEEK_END)
+    footer_offset = fh.tell()
+    index_offset, = _footer.unpack(fh.read(_footer.size))
+    fh.seek(index_offset)
+    return json.loads(fh.read(footer_offset - index_offset))
+
+
+def section_names(filename):
+    with open(filename, "rb") as fh:
+        return sorted(read_index(fh))
+
+
+def section_loader(filename):
+    """Returns (section names, loader) for the archive filename, where
+    loader(name) reads and returns the graph of section name"""
+    with open(filename, "rb") as fh:
+        index = read_index(fh)
+
+    def loader(name):
+        try:
+            offset, length = index[name]
+        except KeyError:
+            raise AnkIncorrectFileFormat("Section %s not in %s"
+                                         % (name, filename))
+        log.debug("Restoring %s from %s" % (name, filename))
+        with open(filename, "rb") as fh:
+            fh.seek(offset)
+            return loads_graph(fh.read(length))
+
+    return sorted(index), loader
+
+
+def load(filename, names=None):
+    """Returns {section name: graph} from the archive filename, for the
+    sections in names if set, otherwise for all sections. Only the
+    sections loaded are read from the file"""
+    log.debug("Restoring %s" % filename)
+    section_names, loader = section_loader(filename)
+    if names is None:
+        names = section_names
+    return dict((name, loader(name)) for name in names)
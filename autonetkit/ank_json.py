@@ -68,11 +68,33 @@ class AnkEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
-def ank_json_dumps(graph, indent=4):
+class TaggedAnkEncoder(AnkEncoder):
+
+    """Tags netaddr objects, eg {"_IPAddress": "10.0.0.1"}, so that they
+    are restored by ank_json_tagged_loads without guessing which strings
+    are addresses"""
+
+    def default(self, obj):
+        if isinstance(obj, netaddr.IPAddress):
+            return {"_IPAddress": str(obj)}
+        if isinstance(obj, netaddr.IPNetwork):
+            return {"_IPNetwork": str(obj)}
+        return AnkEncoder.default(self, obj)
+
+# marks graphs saved with the TaggedAnkEncoder
+TAGGED_FORMAT_KEY = "_ank_json"
+TAGGED_FORMAT_VERSION = 1
+
+
+def ank_json_dumps(graph, indent=4, tagged=False):
+    """JSON for graph. If tagged, netaddr objects and ConfigStanzas are
+    tagged, for saved archives to be restored by ank_json_loads"""
     data = json_graph.node_link_data(graph)
-# TODO: use regex to convert IPAddress and IPNetwork back to respective
-# form in decoder
-    data = json.dumps(data, cls=AnkEncoder, indent=indent, sort_keys=True)
+    encoder = AnkEncoder
+    if tagged:
+        data[TAGGED_FORMAT_KEY] = TAGGED_FORMAT_VERSION
+        encoder = TaggedAnkEncoder
+    data = json.dumps(data, cls=encoder, indent=indent, sort_keys=True)
     return data
 
 
@@ -149,19 +171,38 @@ def ank_json_custom_loads(data):
     return d
 
 
+def tagged_to_object(d):
+    """Restores the values tagged by the TaggedAnkEncoder"""
+    if len(d) == 1:
+        if "_IPAddress" in d:
+            return netaddr.IPAddress(d["_IPAddress"])
+        if "_IPNetwork" in d:
+            return netaddr.IPNetwork(d["_IPNetwork"])
+    elif d.get("_ConfigStanza") is True:
+        del d["_ConfigStanza"]
+        return autonetkit.nidb.ConfigStanza(**d)
+    return d
+
+
+def ank_json_tagged_loads(data):
+    """Decodes JSON written by the TaggedAnkEncoder. Unlike
+    ank_json_custom_loads, strings are left as strings"""
+    return json.loads(data, object_hook=tagged_to_object)
+
+
 def rebind_interfaces(anm):
     for overlay_id in anm.overlays():
-        overlay = anm[overlay_id]
-        # for edge in overlay.edges():
-        #unbound_ports = edge._ports
-# map nodes -> node objects, values to integers (not strings)
-        # interfaces = {overlay.node(key): val for key, val in unbound_ports.items()}
-        # edge._ports = interfaces # store with remapped node
-        for node in overlay.nodes():
-            unbound_ports = node.raw_interfaces
-            if len(unbound_ports):  # is list if none set
-                interfaces = {int(key): val for key, val in unbound_ports.items()}
-                node.raw_interfaces = interfaces
+        rebind_graph_interfaces(anm.overlay_nx_graphs[overlay_id])
+
+
+def rebind_graph_interfaces(graph):
+    """Maps the port ids of the nodes in an overlay graph restored from
+    JSON back to integers (not strings)"""
+    for node_data in graph.node.values():
+        unbound_ports = node_data.get('_ports')
+        if unbound_ports:
+            node_data['_ports'] = {int(key): val
+                                   for key, val in unbound_ports.items()}
 
 # TODO: need to also rebind_interfaces for nidb
 
@@ -175,7 +216,11 @@ def rebind_nidb_interfaces(nidb):
 
 
 def ank_json_loads(data):
-    d = ank_json_custom_loads(data)
+    """Graph from ank_json_dumps. Graphs saved without tags, by earlier
+    versions, are decoded by ank_json_custom_loads"""
+    d = ank_json_tagged_loads(data)
+    if d.get(TAGGED_FORMAT_KEY) != TAGGED_FORMAT_VERSION:
+        d = ank_json_custom_loads(data)
     # TODO: map back edge keys for parallel links - or is this automatic?
     return json_graph.node_link_graph(d)
 
@@ -190,7 +235,7 @@ def jsonify_anm(anm):
                 del NmGraph.node[n]['id']
             except KeyError:
                 pass
-        anm_json[overlay_id] = ank_json_dumps(NmGraph)
+        anm_json[overlay_id] = ank_json_dumps(NmGraph, tagged=True)
     return json.dumps(anm_json)
 
 
@@ -201,18 +246,12 @@ def shortened_interface(name):
     return name
 
 
-def jsonify_anm_with_graphics(anm, nidb=None):
-    """ Returns a dictionary of json-ified overlay graphs, with graphics data appended to each overlay"""
-    from collections import defaultdict
-    import math
-    anm_json = {}
-    test_anm_data = {}
-    graphics_graph = anm["graphics"]._graph.copy()
-    phy_graph = anm["phy"]._graph  # to access ASNs
-
+def layout_dependencies(anm):
     """simple layout of deps - more advanced layout could
-    export to dot and import to omnigraffle, etc
+    export to dot and import to omnigraffle, etc.
+    Returns {overlay_id: layer} for the overlays in the dependency graph
     """
+    from collections import defaultdict
     g_deps = anm['_dependencies']
     nm_graph = g_deps._graph
     # build tree
@@ -253,7 +292,33 @@ def jsonify_anm_with_graphics(anm, nidb=None):
                 nm_graph.node[node]['x'] = node_x
                 nodes_by_layer[node] = layer
 
+    return nodes_by_layer
+
+
+def overlay_graph(anm, overlay_id):
+    """Returns the graph of overlay_id to visualise, without copying"""
+    nm_graph = anm[overlay_id]._graph
+    if overlay_id == "_dependencies":
+        # convert to undirected for visual clarify
+        nm_graph = nx.Graph(nm_graph)
+    return nm_graph
+
+
+def graphics_attributes(anm):
+    """Returns {overlay_id: {node: graphics data}}, with the graphics data
+    (eg x, y, label and device_type) that each node in an overlay takes
+    from the phy and graphics overlays, or from the overlays laid out
+    before it, and its own x, y, and label. Missing positions are
+    allocated randomly, and kept for the node in the later overlays.
+    Overlays are laid out in order of their layer in the dependency
+    graph"""
+    from collections import defaultdict
     import random
+    graphics_graph = anm["graphics"]._graph
+    phy_graph = anm["phy"]._graph  # to access ASNs
+
+    nodes_by_layer = layout_dependencies(anm)
+
     attribute_cache = defaultdict(dict)
     # the attributes to copy
     # TODO: check behaviour for None if explicitly set
@@ -270,6 +335,7 @@ def jsonify_anm_with_graphics(anm, nidb=None):
                     if key in in_data}
         attribute_cache[node].update(out_data)
 
+    if len(graphics_graph):
         # append label from function
         for node in anm['phy']:
             attribute_cache[node.id]['label'] = str(node)
@@ -277,29 +343,22 @@ def jsonify_anm_with_graphics(anm, nidb=None):
     overlay_ids = sorted(anm.overlays(),
                          key=lambda x: nodes_by_layer.get(x, 0))
 
+    retval = {}
     for overlay_id in overlay_ids:
         try:
-            #make a shallow copy
-            # input_graph = anm[overlay_id]._graph
-            # nm_graph = shallow_copy_nx_graph(input_graph)
-            nm_graph = anm[overlay_id]._graph.copy()
+            nm_graph = overlay_graph(anm, overlay_id)
         except Exception, e:
-            log.warning("Unable to copy overlay %s: %s", overlay_id, e)
+            log.warning("Unable to access overlay %s: %s", overlay_id, e)
             continue
 
-        if overlay_id == "_dependencies":
-            # convert to undirected for visual clarify
-            nm_graph = nx.Graph(nm_graph)
-
+        retval[overlay_id] = overlay_graphics = {}
         for node in nm_graph:
             node_data = dict(attribute_cache.get(node, {}))
             # update with node data from this overlay
             # TODO: check is not None won't clobber specifically set in
             # overlay...
             graph_node_data = nm_graph.node[node]
-            overlay_node_data = {key: graph_node_data.get(key)
-                                 for key in graph_node_data}
-            node_data.update(overlay_node_data)
+            node_data.update(graph_node_data)
 
             # check for any non-set properties
             if node_data.get("x") is None:
@@ -341,48 +400,141 @@ def jsonify_anm_with_graphics(anm, nidb=None):
             if node_data.get("label") is None:
                 node_data['label'] = str(node)  # don't need to cache
 
-            # store on graph
-            nm_graph.node[node] = node_data
+            # only keep what isn't in the overlay's own node data
+            overlay_graphics[node] = {
+                key: val for key, val in node_data.items()
+                if key in ("x", "y", "label") or key not in graph_node_data}
 
-            try:
-                del nm_graph.node[node]['id']
-            except KeyError:
-                pass
+    return retval
 
-            if nidb:
-                nidb_graph = nidb.raw_graph()
-                if node in nidb:
-                    DmNode_data = nidb_graph.node[node]
-                    try:
-                        # TODO: check why not all nodes have _ports initialised
-                        overlay_interfaces = nm_graph.node[node]["_ports"]
-                    except KeyError:
-                        continue  # skip copying interface data for this node
-
-                    for interface_id in overlay_interfaces.keys():
-                        # TODO: use raw_interfaces here
-                        try:
-                            nidb_interface_id = DmNode_data[
-                                '_ports'][interface_id]['id']
-                        except KeyError:
-                            # TODO: check why arrive here - something not
-                            # initialised?
-                            continue
-                        nm_graph.node[node]['_ports'][
-                            interface_id]['id'] = nidb_interface_id
-                        id_brief = shortened_interface(nidb_interface_id)
-                        nm_graph.node[node]['_ports'][
-                            interface_id]['id_brief'] = id_brief
-
-        anm_json[overlay_id] = ank_json_dumps(nm_graph)
-        test_anm_data[overlay_id] = nm_graph
 
+def overlay_node_data(nm_graph, node, graphics, nidb=None):
+    """Returns the node data of node in nm_graph to visualise, with its
+    graphics data, and interface names from nidb. The overlay's data is
+    shared, not copied, except for ports that are updated"""
+    node_data = dict(nm_graph.node[node])
+    node_data.update(graphics)
+    node_data.pop('id', None)
+
+    if nidb and node in nidb:
+        DmNode_data = nidb.raw_graph().node[node]
+        # TODO: check why not all nodes have _ports initialised
+        overlay_interfaces = node_data.get("_ports")
+        if overlay_interfaces is None:
+            return node_data  # skip copying interface data for this node
+
+        ports = dict(overlay_interfaces)
+        for interface_id in overlay_interfaces.keys():
+            # TODO: use raw_interfaces here
+            try:
+                nidb_interface_id = DmNode_data[
+                    '_ports'][interface_id]['id']
+            except KeyError:
+                # TODO: check why arrive here - something not
+                # initialised?
+                continue
+            ports[interface_id] = dict(ports[interface_id],
+                                       id=nidb_interface_id,
+                                       id_brief=shortened_interface(
+                                           nidb_interface_id))
+        node_data['_ports'] = ports
+
+    return node_data
+
+
+def graph_elements(graph, node_data=None):
+    """Returns (graph data, nodes, links) of graph, with nodes [(node,
+    data)] and links [(src, dst, data)]. Node data is node_data(node)
+    if set, otherwise the data of the node in graph"""
+    graph_data = {
+        'directed': graph.is_directed(),
+        'multigraph': graph.is_multigraph(),
+        'graph': list(graph.graph.items()),
+    }
+    if node_data is None:
+        nodes = graph.nodes(data=True)
+    else:
+        nodes = [(node, node_data(node)) for node in graph]
+    return graph_data, nodes, graph.edges(data=True)
+
+
+def overlay_elements(nm_graph, overlay_graphics, nidb=None):
+    """Returns the graph_elements of nm_graph to visualise, see
+    overlay_node_data"""
+    return graph_elements(
+        nm_graph, lambda node: overlay_node_data(
+            nm_graph, node, overlay_graphics[node], nidb))
+
+
+def node_link_data(graph_data, nodes, links):
+    """Returns the node-link data (as json_graph.node_link_data) of
+    graph_elements"""
+    mapping = dict((node, index) for index, (node, _) in enumerate(nodes))
+    return dict(graph_data,
+                nodes=[dict(data, id=node) for node, data in nodes],
+                links=[dict(data, source=mapping[src], target=mapping[dst])
+                       for src, dst, data in links])
+
+
+def overlay_link_data(nm_graph, overlay_graphics, nidb=None):
+    """Returns the node-link data (as json_graph.node_link_data) of
+    nm_graph to visualise, see overlay_node_data"""
+    return node_link_data(*overlay_elements(nm_graph, overlay_graphics,
+                                            nidb))
+
+
+def visualisation_elements(anm, nidb=None):
+    """Yields (overlay_id, graph_elements) of each overlay to visualise,
+    and the nidb if set, as dump_anm_with_graphics"""
+    graphics = graphics_attributes(anm)
+    for overlay_id in graphics:
+        yield overlay_id, overlay_elements(overlay_graph(anm, overlay_id),
+                                           graphics[overlay_id], nidb)
+    if nidb:
+        yield 'nidb', graph_elements(prepare_nidb(nidb))
+
+
+def dump_json_object(items, fh, indent=4):
+    """Writes the JSON object of items, [(key, function returning value)],
+    to the file-like fh, one value at a time, as json.dumps with
+    sort_keys set. Each value is only created when it is written"""
+    encoder = AnkEncoder(indent=indent, sort_keys=True)
+    newline_indent = "\n" + " " * indent
+    separator = "{"
+    for key, value in sorted(items):
+        fh.write(separator)
+        fh.write(newline_indent)
+        fh.write(encoder.encode(key))
+        fh.write(encoder.key_separator)
+        for chunk in encoder.iterencode(value()):
+            fh.write(chunk.replace("\n", newline_indent))
+        separator = encoder.item_separator
+    fh.write("{}" if separator == "{" else "\n}")
+
+
+def dump_anm_with_graphics(anm, fh, nidb=None):
+    """Writes the json-ified overlay graphs, with graphics data appended
+    to each overlay, to the file-like fh. Overlays are written one at a
+    time, from the overlay graphs rather than copies of them"""
+    graphics = graphics_attributes(anm)
+
+    def overlay_data(overlay_id):
+        return lambda: overlay_link_data(overlay_graph(anm, overlay_id),
+                                         graphics[overlay_id], nidb)
+
+    items = [(overlay_id, overlay_data(overlay_id))
+             for overlay_id in graphics]
     if nidb:
-        test_anm_data['nidb'] = prepare_nidb(nidb)
+        items.append(('nidb', lambda: prepare_nidb(nidb)))
+    dump_json_object(items, fh)
+
 
-    result = json.dumps(
-        test_anm_data, cls=AnkEncoder, indent=4, sort_keys=True)
-    return result
+def jsonify_anm_with_graphics(anm, nidb=None):
+    """ Returns a dictionary of json-ified overlay graphs, with graphics data appended to each overlay"""
+    from cStringIO import StringIO
+    fh = StringIO()
+    dump_anm_with_graphics(anm, fh, nidb)
+    return fh.getvalue()
 
 
 def prepare_nidb(nidb):
@@ -1,8 +1,20 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import atexit
+import httplib
+import itertools
+import json
+import random
+import socket
+import threading
+import time
+import urlparse
+from collections import OrderedDict
+
 import autonetkit.ank_json
 import autonetkit.config as config
 import autonetkit.log as log
+import autonetkit.vis_delta as vis_delta
 from autonetkit.ank_utils import call_log
 
 use_http_post = config.settings['Http Post']['active']
@@ -24,35 +36,224 @@ default_http_url = format_http_url()
 #@call_log
 
 
+# last Snapshot published, by (http_url, uuid), to send deltas from
+published = {}
+full_publish_urls = set()  # servers that don't apply deltas
+_session = "%08x" % random.getrandbits(32)
+_versions = itertools.count(1)
+
+
+def snapshot(anm, nidb=None):
+    """Returns the vis_delta.Snapshot of the topology to publish"""
+    encoder = autonetkit.ank_json.AnkEncoder(sort_keys=True)
+    overlays = {}
+    for overlay_id, (graph_data, nodes, links) in \
+            autonetkit.ank_json.visualisation_elements(anm, nidb):
+        overlays[overlay_id] = (
+            encoder.encode(graph_data),
+            dict((node, encoder.encode(dict(data, id=node)))
+                 for node, data in nodes),
+            dict((key, encoder.encode(dict(data, source=src, target=dst)))
+                 for key, (src, dst, data)
+                 in zip(vis_delta.link_keys(links), links)))
+    version = "%s.%s" % (_session, next(_versions))
+    return vis_delta.Snapshot(version, overlays)
+
+
+_connections = {}  # persistent HTTPConnection, by (host, port)
+
+
+def post(http_url, params):
+    """POSTs params, urlencoded, to http_url, and returns the body of the
+    response. Connections are kept open to be reused, and reopened if
+    closed by the server. Raises IOError if unable to connect"""
+    url = urlparse.urlsplit(http_url)
+    body = urllib.urlencode(params)
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    key = (url.hostname, url.port)
+    for attempt in range(2):
+        connection = _connections.get(key)
+        if connection is None:
+            connection = httplib.HTTPConnection(
+                url.hostname, url.port,
+                timeout=config.settings['Http Post']['timeout'])
+            _connections[key] = connection
+        try:
+            connection.request('POST', url.path or '/', body, headers)
+            return connection.getresponse().read()
+        except (socket.error, httplib.HTTPException), error:
+            connection.close()
+            del _connections[key]
+            if attempt:
+                raise IOError(error)
+            # the server may have closed an idle connection, so try again
+
+
+def publish_delta(current, http_url, uuid):
+    """Publishes the changes from the last publish to uuid to the
+    Snapshot current, or all of it if the server doesn't hold that
+    publish. Returns False if the server doesn't apply deltas"""
+    base = published.get((http_url, uuid), vis_delta.Snapshot())
+    while True:
+        params = {'body': current.delta_from(base),
+                  'type': 'anm_delta', 'uuid': uuid}
+        try:
+            data = post(http_url, params)
+        except IOError, e:
+            log.info('Unable to connect to visualisation server %s',
+                     http_url)
+            return True
+        try:
+            version = json.loads(data)['version']
+        except (ValueError, TypeError, KeyError):
+            log.debug('Visualisation server %s does not apply deltas',
+                      http_url)
+            full_publish_urls.add(http_url)
+            return False
+
+        if version == current.version:
+            published[http_url, uuid] = current
+            return True
+        if not base.version:
+            return False  # publish all of the topology instead
+        log.debug('Visualisation server %s does not hold %s, sending '
+                  'all of topology' % (http_url, base.version))
+        base = vis_delta.Snapshot()
+
+
+def publish_snapshot(current, http_url, uuid):
+    """Publishes the Snapshot current, as a delta if the server applies
+    them"""
+    if (http_url not in full_publish_urls
+            and publish_delta(current, http_url, uuid)):
+        return
+    body = json.dumps(vis_delta.node_link_topology(current))
+    publish(body, http_url, uuid)
+
+
+def publish(body, http_url, uuid):
+    """Publishes the JSON of all of the topology"""
+    params = {'body': body, 'type': 'anm', 'uuid': uuid}
+    try:
+        data = post(http_url, params)
+        log.debug(data)
+    except IOError, e:
+        log.info('Unable to connect to visualisation server %s', http_url)
+        return False
+    return True
+
+
+class Publisher(object):
+
+    """Publishes topologies to visualisation servers from a background
+    thread, so that the build doesn't wait for the server.
+
+    Publishes are queued by (http_url, uuid). A publish to a key already
+    queued replaces it, so only the latest topology is sent. At most
+    max_pending keys are queued, and the oldest dropped beyond that"""
+
+    def __init__(self, max_pending=16):
+        self.max_pending = max_pending
+        self._pending = OrderedDict()  # {key: send function}, oldest first
+        self._sending = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, key, send):
+        """Queues send(), replacing any publish queued for key"""
+        with self._condition:
+            self._pending.pop(key, None)
+            self._pending[key] = send
+            while len(self._pending) > self.max_pending:
+                dropped, _ = self._pending.popitem(last=False)
+                log.warning('Visualisation queue full, dropped publish '
+                            'for %s' % (dropped,))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='ank_publisher')
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Waits until queued publishes are sent, or for timeout seconds
+        if set. Returns if all were sent"""
+        deadline = timeout and time.time() + timeout
+        with self._condition:
+            while self._pending or self._sending:
+                remaining = deadline and deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                _, send = self._pending.popitem(last=False)
+                self._sending = True
+            try:
+                send()
+            except Exception, e:
+                log.warning('Unable to publish to visualisation server: %s'
+                            % e)
+            finally:
+                with self._condition:
+                    self._sending = False
+                    self._condition.notify_all()
+
+
+publisher = Publisher()
+
+
+@atexit.register
+def _flush_on_exit():
+    if config.settings['Http Post']['flush_on_exit']:
+        publisher.flush()
+
+
+def flush(timeout=None):
+    """Waits for publishes queued by update_vis to be sent, see
+    Publisher.flush"""
+    return publisher.flush(timeout)
+
+
 def update_vis(anm=None, nidb=None, http_url=None, uuid=None):
+    """Publishes anm, and nidb if set, to the visualisation server. The
+    topology is serialised before returning, and sent in the background
+    if the asynchronous setting is set"""
     if http_url is None:
         http_url = default_http_url
 
-    if anm and nidb:
-        body = autonetkit.ank_json.dumps(anm, nidb)
-    elif anm:
-        body = autonetkit.ank_json.dumps(anm)
-    else:
-        import json
-        body = json.dumps({})  # blank to test visualisation server running
-
     if uuid is None:
         uuid = get_uuid(anm)
 
-    params = urllib.urlencode({'body': body, 'type': 'anm',
-                               'uuid': uuid})
-    try:
-        data = urllib.urlopen(http_url, params).read()
-        log.debug(data)
-    except IOError, e:
-        log.info('Unable to connect to visualisation server %s', http_url)
-        return
+    if (anm and config.settings['Http Post']['delta_updates']
+            and http_url not in full_publish_urls):
+        current = snapshot(anm, nidb)
+
+        def send():
+            publish_snapshot(current, http_url, uuid)
 
-    if not anm:
+    else:
+        if anm and nidb:
+            body = autonetkit.ank_json.dumps(anm, nidb)
+        elif anm:
+            body = autonetkit.ank_json.dumps(anm)
+        else:
+            body = json.dumps({})  # blank to test visualisation server running
 
-        # testing
+        def send():
+            if publish(body, http_url, uuid) and not anm:
+                # testing
+                log.info('Visualisation server running')
 
-        log.info('Visualisation server running')
+    if config.settings['Http Post']['asynchronous']:
+        publisher.submit((http_url, uuid), send)
+    else:
+        send()
 
 #@call_log
 
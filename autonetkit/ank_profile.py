@@ -0,0 +1,167 @@
+"""Stage-level instrumentation for the design rules applied to the ANM"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import autonetkit.log as log
+
+try:
+    import resource
+except ImportError:
+    resource = None  # not available on this platform, eg Windows
+
+
+def peak_rss():
+    """Returns the peak resident set size of this process in kilobytes,
+    or None if it can't be measured on this platform"""
+    if resource is None:
+        return None
+
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return usage / 1024  # reported in bytes on OS X
+    return usage
+
+
+def cpu_time():
+    """Returns user + system CPU time used by this process"""
+    times = os.times()
+    return times[0] + times[1]
+
+
+class StageProfiler(object):
+
+    """Records wall time, CPU time, peak RSS delta, and the size of any
+    overlays created, for each stage run against an ANM.
+
+    >>> profiler = StageProfiler()
+    >>> anm = autonetkit.NetworkModel()
+    >>> profiler.start(anm)
+    >>> with profiler.stage("build_test"):
+    ...     g_test = anm.add_overlay("test")
+    >>> [stage['name'] for stage in profiler.stages]
+    ['build_test']
+    >>> profiler.stages[0]['overlays'].keys()
+    ['test']
+
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.anm = None
+        self.stages = []
+
+    def start(self, anm):
+        """Binds the profiler to the ANM that stages will modify"""
+        self.anm = anm
+        self.stages = []
+
+    def _overlay_graphs(self):
+        if self.anm is None:
+            return {}
+        return dict(self.anm.overlay_nx_graphs)
+
+    @contextmanager
+    def stage(self, name, overlays=None):
+        """Context manager to profile the stage name.
+        If overlays is set, only those overlays are reported, eg for stages
+        run concurrently, which would otherwise see each others' overlays"""
+        if not self.enabled:
+            yield
+            return
+
+        graphs_before = self._overlay_graphs()
+        rss_before = peak_rss()
+        cpu_before = cpu_time()
+        wall_before = time.time()
+        try:
+            yield
+        finally:
+            wall_time = time.time() - wall_before
+            cpu = cpu_time() - cpu_before
+            rss_after = peak_rss()
+            if rss_before is None or rss_after is None:
+                rss_delta = None
+            else:
+                rss_delta = rss_after - rss_before
+
+            # overlays either added, or replaced by add_overlay
+            created = {}
+            for overlay_id, graph in self._overlay_graphs().items():
+                if graphs_before.get(overlay_id) is graph:
+                    continue
+                if overlays is not None and overlay_id not in overlays:
+                    continue
+                created[overlay_id] = {
+                    'nodes': graph.number_of_nodes(),
+                    'edges': graph.number_of_edges(),
+                }
+
+            self.stages.append({
+                'name': name,
+                'wall_time': wall_time,
+                'cpu_time': cpu,
+                'peak_rss_delta': rss_delta,
+                'overlays': created,
+            })
+
+    def report(self):
+        """Returns the recorded stages as a dict, suitable for JSON"""
+        return {
+            'timestamp': getattr(self.anm, 'timestamp', None),
+            'stages': list(self.stages),
+            'total_wall_time': sum(s['wall_time'] for s in self.stages),
+            'total_cpu_time': sum(s['cpu_time'] for s in self.stages),
+        }
+
+    def dumps(self):
+        return json.dumps(self.report(), indent=4, sort_keys=True)
+
+    def save(self, filename=None):
+        """Writes the JSON report, by default to
+        profile/build_<timestamp>.json"""
+        if not filename:
+            profile_dir = "profile"
+            if not os.path.isdir(profile_dir):
+                os.makedirs(profile_dir)
+            timestamp = getattr(self.anm, 'timestamp', None) or \
+                time.strftime('%Y%m%d_%H%M%S', time.localtime())
+            filename = os.path.join(profile_dir, "build_%s.json" % timestamp)
+
+        log.debug("Writing build profile to %s" % filename)
+        with open(filename, "w") as fh:
+            fh.write(self.dumps())
+        return filename
+
+    def table(self):
+        """Returns a text table of the stages, slowest first"""
+        header = "%-22s %10s %10s %12s  %s" % ("Stage", "Wall (s)",
+                                              "CPU (s)", "RSS (KB)",
+                                              "Overlays created")
+        lines = [header, "-" * len(header)]
+        stages = sorted(self.stages, key=lambda s: s['wall_time'],
+                        reverse=True)
+        for stage in stages:
+            rss_delta = stage['peak_rss_delta']
+            if rss_delta is None:
+                rss_delta = "-"
+            overlays = ", ".join("%s (%s/%s)" % (overlay_id,
+                                                 counts['nodes'],
+                                                 counts['edges'])
+                                 for overlay_id, counts
+                                 in sorted(stage['overlays'].items()))
+            lines.append("%-22s %10.3f %10.3f %12s  %s" % (stage['name'],
+                                                           stage['wall_time'],
+                                                           stage['cpu_time'],
+                                                           rss_delta,
+                                                           overlays))
+
+        report = self.report()
+        lines.append("-" * len(header))
+        lines.append("%-22s %10.3f %10.3f" % ("Total",
+                                              report['total_wall_time'],
+                                              report['total_cpu_time']))
+        return "\n".join(lines)
@@ -2,6 +2,26 @@ import logging
 import autonetkit.log2
 ank_logger_2 = logging.getLogger("ANK2")
 
+
+def cached_handle(cls, anm, *key):
+    """Returns the cls handle for key in anm, eg a NmNode for
+    (overlay_id, node_id), creating it on first access.
+    Handles don't store any data themselves (this is on the overlay graphs),
+    so the same handle can be returned each time.
+    """
+    handles = getattr(anm, '_handles', None)
+    if handles is None:
+        return cls(anm, *key)  # caching not supported or disabled
+
+    cache_key = (cls,) + key
+    try:
+        return handles[cache_key]
+    except KeyError:
+        handle = handles[cache_key] = cls(anm, *key)
+        return handle
+    except TypeError:
+        return cls(anm, *key)  # unhashable id
+
 class AnkElement(object):
 
     #TODO: put this into parent __init__?
@@ -5,6 +5,7 @@ import itertools
 import logging
 
 import autonetkit
+from autonetkit.anm import node_index
 import autonetkit.log as log
 from autonetkit.anm.edge import NmEdge
 from autonetkit.anm.graph_data import NmGraphData
@@ -14,7 +15,7 @@ from autonetkit.exception import OverlayNotFound
 # TODO: check if this is still a performance hit
 from autonetkit.log import CustomAdapter
 
-from autonetkit.anm.ank_element import AnkElement
+from autonetkit.anm.ank_element import AnkElement, cached_handle
 
 class OverlayBase(AnkElement):
 
@@ -94,8 +95,8 @@ class OverlayBase(AnkElement):
     def interface(self, interface):
         """"""
 
-        return NmPort(self._anm, self._overlay_id, interface.node_id,
-                      interface.interface_id)
+        return cached_handle(NmPort, self._anm, self._overlay_id,
+                             interface.node_id, interface.interface_id)
 
     def edge(self, edge_to_find, dst_to_find=None, key=0):
         '''returns edge in this graph with same src and dst
@@ -247,13 +248,14 @@ class OverlayBase(AnkElement):
 
         try:
             if key.node_id in self._graph:
-                return NmNode(self._anm, self._overlay_id, key.node_id)
+                return cached_handle(NmNode, self._anm, self._overlay_id,
+                                     key.node_id)
         except AttributeError:
 
              # try as string id
 
             if key in self._graph:
-                return NmNode(self._anm, self._overlay_id, key)
+                return cached_handle(NmNode, self._anm, self._overlay_id, key)
 
             # doesn't have node_id, likely a label string, search based on this
             # label
@@ -348,7 +350,19 @@ class OverlayBase(AnkElement):
 
         """
 
-        result = list(NmNode(self._anm, self._overlay_id, node)
+        if len(kwargs):
+            # equality filters from the attribute index if possible
+            node_ids = node_index.filter_node_ids(self._anm, self._overlay_id,
+                                                  self._graph, kwargs,
+                                                  self._node_attr_equals)
+            if node_ids is not None:
+                result = [cached_handle(NmNode, self._anm, self._overlay_id,
+                                        node) for node in node_ids]
+                if len(args):
+                    result = self.filter(result, *args)
+                return result
+
+        result = list(cached_handle(NmNode, self._anm, self._overlay_id, node)
                       for node in self._graph)
 
         if len(args) or len(kwargs):
@@ -441,17 +455,35 @@ class OverlayBase(AnkElement):
         """"""
 
         if nbunch is None:
-            nbunch = self.nodes()
+            return self.nodes(*args, **kwargs)
+
+        index = None
+        if len(kwargs):
+            index = node_index.get_index(self._anm, self._overlay_id,
+                                         self._graph)
+
+        def get_value(node, key):
+            """From the attribute index if the node is from this overlay"""
+            if (index is not None and key in index.values
+                    and getattr(node, 'overlay_id', None) == self._overlay_id):
+                value = index.values[key].get(node.node_id, node_index.MISSING)
+                if value is not node_index.MISSING:
+                    return value
+            return getattr(node, key)
 
         def filter_func(node):
             """Filter based on args and kwargs"""
 
             return all(getattr(node, key) for key in args) \
-                and all(getattr(node, key) == val for (key, val) in
+                and all(get_value(node, key) == val for (key, val) in
                         kwargs.items())
 
         return [n for n in nbunch if filter_func(n)]
 
+    def _node_attr_equals(self, node_id, key, val):
+        node = cached_handle(NmNode, self._anm, self._overlay_id, node_id)
+        return getattr(node, key) == val
+
     def edges(self, src_nbunch=None, dst_nbunch=None, *args,
               **kwargs):
         """
@@ -505,13 +537,15 @@ class OverlayBase(AnkElement):
                                valid_edges if dst in dst_nbunch)
 
         if len(args) or len(kwargs):
-            all_edges = [NmEdge(self._anm, self._overlay_id, src, dst,
-                                key) for (src, dst, key) in valid_edges]
+            all_edges = [cached_handle(NmEdge, self._anm, self._overlay_id,
+                                       src, dst, key)
+                         for (src, dst, key) in valid_edges]
             result = list(edge for edge in all_edges
                           if filter_func(edge))
         else:
-            result = list(NmEdge(self._anm, self._overlay_id, src, dst,
-                                 key) for (src, dst, key) in valid_edges)
+            result = list(cached_handle(NmEdge, self._anm, self._overlay_id,
+                                        src, dst, key)
+                          for (src, dst, key) in valid_edges)
 
         return list(result)
 
@@ -7,7 +7,7 @@ from autonetkit.anm.interface import NmPort
 from autonetkit.anm.node import NmNode
 from autonetkit.log import CustomAdapter
 
-from autonetkit.anm.ank_element import AnkElement
+from autonetkit.anm.ank_element import AnkElement, cached_handle
 
 @total_ordering
 class NmEdge(AnkElement):
@@ -211,7 +211,7 @@ class NmEdge(AnkElement):
 
         """
 
-        return NmNode(self.anm, self.overlay_id, self.src_id)
+        return cached_handle(NmNode, self.anm, self.overlay_id, self.src_id)
 
     @property
     def dst(self):
@@ -224,7 +224,7 @@ class NmEdge(AnkElement):
 
         """
 
-        return NmNode(self.anm, self.overlay_id, self.dst_id)
+        return cached_handle(NmNode, self.anm, self.overlay_id, self.dst_id)
 
     # Interfaces
 
@@ -258,8 +258,8 @@ class NmEdge(AnkElement):
         """
 
         src_int_id = self._ports[self.src_id]
-        return NmPort(self.anm, self.overlay_id,
-                      self.src_id, src_int_id)
+        return cached_handle(NmPort, self.anm, self.overlay_id,
+                             self.src_id, src_int_id)
 
     @property
     def dst_int(self):
@@ -273,8 +273,8 @@ class NmEdge(AnkElement):
         """
 
         dst_int_id = self._ports[self.dst_id]
-        return NmPort(self.anm, self.overlay_id,
-                      self.dst_id, dst_int_id)
+        return cached_handle(NmPort, self.anm, self.overlay_id,
+                             self.dst_id, dst_int_id)
 
     def bind_interface(self, node, interface):
         """Bind this edge to specified index"""
@@ -293,9 +293,9 @@ class NmEdge(AnkElement):
 
         # TODO: warn if interface doesn't exist on node
 
-        return [NmPort(self.anm, self.overlay_id,
-                       node_id, interface_id) for (node_id,
-                                                   interface_id) in self._ports.items()]
+        return [cached_handle(NmPort, self.anm, self.overlay_id,
+                              node_id, interface_id) for (node_id,
+                                                          interface_id) in self._ports.items()]
 
     #
 
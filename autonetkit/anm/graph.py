@@ -1,3 +1,6 @@
+import threading
+
+from autonetkit.anm import node_index
 import autonetkit.log as log
 from autonetkit.ank_utils import unwrap_edges, unwrap_nodes
 from autonetkit.anm.base import OverlayBase
@@ -6,6 +9,9 @@ from autonetkit.anm.interface import NmPort
 from autonetkit.anm.node import NmNode
 import autonetkit
 
+# design stages can be applied concurrently, and all record dependencies
+_dependencies_lock = threading.RLock()
+
 
 class NmGraph(OverlayBase):
 
@@ -40,15 +46,16 @@ class NmGraph(OverlayBase):
         # TODO: make this able to be disabled for performance
         g_deps = self.anm['_dependencies']
         overlays = {n.overlay_id for n in nbunch if isinstance(n, NmNode)}
-        if len(overlays) and self._overlay_id not in g_deps:
-            g_deps.add_node(self._overlay_id)
-        for overlay_id in overlays:
-            if overlay_id not in g_deps:
-                g_deps.add_node(overlay_id)
+        with _dependencies_lock:
+            if len(overlays) and self._overlay_id not in g_deps:
+                g_deps.add_node(self._overlay_id)
+            for overlay_id in overlays:
+                if overlay_id not in g_deps:
+                    g_deps.add_node(overlay_id)
 
-            if g_deps.number_of_edges(self._overlay_id, overlay_id) == 0:
-                edge = (overlay_id, self._overlay_id)
-                g_deps.add_edges_from([edge])
+                if g_deps.number_of_edges(self._overlay_id, overlay_id) == 0:
+                    edge = (overlay_id, self._overlay_id)
+                    g_deps.add_edges_from([edge])
 
     def add_nodes_from( self, nbunch, retain=None, update=False,
         **kwargs):
@@ -87,6 +94,7 @@ class NmGraph(OverlayBase):
                 pass  # use nbunch directly as the node IDs
 
         self._graph.add_nodes_from(nbunch, **kwargs)
+        node_index.drop(self.anm, self._overlay_id)
         for node in self._graph.nodes():
             node_data = self._graph.node[node]
             if "label" not in node_data:
@@ -234,6 +242,7 @@ class NmGraph(OverlayBase):
             pass  # don't need to unwrap
 
         self._graph.remove_nodes_from(nbunch)
+        node_index.drop(self.anm, self._overlay_id)
 
     def remove_node(self, node_id):
         """Removes a node from the overlay"""
@@ -241,6 +250,7 @@ class NmGraph(OverlayBase):
             node_id = node_id.node_id
 
         self._graph.remove_node(node_id)
+        node_index.drop(self.anm, self._overlay_id)
 
     def add_edge(self, src, dst, retain=None, **kwargs):
         """Adds an edge to the overlay"""
@@ -2,7 +2,8 @@ import logging
 
 import autonetkit.log as log
 from autonetkit.log import CustomAdapter
-from autonetkit.anm.ank_element import AnkElement
+from autonetkit.anm import interface_index
+from autonetkit.anm.ank_element import AnkElement, cached_handle
 
 
 class NmPort(AnkElement):
@@ -137,7 +138,8 @@ class NmPort(AnkElement):
     def phy(self):
         if self.overlay_id == 'phy':
             return self
-        return NmPort(self.anm, 'phy', self.node_id, self.interface_id)
+        return cached_handle(NmPort, self.anm, 'phy', self.node_id,
+                             self.interface_id)
 
     def __getitem__(self, overlay_id):
         """Returns corresponding interface in specified overlay"""
@@ -153,8 +155,8 @@ class NmPort(AnkElement):
             return None
 
         try:
-            return NmPort(self.anm, overlay_id,
-                          self.node_id, self.interface_id)
+            return cached_handle(NmPort, self.anm, overlay_id,
+                                 self.node_id, self.interface_id)
         except KeyError:
             return
 
@@ -217,7 +219,7 @@ class NmPort(AnkElement):
         """Returns parent node of this interface"""
 
         from autonetkit.anm.node import NmNode
-        return NmNode(self.anm, self.overlay_id, self.node_id)
+        return cached_handle(NmNode, self.anm, self.overlay_id, self.node_id)
 
     def dump(self):
         return str(self._interface.items())
@@ -243,6 +245,9 @@ class NmPort(AnkElement):
             self._interface[key] = val
         except KeyError, e:
             log.warning(e)
+        else:
+            if key in interface_index.INDEXED_ATTRIBUTES:
+                interface_index.drop(self.anm, self.node_id)
 
             # self.set(key, val)
 
@@ -0,0 +1,130 @@
+"""Per-node lookup tables on interface attributes, so that
+node.interface("GigabitEthernet0/1") and node.physical_interfaces() only
+create and check NmPort objects for the matching ports, rather than for every
+port on the node.
+
+Tables are kept for the id, description and category of a node's ports in
+an overlay, and built for each attribute on the first query. The values are
+read through NmPort, and so include the fall-through to the phy overlay, eg
+for the category of ports in other overlays.
+
+A node's tables are rebuilt if the port dict of the node (or of the node in
+phy) is replaced or changes size, eg from add_interface or add_loopback, and
+are dropped if one of the indexed attributes is set through NmPort.
+Ports returned from the tables are still checked against the filters, so
+tables that are out of date only omit ports, such as for values written
+directly into raw_interfaces.
+"""
+
+INDEXED_ATTRIBUTES = ("id", "description", "category")
+
+
+class InterfaceIndex(object):
+
+    """Maps values of the indexed attributes to interface ids for a node"""
+
+    def __init__(self, ports, phy_ports):
+        self.ports = ports
+        self.size = len(ports)
+        self.phy_ports = phy_ports
+        self.phy_size = len(phy_ports) if phy_ports is not None else None
+        self.tables = {}
+
+    def is_current(self, ports, phy_ports):
+        return (ports is self.ports and len(ports) == self.size
+                and phy_ports is self.phy_ports
+                and (phy_ports is None or len(phy_ports) == self.phy_size))
+
+    def table(self, node, attribute):
+        """Returns {value: [interface ids]} for attribute, in port order,
+        or None if a value can't be looked up"""
+        try:
+            return self.tables[attribute]
+        except KeyError:
+            pass
+
+        from autonetkit.anm.ank_element import cached_handle
+        from autonetkit.anm.interface import NmPort
+        table = {}
+        for interface_id in self.ports.keys():
+            port = cached_handle(NmPort, node.anm, node.overlay_id,
+                                 node.node_id, interface_id)
+            try:
+                table.setdefault(getattr(port, attribute),
+                                 []).append(interface_id)
+            except TypeError:
+                table = None  # unhashable
+                break
+
+        self.tables[attribute] = table
+        return table
+
+
+def _phy_ports(anm, overlay_id, node_id):
+    if overlay_id == "phy":
+        return None
+    try:
+        return anm.overlay_nx_graphs['phy'].node[node_id].get('_ports')
+    except KeyError:
+        return None  # no phy overlay, or node not in phy
+
+
+def get_index(node):
+    """Returns the index for node, building if needed, or None if indexes
+    are disabled or the node has no port dict"""
+    indexes = getattr(node.anm, '_interface_indexes', None)
+    if indexes is None:
+        return None
+
+    try:
+        ports = node._graph.node[node.node_id]['_ports']
+    except KeyError:
+        return None
+    if not isinstance(ports, dict):
+        return None
+
+    phy_ports = _phy_ports(node.anm, node.overlay_id, node.node_id)
+    node_indexes = indexes.setdefault(node.node_id, {})
+    index = node_indexes.get(node.overlay_id)
+    if index is None or not index.is_current(ports, phy_ports):
+        index = node_indexes[node.overlay_id] = InterfaceIndex(ports,
+                                                               phy_ports)
+    return index
+
+
+def drop(anm, node_id):
+    """Drops the indexes for node_id in all overlays, as attributes set on
+    the ports in phy are read by the other overlays"""
+    indexes = getattr(anm, '_interface_indexes', None)
+    if indexes:
+        indexes.pop(node_id, None)
+
+
+def filter_interface_ids(node, kwargs):
+    """Returns the ids, in port order, of the ports of node that may match
+    the equality filters in kwargs, or None if the index can't be used for
+    these filters"""
+    attributes = [attr for attr in kwargs if attr in INDEXED_ATTRIBUTES]
+    if not attributes:
+        return None
+
+    index = get_index(node)
+    if index is None:
+        return None
+
+    result = None
+    for attribute in attributes:
+        table = index.table(node, attribute)
+        if table is None:
+            return None
+        try:
+            matches = table.get(kwargs[attribute], [])
+        except TypeError:
+            return None  # unhashable filter value
+        if result is None:
+            result = matches
+        else:
+            result = [interface_id for interface_id in result
+                      if interface_id in matches]
+
+    return list(result)
@@ -0,0 +1,109 @@
+"""Overlay graphs of a restored NetworkModel, each restored from the saved
+version on first access, eg through anm['ospf'], rather than all at once.
+
+Used as NetworkModel._overlays by restore(lazy=True). Listing the overlays,
+eg anm.overlays() or 'ospf' in anm, doesn't restore them. Iterating over
+the graphs, eg items() or values(), restores all of them.
+"""
+
+
+class LazyOverlays(dict):
+
+    """{overlay_id: graph}, with the graphs of pending overlay ids
+    returned by loader(overlay_id) on first access"""
+
+    def __init__(self, loader, overlay_ids, loaded=None):
+        dict.__init__(self)
+        self._loader = loader
+        self._pending = set(overlay_ids)
+        for overlay_id, graph in (loaded or {}).items():
+            if overlay_id not in self._pending:
+                dict.__setitem__(self, overlay_id, graph)
+
+    @property
+    def pending(self):
+        """Overlay ids not yet restored"""
+        return sorted(self._pending)
+
+    def _load(self, overlay_id):
+        if overlay_id in self._pending:
+            graph = self._loader(overlay_id)
+            self._pending.discard(overlay_id)
+            dict.__setitem__(self, overlay_id, graph)
+
+    def _load_all(self):
+        for overlay_id in sorted(self._pending):
+            self._load(overlay_id)
+
+    def __missing__(self, overlay_id):
+        if overlay_id not in self._pending:
+            raise KeyError(overlay_id)
+        self._load(overlay_id)
+        return dict.__getitem__(self, overlay_id)
+
+    def get(self, overlay_id, default=None):
+        self._load(overlay_id)
+        return dict.get(self, overlay_id, default)
+
+    def __contains__(self, overlay_id):
+        return overlay_id in self._pending or dict.__contains__(self,
+                                                                overlay_id)
+
+    has_key = __contains__
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._pending)
+
+    def keys(self):
+        return dict.keys(self) + sorted(self._pending)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    iterkeys = __iter__
+
+    def __setitem__(self, overlay_id, graph):
+        self._pending.discard(overlay_id)
+        dict.__setitem__(self, overlay_id, graph)
+
+    def __delitem__(self, overlay_id):
+        if overlay_id in self._pending:
+            self._pending.discard(overlay_id)
+        else:
+            dict.__delitem__(self, overlay_id)
+
+    def pop(self, overlay_id, *default):
+        self._load(overlay_id)
+        return dict.pop(self, overlay_id, *default)
+
+    def update(self, *args, **kwargs):
+        for overlay_id, graph in dict(*args, **kwargs).items():
+            self[overlay_id] = graph
+
+    def setdefault(self, overlay_id, default=None):
+        if overlay_id not in self:
+            self[overlay_id] = default
+        return self[overlay_id]
+
+    def values(self):
+        self._load_all()
+        return dict.values(self)
+
+    def items(self):
+        self._load_all()
+        return dict.items(self)
+
+    def itervalues(self):
+        self._load_all()
+        return dict.itervalues(self)
+
+    def iteritems(self):
+        self._load_all()
+        return dict.iteritems(self)
+
+    def copy(self):
+        self._load_all()
+        return dict(dict.items(self))
+
+    def __repr__(self):
+        return "LazyOverlays(%s)" % sorted(self.keys())
@@ -6,6 +6,7 @@ import autonetkit.log as log
 import networkx as nx
 from autonetkit.anm.graph import NmGraph
 from autonetkit.anm.ank_element import AnkElement
+from autonetkit.anm.lazy_overlays import LazyOverlays
 
 
 class NetworkModel(AnkElement):
@@ -17,6 +18,10 @@ class NetworkModel(AnkElement):
 
         self.all_multigraph = all_multigraph
         self._overlays = {}
+        # NmNode, NmEdge and NmPort handles, see cached_handle
+        self._handles = {}
+        self._node_indexes = {}  # see autonetkit.anm.node_index
+        self._interface_indexes = {}  # see autonetkit.anm.interface_index
         self.add_overlay('input')
         self.add_overlay('phy')
         self.add_overlay('graphics')
@@ -64,6 +69,7 @@ class NetworkModel(AnkElement):
 
         # TODO: take optional filename as parameter
 
+        import autonetkit.ank_archive as ank_archive
         import autonetkit.ank_json as ank_json
         import os
         import gzip
@@ -71,6 +77,13 @@ class NetworkModel(AnkElement):
         if not os.path.isdir(archive_dir):
             os.makedirs(archive_dir)
 
+        if ank_archive.binary_format():
+            archive_file = 'anm_%s%s' % (self.timestamp,
+                                         ank_archive.EXTENSION)
+            ank_archive.save(os.path.join(archive_dir, archive_file),
+                             sorted(self._overlays.items()))
+            return
+
         data = ank_json.jsonify_anm(self)
         json_file = 'anm_%s.json.gz' % self.timestamp
         json_path = os.path.join(archive_dir, json_file)
@@ -78,17 +91,15 @@ class NetworkModel(AnkElement):
         with gzip.open(json_path, 'wb') as json_fh:
             json_fh.write(data)
 
-    def restore_latest(self, directory=None):
-        """Restores latest saved ANM"""
+    def restore_latest(self, directory=None, lazy=False):
+        """Restores latest saved ANM, see restore"""
 
         import os
-        import glob
+        import autonetkit.ank_archive as ank_archive
         if not directory:
             directory = os.path.join('versions', 'anm')
 
-        glob_dir = os.path.join(directory, '*.json.gz')
-        pickle_files = glob.glob(glob_dir)
-        pickle_files = sorted(pickle_files)
+        pickle_files = ank_archive.saved_files(directory)
         try:
             latest_file = pickle_files[-1]
         except IndexError:
@@ -97,23 +108,40 @@ class NetworkModel(AnkElement):
 
             log.warning('No previous ANM saved. Please compile new ANM')
             return
-        self.restore(latest_file)
+        self.restore(latest_file, lazy=lazy)
 
-    def restore(self, pickle_file):
-        """"""
+    def restore(self, pickle_file, overlay_ids=None, lazy=False):
+        """Restores the overlays saved to pickle_file, or only those in
+        overlay_ids if set. If lazy, each overlay is restored on first
+        access, see LazyOverlays. A binary archive is read by overlay,
+        a JSON archive is read once, and each overlay decoded"""
 
         import json
         import gzip
+        import autonetkit.ank_archive as ank_archive
         import autonetkit.ank_json as ank_json
-        log.debug('Restoring %s' % pickle_file)
-        with gzip.open(pickle_file, 'r') as filehandle:
-            data = json.load(filehandle)
-            for (overlay_id, graph_data) in data.items():
-
-                self._overlays[overlay_id] = \
-                    ank_json.ank_json_loads(graph_data)
-
-        ank_json.rebind_interfaces(self)
+        if ank_archive.is_archive(pickle_file):
+            # port ids are saved as integers, so needn't be rebound
+            saved_ids, loader = ank_archive.section_loader(pickle_file)
+        else:
+            log.debug('Restoring %s' % pickle_file)
+            with gzip.open(pickle_file, 'r') as filehandle:
+                data = json.load(filehandle)
+            saved_ids = sorted(data)
+
+            def loader(overlay_id):
+                graph = ank_json.ank_json_loads(data[overlay_id])
+                ank_json.rebind_graph_interfaces(graph)
+                return graph
+
+        if overlay_ids is None:
+            overlay_ids = saved_ids
+        if lazy:
+            self._overlays = LazyOverlays(loader, overlay_ids,
+                                          loaded=self._overlays)
+        else:
+            for overlay_id in overlay_ids:
+                self._overlays[overlay_id] = loader(overlay_id)
 
     def restore_from_json(self, in_data):
         import json
@@ -3,10 +3,12 @@ import logging
 from functools import total_ordering
 
 import autonetkit
+from autonetkit.anm import interface_index
+from autonetkit.anm import node_index
 import autonetkit.log as log
 from autonetkit.anm.interface import NmPort
 from autonetkit.log import CustomAdapter
-from autonetkit.anm.ank_element import AnkElement
+from autonetkit.anm.ank_element import AnkElement, cached_handle
 
 
 
@@ -130,7 +132,8 @@ class NmNode(AnkElement):
         # TODO: initialise id for loopback zero?
         # TODO: Set category for loopback zero to be "loopback"
 
-        return (i for i in self.interfaces('is_loopback_zero')).next()
+        return (i for i in self.interfaces('is_loopback_zero',
+                                           category='loopback')).next()
 
     def physical_interfaces(self, *args, **kwargs):
         """"""
@@ -295,10 +298,15 @@ class NmNode(AnkElement):
                 and all(getattr(interface, key) == val for (key,
                                                             val) in kwargs.items())
 
-        all_interfaces = iter(NmPort(self.anm,
-                                     self.overlay_id, self.node_id,
-                                     interface_id) for interface_id in
-                              self._interface_ids())
+        # only check ports that match the indexed filters, eg category
+        interface_ids = interface_index.filter_interface_ids(self, kwargs)
+        if interface_ids is None:
+            interface_ids = self._interface_ids()
+
+        all_interfaces = iter(cached_handle(NmPort, self.anm,
+                                            self.overlay_id, self.node_id,
+                                            interface_id) for interface_id in
+                              interface_ids)
 
         retval = [i for i in all_interfaces if filter_func(i)]
         return retval
@@ -308,16 +316,16 @@ class NmNode(AnkElement):
 
         try:
             if key.interface_id in self._interface_ids():
-                return NmPort(self.anm, self.overlay_id,
-                              self.node_id, key.interface_id)
+                return cached_handle(NmPort, self.anm, self.overlay_id,
+                                     self.node_id, key.interface_id)
         except AttributeError:
 
             # try with key as id
 
             try:
                 if key in self._interface_ids():
-                    return NmPort(self.anm, self.overlay_id,
-                                  self.node_id, key)
+                    return cached_handle(NmPort, self.anm, self.overlay_id,
+                                         self.node_id, key)
             except AttributeError:
 
                 # no match for either
@@ -482,7 +490,7 @@ class NmNode(AnkElement):
     def __getitem__(self, key):
         """Get item key"""
 
-        return NmNode(self.anm, key, self.node_id)
+        return cached_handle(NmNode, self.anm, key, self.node_id)
 
     @property
     def raw_interfaces(self):
@@ -547,6 +555,10 @@ class NmNode(AnkElement):
             # set ASN directly on the node, eg for collision domains
 
             self._graph.node[self.node_id]['asn'] = value
+            node_index.set_value(self.anm, self.overlay_id, self.node_id,
+                                 'asn', value)
+        else:
+            node_index.set_value(self.anm, 'phy', self.node_id, 'asn', value)
 
     @property
     def id(self):
@@ -599,7 +611,7 @@ class NmNode(AnkElement):
 
         """
 
-        neighs = list(NmNode(self.anm, self.overlay_id, node)
+        neighs = list(cached_handle(NmNode, self.anm, self.overlay_id, node)
                       for node in self._graph.neighbors(self.node_id))
 
         return self._overlay.filter(neighs, *args, **kwargs)
@@ -739,7 +751,11 @@ class NmNode(AnkElement):
             self._graph.node[self.node_id][key] = val
         except KeyError:
             self._graph.add_node(self.node_id)
+            node_index.drop(self.anm, self.overlay_id)
             self.set(key, val)
+        else:
+            node_index.set_value(self.anm, self.overlay_id, self.node_id,
+                                 key, val)
 
     def set(self, key, val):
         """For consistency, node.set(key, value) is neater
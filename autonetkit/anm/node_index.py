@@ -0,0 +1,163 @@
+"""Secondary indexes on node attributes, so that equality filters such as
+g_phy.nodes(asn=1, device_type="router") are answered by dictionary lookups,
+rather than a NmNode and __getattr__ call for every node in the overlay.
+
+The attributes indexed are set by indexed_node_attributes in the General
+config section. The index for an overlay is built on the first query,
+and kept up to date by NmNode.__setattr__ (and so NmGraph.update),
+ank.set_node_default and ank.copy_attr_from. Adding or removing nodes
+through NmGraph drops the index for the overlay, to be rebuilt on the next
+query, as does replacing the overlay graph.
+
+Only values set on the node in the overlay itself are indexed. Nodes without
+the attribute are resolved from the phy index for attributes that NmNode
+falls through to phy for (eg device_type), and otherwise checked using the
+NmNode as before, as are nodes with an unhashable value.
+"""
+
+import autonetkit.config
+
+MISSING = object()
+
+# read by NmNode from the phy overlay if not set on the node
+PHY_FALLTHROUGH = ("asn", "device_type", "device_subtype")
+
+
+def _indexable(attribute):
+    from autonetkit.anm.node import NmNode
+    # properties such as label don't map to the node data
+    # asn is a property, but is read from the node data if set
+    return attribute == "asn" or not hasattr(NmNode, attribute)
+
+
+class NodeIndex(object):
+
+    """Maps values of the indexed attributes to node ids for an overlay graph"""
+
+    def __init__(self, graph, attributes):
+        self.graph = graph
+        self.order = {}  # position of node in graph, to keep result order
+        self.values = dict((attr, {}) for attr in attributes)
+        self.by_value = dict((attr, {}) for attr in attributes)
+        self.unresolved = dict((attr, set()) for attr in attributes)
+
+        for position, (node_id, data) in enumerate(graph.nodes(data=True)):
+            self.order[node_id] = position
+            for attribute in attributes:
+                self._add(attribute, node_id, data.get(attribute, MISSING))
+
+    def _add(self, attribute, node_id, value):
+        self.values[attribute][node_id] = value
+        if value is MISSING:
+            self.unresolved[attribute].add(node_id)
+            return
+        try:
+            self.by_value[attribute].setdefault(value, set()).add(node_id)
+        except TypeError:
+            self.unresolved[attribute].add(node_id)  # unhashable
+
+    def _remove(self, attribute, node_id):
+        value = self.values[attribute].pop(node_id, MISSING)
+        self.unresolved[attribute].discard(node_id)
+        try:
+            self.by_value[attribute].get(value, set()).discard(node_id)
+        except TypeError:
+            pass  # unhashable, was unresolved
+
+    def set(self, node_id, attribute, value):
+        if attribute not in self.values or node_id not in self.order:
+            return
+        self._remove(attribute, node_id)
+        self._add(attribute, node_id, value)
+
+    def lookup(self, attribute, value):
+        """Returns (node ids with attribute == value, node ids to check),
+        or None if value can't be looked up"""
+        try:
+            matches = self.by_value[attribute].get(value, set())
+        except TypeError:
+            return None
+        return matches, self.unresolved[attribute]
+
+
+def indexed_attributes():
+    return [attr for attr in
+            autonetkit.config.settings['General']['indexed_node_attributes']
+            if _indexable(attr)]
+
+
+def get_index(anm, overlay_id, graph):
+    """Returns the index for overlay_id, building if needed, or None if
+    indexes are disabled or graph isn't the overlay graph, eg a subgraph"""
+    indexes = getattr(anm, '_node_indexes', None)
+    if indexes is None:
+        return None
+    if graph is not anm.overlay_nx_graphs.get(overlay_id):
+        return None
+
+    index = indexes.get(overlay_id)
+    if index is None or index.graph is not graph:
+        attributes = indexed_attributes()
+        if not attributes:
+            return None
+        index = indexes[overlay_id] = NodeIndex(graph, attributes)
+    return index
+
+
+def set_value(anm, overlay_id, node_id, attribute, value):
+    """Updates the index for overlay_id, if built, when a node attribute
+    is set"""
+    indexes = getattr(anm, '_node_indexes', None)
+    if not indexes:
+        return
+    index = indexes.get(overlay_id)
+    if index is not None:
+        index.set(node_id, attribute, value)
+
+
+def drop(anm, overlay_id):
+    """Drops the index for overlay_id, eg if nodes added or removed"""
+    indexes = getattr(anm, '_node_indexes', None)
+    if indexes:
+        indexes.pop(overlay_id, None)
+
+
+def filter_node_ids(anm, overlay_id, graph, kwargs, check):
+    """Returns the ids, in graph order, of nodes matching the equality
+    filters in kwargs, using check(node_id, attribute, value) for nodes that
+    can't be resolved from the index. Returns None if the index can't be used
+    for these filters"""
+    index = get_index(anm, overlay_id, graph)
+    if index is None:
+        return None
+    if any(attribute not in index.values for attribute in kwargs):
+        return None
+
+    phy_index = None
+    if overlay_id != "phy":
+        phy_index = get_index(anm, "phy", anm.overlay_nx_graphs.get("phy"))
+
+    def resolve(node_id, attribute, value):
+        if (phy_index is not None and attribute in PHY_FALLTHROUGH
+                and attribute in phy_index.values):
+            phy_value = phy_index.values[attribute].get(node_id, MISSING)
+            if phy_value is not MISSING:
+                return phy_value == value
+        return check(node_id, attribute, value)
+
+    result = None
+    for attribute, value in kwargs.items():
+        lookup = index.lookup(attribute, value)
+        if lookup is None:
+            return None
+        matches, unresolved = lookup
+        candidates = set(matches)
+        candidates.update(node_id for node_id in unresolved
+                          if (result is None or node_id in result)
+                          and resolve(node_id, attribute, value))
+        if result is None:
+            result = candidates
+        else:
+            result &= candidates
+
+    return sorted(result, key=index.order.get)
@@ -0,0 +1,47 @@
+import autonetkit
+
+
+def filtered(node, **kwargs):
+    """Filters without the interface index"""
+    return [i for i in (node.interface(interface_id)
+                        for interface_id in node._interface_ids())
+            if all(getattr(i, key) == val for key, val in kwargs.items())]
+
+
+def test():
+    anm = autonetkit.topos.house()
+    g_phy = anm['phy']
+    g_test = anm.add_overlay("test")
+    g_test.add_nodes_from(g_phy, retain=["label"])
+
+    r1 = g_phy.node("r1")
+    assert(r1.physical_interfaces() == filtered(r1, category="physical"))
+    assert(r1.loopback_interfaces() == filtered(r1, category="loopback"))
+
+    # category falls through to phy
+    test_r1 = g_test.node("r1")
+    assert(test_r1.physical_interfaces()
+           == filtered(test_r1, category="physical"))
+
+    # tables updated for new ports, and attributes set on ports
+    eth2 = r1.add_interface("eth2")
+    assert(eth2 in r1.physical_interfaces())
+    assert(r1.interface("eth2") == eth2)
+    eth2.id = "GigabitEthernet0/2"
+    assert(r1.interface("GigabitEthernet0/2") == eth2)
+    eth2.category = "loopback"
+    assert(eth2 not in r1.physical_interfaces())
+
+    # as are the tables for other overlays, which fall through to phy
+    eth0 = r1.interface("eth0")
+    assert(test_r1.interface("GigabitEthernet0/0") is None)
+    eth0.id = "GigabitEthernet0/0"
+    assert(test_r1.interface("GigabitEthernet0/0") == eth0)
+    eth0.category = "loopback"
+    assert(eth0 in test_r1.loopback_interfaces())
+
+    test_r2 = g_test.node("r2")
+    lo1 = test_r2.add_loopback(description="lo1")
+    assert(lo1 in test_r2.loopback_interfaces())
+    assert(r1.loopback_zero.interface_id == 0)
+    assert(r1.interface("missing") is None)
@@ -0,0 +1,46 @@
+import autonetkit
+import autonetkit.ank as ank_utils
+
+
+def filtered(g_overlay, **kwargs):
+    """Filters without the attribute index"""
+    return [n for n in g_overlay._graph
+            if all(getattr(g_overlay.node(n), key) == val
+                   for key, val in kwargs.items())]
+
+
+def test():
+    anm = autonetkit.topos.multi_as()
+    g_phy = anm['phy']
+
+    assert(g_phy.nodes(asn=1) == filtered(g_phy, asn=1))
+    assert(g_phy.nodes(asn=1, ibgp_role="RR")
+           == filtered(g_phy, asn=1, ibgp_role="RR"))
+
+    # index kept up to date by setting attributes
+    r1 = g_phy.node("r1")
+    r1.asn = 3
+    assert(r1 in g_phy.nodes(asn=3))
+    assert(r1 not in g_phy.nodes(asn=1))
+
+    g_phy.update(["r2"], platform="junosphere")
+    assert(g_phy.nodes(platform="junosphere") == ["r2"])
+
+    ank_utils.set_node_default(g_phy, igp="isis")
+    assert(g_phy.nodes(igp="isis") == filtered(g_phy, igp="isis"))
+
+    g_test = anm.add_overlay("test")
+    g_test.add_nodes_from(g_phy)
+    ank_utils.copy_attr_from(g_phy, g_test, "host")
+    assert(g_test.nodes(host="internal") == filtered(g_phy, host="internal"))
+
+    # falls through to phy for attributes not set in the overlay
+    assert(g_test.nodes(device_type="router")
+           == filtered(g_test, device_type="router"))
+
+    g_test.remove_node("r2")
+    assert("r2" not in g_test.nodes(host="internal"))
+
+    neighbors = g_phy.node("r2").neighbors(asn=1)
+    assert(neighbors == [n for n in g_phy.node("r2").neighbors()
+                         if n.asn == 1])
@@ -1,8 +1,12 @@
 """Module to build overlay graphs for network design"""
 
+import copy
+
 import autonetkit
 import autonetkit.ank as ank_utils
+import autonetkit.ank_profile as ank_profile
 import autonetkit.anm
+import autonetkit.anm.node_index as node_index
 import autonetkit.config
 import autonetkit.exception
 import autonetkit.log as log
@@ -147,45 +151,20 @@ def check_server_asns(anm):
                              "not auto-correcting", server, server.asn)
 
 
-def apply_design_rules(anm):
-    """Applies appropriate design rules to ANM"""
-    # log.info("Building overlay topologies")
-    g_in = anm['input']
-
-    build_phy(anm)
-
+def _cisco_build_network():
+    """Returns the autonetkit_cisco build_network module if available"""
     try:
         from autonetkit_cisco import build_network as cisco_build_network
-    except ImportError, e:
-        log.debug("Unable to load autonetkit_cisco %s", e)
-    else:
-        cisco_build_network.post_phy(anm)
-
-    g_phy = anm['phy']
-    from autonetkit.design.osi_layers import build_layer1, build_layer2, build_layer3
-    # log.info("Building layer2")
-    build_layer1(anm)
-    build_layer2(anm)
-
-    from autonetkit.design.lag import build_lag
-    build_lag(anm)
-
-    from autonetkit.design.mct import build_mct
-    build_mct(anm)
-    # autonetkit.update_http(anm)
-
-    # log.info("Building layer3")
-    build_layer3(anm)
-
-    check_server_asns(anm)
+    except ImportError, error:
+        log.debug("Unable to load autonetkit_cisco %s", error)
+        return None
+    return cisco_build_network
 
-    from autonetkit.design.mpls import build_vrf
-    build_vrf(anm)  # do before to add loopbacks before ip allocations
-    from autonetkit.design.ip import build_ip, build_ipv4, build_ipv6
-    # TODO: replace this with layer2 overlay topology creation
-    # log.info("Allocating IP addresses")
-    build_ip(anm)  # ip infrastructure topology
 
+def allocate_ipv4(anm):
+    """Builds the IPv4 overlay for the address family of the input graph"""
+    g_in = anm['input']
+    g_phy = anm['phy']
     address_family = g_in.data.address_family or "v4"  # default is v4
 # TODO: can remove the infrastructure now create g_ip seperately
     if address_family == "None":
@@ -193,6 +172,7 @@ def apply_design_rules(anm):
                  "configuration")
         anm['phy'].data.enable_routing = False
 
+    from autonetkit.design.ip import build_ipv4
     if address_family == "None":
         log.info("IP addressing disabled, skipping IPv4")
         anm.add_overlay("ipv4")  # create empty so rest of code follows
@@ -205,6 +185,14 @@ def apply_design_rules(anm):
         build_ipv4(anm, infrastructure=False)
         g_phy.update(g_phy, use_ipv4=False)
 
+
+def allocate_ipv6(anm):
+    """Builds the IPv6 overlay for the address family of the input graph"""
+    g_in = anm['input']
+    g_phy = anm['phy']
+    address_family = g_in.data.address_family or "v4"  # default is v4
+
+    from autonetkit.design.ip import build_ipv6
     # TODO: Create collision domain overlay for ip addressing - l2 overlay?
     if address_family == "None":
         log.info("IP addressing disabled, not allocating IPv6")
@@ -216,67 +204,318 @@ def apply_design_rules(anm):
     else:
         anm.add_overlay("ipv6")  # placeholder for compiler logic
 
+
+def set_igp_defaults(anm):
+    """Sets the default IGP on input nodes, and copies to phy"""
+    g_in = anm['input']
+    g_phy = anm['phy']
     default_igp = g_in.data.igp or "ospf"
     ank_utils.set_node_default(g_in, igp=default_igp)
     ank_utils.copy_attr_from(g_in, g_phy, "igp")
 
     ank_utils.copy_attr_from(g_in, g_phy, "include_csr")
 
-    try:
-        from autonetkit_cisco import build_network as cisco_build_network
-    except ImportError, error:
-        log.debug("Unable to load autonetkit_cisco %s" % error)
-    else:
-        cisco_build_network.pre_design(anm)
 
-    # log.info("Building IGP")
-    from autonetkit.design.igp import build_igp
-    build_igp(anm)
+def _if_routing_enabled(func):
+    """Only applies func if routing is enabled on the physical overlay"""
+    def wrapped(anm):
+        if anm['phy'].data.enable_routing:
+            func(anm)
+    return wrapped
 
-    # log.info("Building BGP")
-    from autonetkit.design.bgp import build_bgp
-    build_bgp(anm)
-    # autonetkit.update_vis(anm)
-
-    from autonetkit.design.mpls import mpls_te, mpls_oam
-    mpls_te(anm)
-    mpls_oam(anm)
-
-# post-processing
-    if anm['phy'].data.enable_routing:
-        from autonetkit.design.mpls import (mark_ebgp_vrf,
-                                            build_ibgp_vpn_v4)
-        mark_ebgp_vrf(anm)
-        build_ibgp_vpn_v4(anm)  # build after bgp as is based on
-    # autonetkit.update_vis(anm)
 
+def design_stages():
+    """Returns the design stages applied to the ANM, in order.
+    Each stage declares the overlays (or overlay.attribute) it reads and
+    writes, so that the scheduler can run independent stages concurrently.
+    Overlays created from another overlay also read its "_ports" attribute.
+    """
+    from autonetkit.build_scheduler import DesignStage
+    from autonetkit.design.osi_layers import build_layer1, build_layer2, build_layer3
+    from autonetkit.design.lag import build_lag
+    from autonetkit.design.mct import build_mct
+    from autonetkit.design.mpls import (build_vrf, mpls_te, mpls_oam,
+                                        mark_ebgp_vrf, build_ibgp_vpn_v4)
+    from autonetkit.design.ip import build_ip
+    from autonetkit.design.igp import (build_ospf, build_eigrp, build_isis,
+                                       build_rip, build_igp_summary)
+    from autonetkit.design.bgp import build_bgp
     from autonetkit.design.snmp import build_snmp
-    build_snmp(anm)
-
     from autonetkit.design.ntp import build_ntp
-    build_ntp(anm)
-
     from autonetkit.design.radius import build_radius
-    build_radius(anm)
 
-    try:
-        from autonetkit_cisco import build_network as cisco_build_network
-    except ImportError, error:
-        log.debug("Unable to load autonetkit_cisco %s", error)
+    cisco_build_network = _cisco_build_network()
+    phy_attrs = ['label', 'update', 'device_type', 'asn',
+                 'specified_int_names', 'x', 'y', 'device_subtype', 'platform',
+                 'host', 'syntax', 'Network', 'Creator', 'enable_routing',
+                 'custom_config_global', 'custom_config_loopback_zero',
+                 'custom_config_phy_ints', '_ports']
+    stages = [DesignStage("build_phy", build_phy,
+                          reads=["input.%s" % attr for attr in phy_attrs],
+                          writes=["input.enable_routing", "phy"],
+                          replayable=False)]  # adds to the existing phy
+    if cisco_build_network:
+        stages.append(DesignStage("cisco_post_phy",
+                                  cisco_build_network.post_phy))
+
+    stages += [
+        DesignStage("build_layer1", build_layer1,
+                    reads=["phy", "graphics"],
+                    writes=["layer1", "layer1_conn", "graphics"]),
+    ]
+
+    if cisco_build_network:
+        # layer2 calls the post_layer2 hook
+        stages.append(DesignStage("build_layer2", build_layer2))
     else:
-        cisco_build_network.post_design(anm)
+        stages.append(DesignStage("build_layer2", build_layer2,
+                                  reads=["input.vlan", "phy", "graphics",
+                                         "layer1", "layer1_conn"],
+                                  writes=["layer2", "layer2_conn", "layer2_bc",
+                                          "vtp", "graphics",
+                                          "phy.broadcast_domain"]))
+
+    stages += [
+        DesignStage("build_lag", build_lag,
+                    reads=["input.config", "input.asn", "input._ports",
+                           "phy._ports"],
+                    writes=["lag", "input.lag"]),
+        DesignStage("build_mct", build_mct,
+                    reads=["input.config", "input.asn", "input.lag",
+                           "input._ports", "phy._ports"],
+                    writes=["mct", "input.lag", "input.mct"]),
+        DesignStage("build_layer3", build_layer3,
+                    reads=["input.device_type", "input.asn", "phy", "layer2",
+                           "layer2_conn"],
+                    writes=["layer3"]),
+        DesignStage("check_server_asns", check_server_asns,
+                    reads=["input.default_asn", "phy", "layer3"],
+                    writes=["phy.asn"]),
+        # adds vrf loopbacks to all overlays the node is in: barrier
+        # do before to add loopbacks before ip allocations
+        DesignStage("build_vrf", build_vrf,
+                    reads=["input.vrf", "input.vrf_role", "input.device_type",
+                           "input.ibgp_role", "phy", "layer3"]),
+        # TODO: replace this with layer2 overlay topology creation
+        DesignStage("build_ip", build_ip,
+                    reads=["phy", "layer2"], writes=["ip"]),
+        # not re-applied as may disable routing for the later stages
+        DesignStage("build_ipv4", allocate_ipv4,
+                    reads=["input.address_family", "phy", "layer2", "ip"],
+                    writes=["ipv4", "phy.use_ipv4", "phy.enable_routing"],
+                    replayable=False),
+        DesignStage("build_ipv6", allocate_ipv6,
+                    reads=["input.address_family", "phy", "layer2", "ip"],
+                    writes=["ipv6", "phy.use_ipv6"]),
+        DesignStage("set_igp_defaults", set_igp_defaults,
+                    reads=["input.igp", "input.include_csr"],
+                    writes=["input.igp", "phy.igp", "phy.include_csr"]),
+    ]
+
+    if cisco_build_network:
+        stages.append(DesignStage("cisco_pre_design",
+                                  cisco_build_network.pre_design))
+
+    stages += [
+        DesignStage("build_ospf", build_ospf,
+                    reads=["input.ospf_area", "input.custom_config_ospf",
+                           "phy", "layer3"],
+                    writes=["ospf"]),
+        DesignStage("build_eigrp", build_eigrp,
+                    reads=["input.custom_config_eigrp", "phy", "layer3"],
+                    writes=["eigrp"]),
+        DesignStage("build_isis", build_isis,
+                    reads=["input.custom_config_isis", "phy", "layer3",
+                           "ipv4"],
+                    writes=["isis"]),
+        DesignStage("build_rip", build_rip,
+                    reads=["input.custom_config_rip", "phy", "layer3"],
+                    writes=["rip"]),
+        DesignStage("build_igp", build_igp_summary,
+                    reads=["phy._ports", "ospf", "eigrp", "isis", "rip"],
+                    writes=["igp"]),
+        DesignStage("build_bgp", build_bgp,
+                    reads=["input.ibgp_role", "input.ibgp_l2_cluster",
+                           "input.ibgp_l3_cluster", "input.custom_config_bgp",
+                           "phy", "layer3"],
+                    writes=["bgp", "ebgp", "ebgp_v4", "ebgp_v6", "ibgp_v4",
+                            "ibgp_v6"]),
+        DesignStage("mpls_te", mpls_te,
+                    reads=["input.device_type", "input.mpls_te_enabled",
+                           "phy", "layer3"],
+                    writes=["mpls_te"]),
+        DesignStage("mpls_oam", mpls_oam,
+                    reads=["input.device_type", "input.use_mpls_oam", "phy"],
+                    writes=["mpls_oam"]),
+        # post-processing
+        DesignStage("mark_ebgp_vrf", _if_routing_enabled(mark_ebgp_vrf),
+                    reads=["phy", "vrf"], writes=["ebgp_v4", "ebgp_v6"]),
+        # build after bgp as is based on
+        DesignStage("build_ibgp_vpn_v4", _if_routing_enabled(build_ibgp_vpn_v4),
+                    reads=["phy", "vrf", "bgp", "ibgp_v4", "ibgp_v6"],
+                    writes=["ibgp_vpn_v4", "ibgp_v4", "ibgp_v6", "bgp"]),
+        DesignStage("build_snmp", build_snmp,
+                    reads=["input.config", "phy._ports"],
+                    writes=["snmp", "input.snmp"]),
+        DesignStage("build_ntp", build_ntp,
+                    reads=["input.config", "phy._ports"],
+                    writes=["ntp", "input.ntp"]),
+        DesignStage("build_radius", build_radius,
+                    reads=["input.config", "phy._ports"],
+                    writes=["radius", "input.radius"]),
+    ]
+
+    if cisco_build_network:
+        stages.append(DesignStage("cisco_post_design",
+                                  cisco_build_network.post_design))
+
+    return stages
+
+
+def apply_design_rules(anm, profiler=None, workers=None):
+    """Applies appropriate design rules to ANM
+
+    If a profiler is provided (see autonetkit.ank_profile), each design
+    stage is recorded against it.
+    If workers > 1 (default from the build_workers setting), independent
+    stages are applied concurrently (see autonetkit.build_scheduler).
+    """
+    from autonetkit.build_scheduler import StageScheduler
+    if profiler is None:
+        profiler = ank_profile.StageProfiler(enabled=False)
+    profiler.start(anm)
+
+    if workers is None:
+        workers = SETTINGS['General']['build_workers']
+
+    # log.info("Building overlay topologies")
+    scheduler = StageScheduler(design_stages(), workers=workers,
+                               profiler=profiler)
+    scheduler.run(anm)
 
     # log.info("Finished building network")
     return anm
 
 
-def build(input_graph):
+def build(input_graph, profiler=None, workers=None):
     """Main function to build network overlay topologies"""
     anm = None
     anm = initialise(input_graph)
-    anm = apply_design_rules(anm)
+    anm = apply_design_rules(anm, profiler=profiler, workers=workers)
     return anm
 
+
+# input attributes used by initialise, which isn't re-applied
+INITIALISE_READS = ["input.%s" % attr for attr in
+                    ['x', 'y', 'device_type', 'label', 'device_subtype', 'asn',
+                     'platform', 'syntax', 'specified_int_names']]
+
+
+def input_delta(previous, current):
+    """Returns the resources (see autonetkit.build_scheduler) modified
+    between the previous and current input graphs, as returned by load.
+    Changes to nodes, edges, or edge attributes modify the whole input.
+
+    >>> previous = nx.path_graph(3)
+    >>> current = nx.path_graph(3)
+    >>> input_delta(previous, current)
+    set([])
+    >>> current.node[0]['ospf_area'] = 1
+    >>> current.graph['igp'] = "isis"
+    >>> sorted(input_delta(previous, current))
+    ['input.igp', 'input.ospf_area']
+    >>> current.remove_node(0)
+    >>> input_delta(previous, current)
+    set(['input'])
+
+    """
+    if (type(previous) is not type(current)
+            or set(previous.nodes()) != set(current.nodes())
+            or previous.adj != current.adj):
+        return set(["input"])
+
+    def changed_keys(data_a, data_b):
+        keys = set(data_a) | set(data_b)
+        return set(key for key in keys if data_a.get(key) != data_b.get(key))
+
+    changed = changed_keys(previous.graph, current.graph)
+    for node, data in current.nodes(data=True):
+        changed.update(changed_keys(previous.node[node], data))
+
+    return set("input.%s" % key for key in changed)
+
+
+class IncrementalBuild(object):
+
+    """Builds the ANM for successive versions of an input graph, eg in
+    monitor mode. Rather than rebuilding the ANM, only the design stages
+    affected by the changes to the input graph are re-applied, where
+    possible."""
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.input_graph = None  # as loaded, before any design rules
+        self.anm = None
+        self.stages = None  # re-applied by the last build, None if full
+
+    def build(self, input_graph, profiler=None):
+        changed = None
+        if self.anm is not None:
+            changed = input_delta(self.input_graph, input_graph)
+            if "input" in changed or changed & set(INITIALISE_READS):
+                changed = None  # initialise must be re-applied
+
+        stages = None
+        if changed is not None:
+            from autonetkit.build_scheduler import affected_stages
+            stages = affected_stages(design_stages(), changed)
+
+        # the input graph is modified by the design rules
+        previous_input = copy.deepcopy(input_graph)
+        if stages is None:
+            log.debug("Rebuilding network")
+            self.anm = build(input_graph, profiler=profiler,
+                             workers=self.workers)
+        else:
+            log.info("Re-applying %s design stages for changes to %s: %s"
+                     % (len(stages), ", ".join(sorted(changed)),
+                        ", ".join(stage.name for stage in stages)))
+            self._update_input(input_graph, changed)
+            self._apply(stages, profiler)
+
+        self.input_graph = previous_input
+        self.stages = stages
+        return self.anm
+
+    def _update_input(self, input_graph, changed):
+        """Copies the changed attributes of input_graph to the ANM"""
+        graph = self.anm.overlay_nx_graphs['input']
+        node_index.drop(self.anm, 'input')
+        keys = [resource.split(".", 1)[1] for resource in changed]
+        for key in keys:
+            for node, data in input_graph.nodes(data=True):
+                if key in data:
+                    graph.node[node][key] = data[key]
+                else:
+                    graph.node[node].pop(key, None)
+
+            if key in input_graph.graph:
+                graph.graph[key] = input_graph.graph[key]
+            else:
+                graph.graph.pop(key, None)
+
+    def _apply(self, stages, profiler=None):
+        from autonetkit.build_scheduler import StageScheduler
+        if profiler is None:
+            profiler = ank_profile.StageProfiler(enabled=False)
+        profiler.start(self.anm)
+
+        workers = self.workers
+        if workers is None:
+            workers = SETTINGS['General']['build_workers']
+        StageScheduler(stages, workers=workers,
+                       profiler=profiler).run(self.anm)
+
 def build_phy(anm):
     """Build physical overlay"""
     g_in = anm['input']
@@ -0,0 +1,266 @@
+"""Scheduler for the design stages applied by build_network.
+
+Each stage declares the ANM resources it reads and writes. A resource is
+either an overlay id, such as "layer3", or an attribute on an overlay, such
+as "input.snmp", for stages that only annotate a shared overlay. Two
+resources overlap if they are equal, or if one is an overlay and the other
+an attribute on it.
+
+A stage depends on every earlier stage that writes a resource it reads or
+writes, or that reads a resource it writes. Stages that don't declare the
+resources they write (writes=None) are barriers, eg the autonetkit_cisco
+hooks. Stages with no path between them in the resulting DAG are run
+concurrently.
+
+The same declarations determine which stages must be re-applied when
+resources change, eg if an attribute of the input graph is modified
+(see affected_stages).
+
+Stages share the one in-memory ANM, so the worker pool is thread based.
+As stages only modify the resources they declare, the resulting ANM does not
+depend on the order that concurrent stages complete in.
+"""
+
+import Queue
+from multiprocessing.pool import ThreadPool
+
+import autonetkit.log as log
+import networkx as nx
+
+
+class DesignStage(object):
+
+    """A design rule applied to the ANM, and the resources it uses"""
+
+    def __init__(self, name, func, reads=None, writes=None, replayable=True):
+        self.name = name
+        self.func = func
+        # stages that don't declare their writes are barriers
+        self.reads = self.writes = None
+        if writes is not None:
+            self.reads = frozenset(reads or [])
+            self.writes = frozenset(writes)
+        elif reads is not None:
+            self.reads = frozenset(reads)  # to check if affected by changes
+        # if the stage can be re-applied to an already built ANM
+        self.replayable = replayable and not self.is_barrier
+
+    def __repr__(self):
+        return self.name
+
+    @property
+    def is_barrier(self):
+        return self.writes is None
+
+    @property
+    def overlays(self):
+        """Overlays written by this stage, None if a barrier"""
+        if self.is_barrier:
+            return None
+        return set(r.split(".")[0] for r in self.writes)
+
+    def conflicts(self, other):
+        """If this stage and other can't be reordered or run concurrently
+
+        >>> a = DesignStage("a", None, reads=["input.config"], writes=["snmp"])
+        >>> b = DesignStage("b", None, reads=["input.config"], writes=["ntp"])
+        >>> c = DesignStage("c", None, reads=["snmp"], writes=["input"])
+        >>> a.conflicts(b)
+        False
+        >>> a.conflicts(c)
+        True
+        >>> b.conflicts(c)
+        True
+
+        """
+        if self.is_barrier or other.is_barrier:
+            return True
+
+        return (_overlapping(self.writes, other.reads | other.writes)
+                or _overlapping(self.reads, other.writes))
+
+    def reads_any(self, resources):
+        """If this stage reads any of resources"""
+        if self.reads is None:
+            return True
+        return _overlapping(self.reads, resources)
+
+
+def _overlaps(resource_a, resource_b):
+    return (resource_a == resource_b
+            or resource_a.startswith(resource_b + ".")
+            or resource_b.startswith(resource_a + "."))
+
+
+def _overlapping(resources_a, resources_b):
+    return any(_overlaps(a, b) for a in resources_a for b in resources_b)
+
+
+def affected_stages(stages, changed):
+    """Returns the stages, in order, that must be re-applied to an ANM built
+    by stages if the resources in changed are modified.
+    Returns None if the ANM must instead be rebuilt, as an affected stage
+    can't be re-applied.
+
+    >>> stages = [
+    ...     DesignStage("a", None, reads=["input.x"], writes=["a"]),
+    ...     DesignStage("b", None, reads=["input.y"], writes=["b"]),
+    ...     DesignStage("c", None, reads=["a"], writes=["c"]),
+    ...     ]
+    >>> affected_stages(stages, ["input.x"])
+    [a, c]
+    >>> affected_stages(stages, ["input.y"])
+    [b]
+    >>> affected_stages(stages, ["input.z"])
+    []
+    >>> stages[0].replayable = False
+    >>> affected_stages(stages, ["input"]) is None
+    True
+
+    """
+    changed = set(changed)
+    retval = []
+    for stage in stages:
+        if stage.is_barrier:
+            # may depend on anything re-applied before it
+            affected = bool(retval) or stage.reads_any(changed)
+        else:
+            # also if what it wrote was modified, eg the overlay re-created
+            affected = (stage.reads_any(changed)
+                        or _overlapping(stage.writes, changed))
+        if not affected:
+            continue
+
+        if not stage.replayable:
+            log.debug("Design stage %s can't be re-applied" % stage)
+            return None
+
+        retval.append(stage)
+        changed.update(stage.writes)
+
+    return retval
+
+
+def dependency_graph(stages):
+    """Returns a DAG of stage names, with an edge from each stage to the
+    stages that must wait for it"""
+    graph = nx.DiGraph()
+    for index, stage in enumerate(stages):
+        graph.add_node(stage.name, index=index)
+        for earlier in stages[:index]:
+            if stage.conflicts(earlier):
+                graph.add_edge(earlier.name, stage.name)
+
+    # only keep the edges needed for ordering, for readability
+    for src, dst in graph.edges():
+        graph.remove_edge(src, dst)
+        if not nx.has_path(graph, src, dst):
+            graph.add_edge(src, dst)
+
+    return graph
+
+
+def undeclared_dependencies(anm, stages):
+    """Checks the overlay dependencies recorded by the ANM in the
+    _dependencies overlay against those declared by the stages.
+    As the ANM records dependencies per overlay rather than per stage, an
+    overlay's dependencies are checked against all stages that write it.
+    Returns a list of (overlay_id, source_overlay_id) for overlays built from
+    nodes of an overlay that no stage writing them declared"""
+    g_deps = anm.overlay_nx_graphs['_dependencies']
+    declared = {}
+    for stage in stages:
+        if stage.is_barrier:
+            continue
+        for overlay_id in stage.overlays:
+            declared.setdefault(overlay_id, set()).update(stage.reads
+                                                          | stage.writes)
+
+    retval = []
+    for overlay_id in sorted(declared):
+        if overlay_id not in g_deps:
+            continue
+        for src in sorted(g_deps.predecessors(overlay_id)):
+            if not _overlapping([src], declared[overlay_id]):
+                retval.append((overlay_id, src))
+
+    return retval
+
+
+class StageScheduler(object):
+
+    """Runs design stages against an ANM, concurrently if workers > 1"""
+
+    def __init__(self, stages, workers=1, profiler=None):
+        self.stages = list(stages)
+        self.workers = workers
+        self.profiler = profiler
+
+    def dependency_graph(self):
+        return dependency_graph(self.stages)
+
+    def _run_stage(self, stage, anm, concurrent=False):
+        if self.profiler is None:
+            stage.func(anm)
+            return
+
+        # concurrent stages would also see each others' overlays
+        overlays = stage.overlays if concurrent else None
+        with self.profiler.stage(stage.name, overlays=overlays):
+            stage.func(anm)
+
+    def run(self, anm):
+        if self.workers <= 1:
+            for stage in self.stages:
+                self._run_stage(stage, anm)
+            return anm
+
+        graph = self.dependency_graph()
+        stages = dict((stage.name, stage) for stage in self.stages)
+        order = dict((stage.name, index)
+                     for index, stage in enumerate(self.stages))
+        waiting_on = dict((name, set(graph.predecessors(name)))
+                          for name in graph)
+        completed = Queue.Queue()
+        errors = {}
+        running = set()
+
+        def worker(name):
+            try:
+                self._run_stage(stages[name], anm, concurrent=True)
+            except Exception, error:
+                log.debug("Error in design stage %s" % name, exc_info=True)
+                completed.put((name, error))
+            else:
+                completed.put((name, None))
+
+        pool = ThreadPool(self.workers)
+        try:
+            while waiting_on or running:
+                if not errors:
+                    ready = sorted((name for name, deps in waiting_on.items()
+                                    if not deps), key=order.get)
+                    for name in ready:
+                        del waiting_on[name]
+                        running.add(name)
+                        pool.apply_async(worker, (name,))
+
+                if not running:
+                    break  # stopped submitting due to an error
+
+                name, error = completed.get()
+                running.remove(name)
+                if error is not None:
+                    errors[name] = error
+                for deps in waiting_on.values():
+                    deps.discard(name)
+        finally:
+            pool.close()
+            pool.join()
+
+        if errors:
+            # raise the error from the earliest stage, as would have serially
+            name = min(errors, key=order.get)
+            raise errors[name]
+
+        return anm
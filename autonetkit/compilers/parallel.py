@@ -0,0 +1,151 @@
+"""Parallel compilation of devices by a device compiler.
+
+Device compilers read the ANM, and only write to the DmNode they compile,
+so devices can be compiled independently. With the workers setting of the
+Compiler config section > 1, the devices are partitioned across a pool of
+forked processes. Each worker inherits the ANM and device model at the
+time of the fork, as a read-only snapshot, compiles its devices, and
+returns their node data. References to ANM and device model objects in
+the data (eg a DmInterface in an ospf link stanza) are pickled by id, and
+rebound to the parent's objects when the results are merged back into the
+device model.
+
+Where processes can't be forked (eg Windows), devices are compiled
+serially.
+"""
+
+import cPickle as pickle
+import os
+from cStringIO import StringIO
+from multiprocessing import Pool
+
+import autonetkit.config
+import autonetkit.log as log
+from autonetkit.anm.edge import NmEdge
+from autonetkit.anm.interface import NmPort
+from autonetkit.anm.node import NmNode
+from autonetkit.nidb.edge import DmEdge
+from autonetkit.nidb.interface import DmInterface
+from autonetkit.nidb.node import DmNode
+
+_job = None  # (device compiler, node ids), inherited by forked workers
+
+
+def workers():
+    return autonetkit.config.settings['Compiler']['workers']
+
+
+def dumps_nodes(nidb, anm, node_ids):
+    """Pickles [(node_id, data)] for node_ids from nidb"""
+
+    def persistent_id(obj):
+        if obj is nidb:
+            return ("nidb",)
+        if obj is anm:
+            return ("anm",)
+        if isinstance(obj, DmNode):
+            return ("DmNode", obj.node_id)
+        if isinstance(obj, DmInterface):
+            return ("DmInterface", obj.node_id, obj.interface_id)
+        if isinstance(obj, DmEdge):
+            return ("DmEdge", obj.src_id, obj.dst_id, obj.ekey)
+        if isinstance(obj, NmNode):
+            return ("NmNode", obj.overlay_id, obj.node_id)
+        if isinstance(obj, NmPort):
+            return ("NmPort", obj.overlay_id, obj.node_id, obj.interface_id)
+        if isinstance(obj, NmEdge):
+            return ("NmEdge", obj.overlay_id, obj.src_id, obj.dst_id,
+                    obj.ekey)
+        return None
+
+    graph = nidb.raw_graph()
+    fh = StringIO()
+    pickler = pickle.Pickler(fh, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump([(node_id, graph.node[node_id]) for node_id in node_ids])
+    return fh.getvalue()
+
+
+def loads_nodes(nidb, anm, data):
+    """Unpickles [(node_id, data)], rebinding references to nidb and anm"""
+    constructors = {
+        "nidb": lambda: nidb,
+        "anm": lambda: anm,
+        "DmNode": lambda *args: DmNode(nidb, *args),
+        "DmInterface": lambda *args: DmInterface(nidb, *args),
+        "DmEdge": lambda *args: DmEdge(nidb, *args),
+        "NmNode": lambda *args: NmNode(anm, *args),
+        "NmPort": lambda *args: NmPort(anm, *args),
+        "NmEdge": lambda *args: NmEdge(anm, *args),
+    }
+
+    def persistent_load(pid):
+        return constructors[pid[0]](*pid[1:])
+
+    unpickler = pickle.Unpickler(StringIO(data))
+    unpickler.persistent_load = persistent_load
+    return unpickler.load()
+
+
+def merge_nodes(nidb, results):
+    """Updates the node data of nidb from [(node_id, data)]"""
+    graph = nidb.raw_graph()
+    for node_id, data in results:
+        node_data = graph.node[node_id]
+        node_data.clear()
+        node_data.update(data)
+
+
+def _compile_partition(indices):
+    device_compiler, node_ids = _job
+    node_ids = [node_ids[index] for index in indices]
+    for node_id in node_ids:
+        device_compiler.compile(DmNode(device_compiler.nidb, node_id))
+    return dumps_nodes(device_compiler.nidb, device_compiler.anm, node_ids)
+
+
+def partitions(count, processes):
+    """Splits range(count) into contiguous partitions, several per process
+    so that the load is balanced if some devices take longer to compile"""
+    size = max(1, count // (processes * 4))
+    return [range(start, min(start + size, count))
+            for start in range(0, count, size)]
+
+
+def compile_nodes(device_compiler, dm_nodes, post_compile=None,
+                  processes=None):
+    """Compiles dm_nodes with device_compiler, in parallel if processes
+    (default from the workers setting) > 1. post_compile(dm_node) is
+    then applied to each node, in order"""
+    global _job
+    dm_nodes = list(dm_nodes)
+    if processes is None:
+        processes = workers()
+    processes = min(processes, len(dm_nodes))
+
+    if processes <= 1 or not hasattr(os, "fork"):
+        for dm_node in dm_nodes:
+            device_compiler.compile(dm_node)
+            if post_compile:
+                post_compile(dm_node)
+        return
+
+    log.debug("Compiling %s devices using %s processes"
+              % (len(dm_nodes), processes))
+    _job = (device_compiler, [n.node_id for n in dm_nodes])
+    pool = Pool(processes)
+    try:
+        results = pool.map(_compile_partition,
+                           partitions(len(dm_nodes), processes))
+    finally:
+        pool.close()
+        pool.join()
+        _job = None
+
+    nidb = device_compiler.nidb
+    for data in results:
+        merge_nodes(nidb, loads_nodes(nidb, device_compiler.anm, data))
+
+    if post_compile:
+        for dm_node in dm_nodes:
+            post_compile(dm_node)
@@ -4,6 +4,7 @@ import autonetkit
 import autonetkit.config
 import autonetkit.log as log
 import autonetkit.plugins.naming as naming
+from autonetkit.compilers.parallel import compile_nodes
 from autonetkit.compilers.platform.platform_base import PlatformCompiler
 import string
 import itertools
@@ -98,6 +99,7 @@ class BrocadeCompiler(PlatformCompiler):
                     interface.is_primary_port = True
 
         ni_compiler = BrocadeNICompiler(self.nidb, self.anm)
+        ni_nodes = []
         for phy_node in g_phy.routers(host=self.host, syntax='brcd_ni'):
             dm_node = self.nidb.node(phy_node)
             dm_node.add_stanza("render")
@@ -117,5 +119,7 @@ class BrocadeCompiler(PlatformCompiler):
             dm_node.supported_features = ConfigStanza(
                 mpls_te=False, mpls_oam=False, vrf=False)
 
-            ni_compiler.compile(dm_node)
+            ni_nodes.append(dm_node)
             # TODO: make this work other way around
+
+        compile_nodes(ni_compiler, ni_nodes)
@@ -12,6 +12,7 @@ from autonetkit.compilers.device.cisco import (IosBaseCompiler,
                                                IosClassicCompiler,
                                                IosXrCompiler, NxOsCompiler,
                                                StarOsCompiler)
+from autonetkit.compilers.parallel import compile_nodes
 from autonetkit.compilers.platform.platform_base import PlatformCompiler
 from autonetkit.nidb import ConfigStanza
 
@@ -108,6 +109,18 @@ class CiscoCompiler(PlatformCompiler):
         # TODO: use a namedtuple
         return to_memory, use_mgmt_interfaces, dst_folder
 
+    @staticmethod
+    def mgmt_interface_adder(mgmt_int_id, use_mgmt_interfaces=True):
+        """Returns function to add management interface mgmt_int_id to a
+        compiled DmNode, or None if not using management interfaces"""
+        if not use_mgmt_interfaces:
+            return None
+
+        def add_mgmt_interface(DmNode):
+            mgmt_int = DmNode.add_interface(management=True)
+            mgmt_int.id = mgmt_int_id
+        return add_mgmt_interface
+
     #@call_log
     def compile_devices(self):
         g_phy = self.anm['phy']
@@ -175,6 +188,7 @@ class CiscoCompiler(PlatformCompiler):
         from autonetkit_cisco.compilers.device.ubuntu import UbuntuCompiler
 
         ubuntu_compiler = UbuntuCompiler(self.nidb, self.anm)
+        server_nodes = []
         for phy_node in g_phy.servers(host=self.host):
             DmNode = self.nidb.node(phy_node)
             DmNode.add_stanza("render")
@@ -217,10 +231,11 @@ class CiscoCompiler(PlatformCompiler):
                 mgmt_int_id = "eth0"
                 mgmt_int.id = mgmt_int_id
 
-                # render route config
-            DmNode = self.nidb.node(phy_node)
-            ubuntu_compiler.compile(DmNode)
+            server_nodes.append(DmNode)
 
+        def post_compile(DmNode):
+            # render route config
+            phy_node = g_phy.node(DmNode)
             if not phy_node.dont_configure_static_routing:
                 DmNode.render.template = os.path.join(
                     "templates", "linux", "static_route.mako")
@@ -231,11 +246,15 @@ class CiscoCompiler(PlatformCompiler):
                     DmNode.render.dst_file = "%s.conf" % naming.network_hostname(
                         phy_node)
 
+        compile_nodes(ubuntu_compiler, server_nodes, post_compile)
+
         # TODO: refactor out common logic
 
         ios_compiler = IosClassicCompiler(self.nidb, self.anm)
         host_routers = g_phy.routers(host=self.host)
         ios_nodes = (n for n in host_routers if n.syntax in ("ios", "ios_xe"))
+        ios_dm_nodes = []
+        mgmt_int_ids = {}
         for phy_node in ios_nodes:
             DmNode = self.nidb.node(phy_node)
             DmNode.add_stanza("render")
@@ -279,10 +298,16 @@ class CiscoCompiler(PlatformCompiler):
                     interface.id = numeric_to_interface_label(
                         interface.numeric_id)
 
-            ios_compiler.compile(DmNode)
+            ios_dm_nodes.append(DmNode)
             if use_mgmt_interfaces:
-                mgmt_int = DmNode.add_interface(management=True)
-                mgmt_int.id = mgmt_int_id
+                mgmt_int_ids[DmNode] = mgmt_int_id
+
+        def add_mgmt_interface(DmNode):
+            mgmt_int = DmNode.add_interface(management=True)
+            mgmt_int.id = mgmt_int_ids[DmNode]
+
+        compile_nodes(ios_compiler, ios_dm_nodes,
+                      add_mgmt_interface if use_mgmt_interfaces else None)
 
         try:
             from autonetkit_cisco.compilers.device.cisco import IosXrCompiler
@@ -290,6 +315,7 @@ class CiscoCompiler(PlatformCompiler):
         except ImportError:
             ios_xr_compiler = IosXrCompiler(self.nidb, self.anm)
 
+        ios_xr_dm_nodes = []
         for phy_node in g_phy.routers(host=self.host, syntax='ios_xr'):
             DmNode = self.nidb.node(phy_node)
             DmNode.add_stanza("render")
@@ -309,14 +335,14 @@ class CiscoCompiler(PlatformCompiler):
                     interface.id = self.numeric_to_interface_label_ios_xr(
                         interface.numeric_id)
 
-            ios_xr_compiler.compile(DmNode)
+            ios_xr_dm_nodes.append(DmNode)
 
-            if use_mgmt_interfaces:
-                mgmt_int_id = "mgmteth0/0/CPU0/0"
-                mgmt_int = DmNode.add_interface(management=True)
-                mgmt_int.id = mgmt_int_id
+        compile_nodes(ios_xr_compiler, ios_xr_dm_nodes,
+                      self.mgmt_interface_adder("mgmteth0/0/CPU0/0",
+                                                use_mgmt_interfaces))
 
         nxos_compiler = NxOsCompiler(self.nidb, self.anm)
+        nxos_dm_nodes = []
         for phy_node in g_phy.routers(host=self.host, syntax='nx_os'):
             DmNode = self.nidb.node(phy_node)
             DmNode.add_stanza("render")
@@ -338,15 +364,14 @@ class CiscoCompiler(PlatformCompiler):
             DmNode.supported_features = ConfigStanza(
                 mpls_te=False, mpls_oam=False, vrf=False)
 
-            nxos_compiler.compile(DmNode)
+            nxos_dm_nodes.append(DmNode)
             # TODO: make this work other way around
 
-            if use_mgmt_interfaces:
-                mgmt_int_id = "mgmt0"
-                mgmt_int = DmNode.add_interface(management=True)
-                mgmt_int.id = mgmt_int_id
+        compile_nodes(nxos_compiler, nxos_dm_nodes,
+                      self.mgmt_interface_adder("mgmt0", use_mgmt_interfaces))
 
         staros_compiler = StarOsCompiler(self.nidb, self.anm)
+        staros_dm_nodes = []
         for phy_node in g_phy.routers(host=self.host, syntax='StarOS'):
             DmNode = self.nidb.node(phy_node)
             DmNode.add_stanza("render")
@@ -365,13 +390,12 @@ class CiscoCompiler(PlatformCompiler):
                     interface.id = self.numeric_to_interface_label_star_os(
                         interface.numeric_id)
 
-            staros_compiler.compile(DmNode)
+            staros_dm_nodes.append(DmNode)
             # TODO: make this work other way around
 
-            if use_mgmt_interfaces:
-                mgmt_int_id = "ethernet 1/1"
-                mgmt_int = DmNode.add_interface(management=True)
-                mgmt_int.id = mgmt_int_id
+        compile_nodes(staros_compiler, staros_dm_nodes,
+                      self.mgmt_interface_adder("ethernet 1/1",
+                                                use_mgmt_interfaces))
 
     def assign_management_interfaces(self):
         g_phy = self.anm['phy']
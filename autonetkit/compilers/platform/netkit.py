@@ -4,6 +4,7 @@ import autonetkit
 import autonetkit.config
 import autonetkit.log as log
 import autonetkit.plugins.naming as naming
+from autonetkit.compilers.parallel import compile_nodes
 from autonetkit.compilers.platform.platform_base import PlatformCompiler
 import string
 import itertools
@@ -31,6 +32,7 @@ class NetkitCompiler(PlatformCompiler):
         # todo: set platform render
         lab_topology = self.nidb.topology(self.host)
         lab_topology.render2 = PlatformRender()
+        quagga_nodes = []
 
 # TODO: this should be all l3 devices not just routers
         for phy_node in g_phy.l3devices(host=self.host, syntax='quagga'):
@@ -85,13 +87,16 @@ class NetkitCompiler(PlatformCompiler):
             dm_node.add_stanza("tap")
             dm_node.tap.id = self.index_to_int_id(int_ids.next())
 
-            quagga_compiler.compile(dm_node)
+            quagga_nodes.append(dm_node)
 
+        def post_compile(dm_node):
             if dm_node.bgp:
                 dm_node.bgp.debug = True
                 static_routes = []
                 dm_node.zebra.static_routes = static_routes
 
+        compile_nodes(quagga_compiler, quagga_nodes, post_compile)
+
         # and lab.conf
         self.allocate_tap_ips()
         self.allocate_lab_topology()
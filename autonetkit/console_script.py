@@ -55,6 +55,8 @@ def parse_options(argument_string=None):
                         help="Archive ANM, DeviceModel, and IP allocations")
     parser.add_argument('--measure', action="store_true",
                         default=False, help="Measure")
+    parser.add_argument('--profile', action="store_true", default=False,
+                        help="Profile design rules (timing and memory per stage)")
     parser.add_argument(
         '--webserver', action="store_true", default=False, help="Webserver")
     parser.add_argument('--grid', type=int, help="Grid Size (n * n)")
@@ -133,6 +135,7 @@ def main(options):
         'monitor': options.monitor or settings['General']['monitor'],
         'diff': options.diff or settings['General']['diff'],
         'archive': options.archive or settings['General']['archive'],
+        'profile': options.profile or settings['General']['profile'],
         # use and for visualise as no_vis negates
         'visualise': options.visualise and settings['General']['visualise'],
     }
@@ -156,9 +159,16 @@ def main(options):
         log.info("No input file specified. Exiting")
         return
 
+    incremental = None
+    if (build_options['monitor'] and options.file
+            and settings['General']['incremental_build']):
+        import autonetkit.build_network as build_network
+        incremental = build_network.IncrementalBuild()
+
     try:
         workflow.manage_network(input_string, timestamp,
-                       grid=options.grid, **build_options)
+                       grid=options.grid, incremental=incremental,
+                       **build_options)
     except Exception, err:
         log.error(
             "Error generating network configurations: %s" % err)
@@ -188,7 +198,8 @@ def main(options):
                         with open(options.file, "r") as fh:
                             input_string = fh.read()  # read updates
                         workflow.manage_network(input_string,
-                                       timestamp, build_options)
+                                       timestamp, incremental=incremental,
+                                       **build_options)
                         log.info("Monitoring for updates...")
                     except Exception, e:
                         log.warning("Unable to build network %s" % e)
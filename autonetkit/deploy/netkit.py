@@ -39,6 +39,16 @@ def package(src_dir, target='netkit_lab'):
     return tar_filename
 
 
+def rendered_archive():
+    """Returns the tar.gz archive rendered to, if the render_archive
+    setting is a tar.gz, to transfer instead of packaging rendered/"""
+    tar_filename = config.settings['General']['render_archive']
+    if tar_filename and tar_filename.endswith(('.tar.gz', '.tgz')):
+        import os
+        if os.path.isfile(tar_filename):
+            return tar_filename
+
+
 def transfer(host, username, local, remote=None, key_filename=None):
     log.debug('Transferring lab to %s' % host)
     log.info('Transferring Netkit lab')
@@ -11,8 +11,11 @@ def build_igp(anm):
     build_eigrp(anm)
     build_isis(anm)
     build_rip(anm)
+    build_igp_summary(anm)
 
-    # Build a protocol summary graph
+
+def build_igp_summary(anm):
+    """Build a protocol summary graph"""
     g_igp = anm.add_overlay("igp")
     igp_protocols = ["ospf", "eigrp", "isis", "rip"]
     for protocol in igp_protocols:
@@ -1,6 +1,6 @@
-import glob
 import os
 
+import autonetkit.ank_archive as ank_archive
 import nidb
 
 #TODO: make this generalise to two graphs, rather than DeviceModel specifically
@@ -8,9 +8,7 @@ import nidb
 def nidb_diff(directory = None, length = 1):
     if not directory:
         directory = os.path.join("versions", "nidb")
-    glob_dir = os.path.join(directory, "*.json.gz")
-    pickle_files = glob.glob(glob_dir)
-    pickle_files = sorted(pickle_files)
+    pickle_files = ank_archive.saved_files(directory)
     pairs = [(a, b) for (a, b) in zip(pickle_files, pickle_files[1:])]
     pairs = pairs[-1*length:]
     diffs = []
@@ -33,11 +33,22 @@ class DmBase(object):
     def save(self, timestamp=True, use_gzip=True):
         import os
         import gzip
+        import autonetkit.ank_archive as ank_archive
         archive_dir = os.path.join("versions", "nidb")
         if not os.path.isdir(archive_dir):
             os.makedirs(archive_dir)
 
-        data = ank_json.ank_json_dumps(self._graph)
+        if ank_archive.binary_format():
+            if timestamp:
+                archive_file = "nidb_%s%s" % (self.timestamp,
+                                              ank_archive.EXTENSION)
+            else:
+                archive_file = "nidb%s" % ank_archive.EXTENSION
+            ank_archive.save(os.path.join(archive_dir, archive_file),
+                             [("nidb", self._graph)])
+            return
+
+        data = ank_json.ank_json_dumps(self._graph, tagged=True)
         if timestamp:
             json_file = "nidb_%s.json.gz" % self.timestamp
         else:
@@ -57,14 +68,12 @@ class DmBase(object):
 
     def restore_latest(self, directory=None):
         import os
-        import glob
+        import autonetkit.ank_archive as ank_archive
         if not directory:
             # TODO: make directory loaded from config
             directory = os.path.join("versions", "nidb")
 
-        glob_dir = os.path.join(directory, "*.json.gz")
-        pickle_files = glob.glob(glob_dir)
-        pickle_files = sorted(pickle_files)
+        pickle_files = ank_archive.saved_files(directory)
         try:
             latest_file = pickle_files[-1]
         except IndexError:
@@ -73,10 +82,14 @@ class DmBase(object):
                 "No previous DeviceModel saved. Please compile new DeviceModel")
             return
         self.restore(latest_file)
-        ank_json.rebind_nidb_interfaces(self)
 
     def restore(self, pickle_file):
         import gzip
+        import autonetkit.ank_archive as ank_archive
+        if ank_archive.is_archive(pickle_file):
+            self._graph = ank_archive.load(pickle_file, ["nidb"])["nidb"]
+            return
+
         log.debug("Restoring %s" % pickle_file)
         with gzip.open(pickle_file, "r") as fh:
             #data = json.load(fh)
@@ -24,6 +24,13 @@ class ConfigStanza(object):
 
         object.__setattr__(self, '_odict', OrderedDict(kwargs))
 
+    def __reduce__(self):
+        # explicit, as __getattr__ returns None for the pickle protocol methods
+        return (ConfigStanza, (), self._odict)
+
+    def __setstate__(self, state):
+        object.__setattr__(self, '_odict', state)
+
     def __repr__(self):
         return str(self._odict.items())
 
@@ -0,0 +1,235 @@
+"""Ledger of the IP allocations made by previous runs.
+
+Allocations are recorded by the identity of the objects allocated to:
+nodes by node id, interfaces by node id and interface id, and broadcast
+domains by the interfaces they connect. When the ledger is enabled (the
+ledger setting of the IP Addressing config section), the allocators first
+keep the previous allocations that still fit the topology, and only allocate
+subnets and addresses to new objects, from the free space of their ASN's
+block. If that isn't possible, eg an ASN's block is full, the whole
+address space is allocated again, and the ledger replaced.
+
+The asn_slack and domain_slack settings reserve space when blocks are
+allocated, so that nodes added later fit into the existing blocks.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import autonetkit.config
+import autonetkit.log as log
+import netaddr
+
+SETTINGS = autonetkit.config.settings
+
+_lock = threading.Lock()  # ipv4 and ipv6 may be built concurrently
+
+
+def slack():
+    """Returns (asn_slack, domain_slack) from the config"""
+    settings = SETTINGS['IP Addressing']
+    return settings['asn_slack'], settings['domain_slack']
+
+
+def enabled():
+    return SETTINGS['IP Addressing']['ledger']
+
+
+class AllocationLedger(object):
+
+    """Allocations, by section, stored in a JSON file"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.data = {}
+        if os.path.isfile(filename):
+            try:
+                with open(filename) as fh:
+                    self.data = json.load(fh)
+            except ValueError:
+                log.warning("Unable to read IP allocation ledger %s, "
+                            "allocating all addresses" % filename)
+
+    def section(self, name, root_block):
+        """Returns the allocations for section name, empty if previously
+        allocated from a different root block"""
+        section = self.data.get(name)
+        if section is None or section.get('root') != str(root_block):
+            return {'root': str(root_block), 'groups': {}}
+        return section
+
+    def save(self):
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        log.debug("Saving IP allocation ledger to %s" % self.filename)
+        with open(self.filename, "w") as fh:
+            json.dump(self.data, fh, indent=4, sort_keys=True)
+
+
+@contextmanager
+def ledger_section(name, root_block):
+    """Yields the section name of the ledger, and saves any changes to it,
+    or yields None if the ledger isn't enabled"""
+    if not enabled():
+        yield None
+        return
+
+    with _lock:
+        ledger = AllocationLedger(SETTINGS['IP Addressing']['ledger_file'])
+        section = ledger.section(name, root_block)
+        yield section
+        ledger.data[name] = section
+        ledger.save()
+
+
+def node_key(node):
+    return str(node.node_id)
+
+
+def interface_key(interface):
+    return "%s %s" % (interface.node_id, interface.interface_id)
+
+
+class BlockPool(object):
+
+    """Free space of a block, for first-fit allocation of subnets"""
+
+    def __init__(self, block):
+        self.block = block
+        self.used = []  # sorted (first, last)
+
+    def _free(self, first, last):
+        return not any(first <= used_last and used_first <= last
+                       for (used_first, used_last) in self.used)
+
+    def claim(self, subnet):
+        """Claims subnet if in the block and not used, returns success"""
+        if subnet.version != self.block.version or subnet not in self.block:
+            return False
+        if not self._free(subnet.first, subnet.last):
+            return False
+        self.used.append((subnet.first, subnet.last))
+        self.used.sort()
+        return True
+
+    def allocate(self, prefixlen):
+        """Returns the first free /prefixlen subnet, or None if full"""
+        width = self.block._module.width
+        if prefixlen < self.block.prefixlen or prefixlen > width:
+            return None
+
+        size = 1 << (width - prefixlen)
+        candidate = self.block.first
+        for (used_first, used_last) in self.used:
+            if candidate + size - 1 < used_first:
+                break
+            if used_last >= candidate:
+                # next aligned block after the used range
+                candidate = (used_last // size + 1) * size
+        if candidate + size - 1 > self.block.last:
+            return None
+
+        subnet = netaddr.IPNetwork((candidate, prefixlen),
+                                   version=self.block.version)
+        self.claim(subnet)
+        return subnet
+
+
+class HostPool(object):
+
+    """Free addresses from first to last, for allocation in order"""
+
+    def __init__(self, first, last, version):
+        self.first = first
+        self.last = last
+        self.version = version
+        self.used = set()
+        self.next_value = first
+
+    @property
+    def capacity(self):
+        return max(0, self.last - self.first + 1)
+
+    def claim(self, address):
+        value = int(address)
+        if not self.first <= value <= self.last or value in self.used:
+            return False
+        self.used.add(value)
+        return True
+
+    def allocate(self):
+        """Returns the lowest free address, or None if full"""
+        while self.next_value in self.used:
+            self.next_value += 1
+        if self.next_value > self.last:
+            return None
+        self.used.add(self.next_value)
+        return netaddr.IPAddress(self.next_value, self.version)
+
+
+def match_domains(previous_domains, domain_keys):
+    """Matches current broadcast domains to those in the ledger.
+    domain_keys maps each current domain to the keys of its interfaces.
+    A domain matches the previous domain with the same interfaces, or
+    otherwise the unmatched previous domain that shares the most interfaces
+    with it, eg if a node has joined a switched domain.
+    Returns {domain: previous domain entry}"""
+    by_interface = {}
+    for (key, entry) in previous_domains.items():
+        for interface in entry['interfaces']:
+            by_interface.setdefault(interface, set()).add(key)
+
+    matched = {}
+    used = set()
+    domains = sorted(domain_keys)
+    for domain in domains:
+        key = ",".join(sorted(domain_keys[domain]))
+        if key in previous_domains:
+            matched[domain] = key
+            used.add(key)
+
+    for domain in domains:
+        if domain in matched:
+            continue
+        shared = {}
+        for interface in domain_keys[domain]:
+            for key in by_interface.get(interface, []):
+                if key not in used:
+                    shared[key] = shared.get(key, 0) + 1
+        if shared:
+            key = min(shared, key=lambda k: (-shared[k], k))
+            matched[domain] = key
+            used.add(key)
+
+    return dict((domain, previous_domains[key])
+                for (domain, key) in matched.items())
+
+
+def group_pools(section, root_pool):
+    """Returns {asn: BlockPool} for the ASN blocks in the ledger section
+    that are still free in root_pool"""
+    pools = {}
+    for (asn, block) in sorted(section['groups'].items()):
+        block = netaddr.IPNetwork(block)
+        if root_pool.claim(block):
+            pools[asn] = BlockPool(block)
+    return pools
+
+
+def allocate_hosts(pool, previous, keys):
+    """Returns {key: address} for keys, keeping addresses from previous,
+    {key: address}, that are free in pool. Returns None if pool is full"""
+    retval = {}
+    for key in keys:
+        address = previous.get(key)
+        if address is not None and pool.claim(netaddr.IPAddress(address)):
+            retval[key] = netaddr.IPAddress(address)
+    for key in keys:
+        if key not in retval:
+            retval[key] = pool.allocate()
+            if retval[key] is None:
+                return None
+    return retval
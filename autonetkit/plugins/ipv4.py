@@ -12,9 +12,7 @@ import autonetkit.log as log
 import netaddr
 import networkx as nx
 from autonetkit.exception import AutoNetkitException
-
-# TODO: allow slack in allocations: both for ASN (group level), and for
-# collision domains to allow new nodes to be easily added
+from autonetkit.plugins import ip_ledger
 
 try:
     import cPickle as pickle
@@ -29,6 +27,43 @@ def subnet_size(host_count):
     return int(math.ceil(math.log(host_count, 2)))
 
 
+MAX_IPV4 = 2 ** 32 - 1
+
+
+def _iter_hosts(first, prefixlen):
+    """Returns an iterator over the host addresses of first/prefixlen as
+    integers, as for netaddr IPNetwork.iter_hosts()"""
+
+    size = 1 << (32 - prefixlen)
+    if size < 4:
+        return iter([])
+    return iter(xrange(first + 1, first + size - 1))
+
+
+class _SubnetBlocks(object):
+
+    """Successive /prefixlen blocks of first/subnet_prefixlen, as integers,
+    as for netaddr IPNetwork.subnet(). Once unbounded, blocks continue past
+    the end of the subnet, as for IPNetwork.next()"""
+
+    def __init__(self, first, subnet_prefixlen, prefixlen):
+        self.next_value = first
+        self.end = first + (1 << (32 - subnet_prefixlen))
+        if prefixlen < subnet_prefixlen:
+            self.end = first  # no blocks
+        self.size = 1 << (32 - prefixlen)
+        self.unbounded = False
+
+    def next(self):
+        value = self.next_value
+        if not self.unbounded and value >= self.end:
+            raise StopIteration
+        if self.unbounded and value + self.size - 1 > MAX_IPV4:
+            raise IndexError('increment exceeds address boundary!')
+        self.next_value += self.size
+        return value
+
+
 class TreeNode(object):
 
     def __init__(self, graph, node):
@@ -80,8 +115,11 @@ class TreeNode(object):
 
 class IpTree(object):
 
-    def __init__(self, root_ip_block):
+    def __init__(self, root_ip_block, asn_slack=0, domain_slack=0):
         self.unallocated_nodes = []
+        # spare addresses in loopback groups and broadcast domains
+        self.asn_slack = asn_slack
+        self.domain_slack = domain_slack
         self.graph = nx.DiGraph()
         self.root_node = None
         self.timestamp = time.strftime('%Y%m%d_%H%M%S',
@@ -218,7 +256,8 @@ class IpTree(object):
                 if all(item.is_loopback for item in items):
                     parent_id = self.next_node_id
                     # group all loopbacks into single subnet
-                    prefixlen = 32 - subnet_size(len(items))
+                    prefixlen = 32 - subnet_size(len(items)
+                                             + self.asn_slack)
                     subgraph.add_node(parent_id, prefixlen=prefixlen,
                                       loopback_group=True)
                     for item in sorted(items):
@@ -247,7 +286,8 @@ class IpTree(object):
 
                 parent_id = self.next_node_id
                 # group all loopbacks into single subnet
-                prefixlen = 32 - subnet_size(len(items))
+                prefixlen = 32 - subnet_size(len(items)
+                                             + self.asn_slack)
                 subgraph.add_node(parent_id, prefixlen=prefixlen,
                                   loopback_group=True)
                 for item in sorted(items):
@@ -268,7 +308,9 @@ class IpTree(object):
             for item in sorted(items):
                 if item.broadcast_domain:
                     subgraph.add_node(self.next_node_id, prefixlen=32
-                                      - subnet_size(item.degree()), host=item)
+                                      - subnet_size(item.degree()
+                                                    + self.domain_slack),
+                                      host=item)
                 if item.is_l3device():
                     subgraph.add_node(self.next_node_id, prefixlen=32,
                                       host=item)
@@ -404,125 +446,132 @@ class IpTree(object):
                 # cd -> neigh (cd is parent)
                 global_graph.add_edge(cd_id, child_id)
 
-# TODO: make allocate seperate step
-
-        def allocate(node):
-
-            # children = graph.successors(node)
-
-            children = sorted(node.children())
-            prefixlen = node.prefixlen + 1
-
-            # workaround for clobbering attr subgraph root node with /16 if was
-            # a /28
-
-            subnet = node.subnet.subnet(prefixlen)
-
-# handle case where children subnet
-
-            # special case of single AS -> root is loopback_group
-            if node.is_loopback_group() or node.is_broadcast_domain():
-
-                # TODO: generalise this rather than repeated code with below
-                # node.subnet = subnet.next() # Note: don't break into smaller
-                # subnets if single-AS
-
-                # ensures start at .1 rather than .0
-                iterhosts = node.subnet.iter_hosts()
-                sub_children = node.children()
-                for sub_child in sorted(sub_children):
-
-                    # TODO: tidy up this allocation to always record the subnet
-
-                    if sub_child.is_interface() \
-                            and sub_child.host.is_loopback:
-                        if sub_child.host.is_loopback_zero:
-
-                            # loopback zero, just store the ip address
-
-                            sub_child.ip_address = iterhosts.next()
-                        else:
-
-                            # secondary loopback
-
-                            sub_child.ip_address = iterhosts.next()
-                            sub_child.subnet = node.subnet
-                    elif sub_child.is_interface() \
-                            and sub_child.host.is_physical:
-
-                        # physical interface
-
-                        sub_child.ip_address = iterhosts.next()
-                        sub_child.subnet = node.subnet
-                    else:
-                        sub_child.subnet = iterhosts.next()
-
-                return
-
-            for child in sorted(children):
-
-                # traverse the tree
-
-                if child.is_broadcast_domain():
-                    subnet = subnet.next()
-                    child.subnet = subnet
-                    # ensures start at .1 rather than .0
-                    iterhosts = child.subnet.iter_hosts()
-                    sub_children = child.children()
-                    for sub_child in sorted(sub_children):
-                        if sub_child.is_interface():
-                            interface = sub_child.host
-                            if interface.is_physical:
-
-                                # physical interface
-
-                                sub_child.ip_address = iterhosts.next()
-                                sub_child.subnet = subnet
-                            elif interface.is_loopback \
-                                    and not interface.is_loopback_zero:
-
-                                # secondary loopback interface
-
-                                sub_child.ip_address = iterhosts.next()
-                                sub_child.subnet = subnet
-                        else:
-                            sub_child.subnet = iterhosts.next()
-
-                        #log.debug('Allocate sub_child to %s %s'% (sub_child, sub_child.subnet))
-                elif child.is_host():
-                    child.subnet = subnet.next()
-                elif child.is_loopback_group():
-                    child.subnet = subnet.next()
-                    # ensures start at .1 rather than .0
-                    iterhosts = child.subnet.iter_hosts()
-                    sub_children = child.children()
-                    for sub_child in sorted(sub_children):
-                        if sub_child.is_interface() \
-                                and not sub_child.host.is_loopback_zero:
-
-                           # secondary loopback
-
-                            sub_child.ip_address = iterhosts.next()
-                            sub_child.subnet = child.subnet
-                        else:
-                            sub_child.subnet = iterhosts.next()
-                else:
-                    child.subnet = subnet.next()
-                    allocate(child)  # continue down the tree
-
         global_root.subnet = global_ip_block
 
 # TODO: fix this workaround where referring to the wrong graph
 
         global_root_id = global_root.node
         global_root = TreeNode(global_graph, global_root_id)
-        allocate(global_root)
+        self.allocate(global_graph, global_root_id)
 
 # check for parentless nodes
 
         self.graph = global_graph
         self.root_node = global_root
 
+    def allocate(self, graph, root):
+        """Allocates subnets and addresses to the tree below root, from the
+        subnet set on root.
+
+        Each child of a tree node is allocated the next /(prefixlen + 1)
+        block of the tree node's subnet, and the hosts of broadcast domains
+        and loopback groups the next host address of their subnet. The prefix
+        arithmetic is done on integers, in lists indexed by tree node, and
+        the results are only converted to netaddr objects once allocated.
+        """
+
+        data = graph.node
+        positions = dict((node, index) for (index, node)
+                         in enumerate(graph))
+        subnets = [None] * len(positions)  # (first address, prefixlen)
+        addresses = [None] * len(positions)  # if allocated a host address
+        ip_addresses = [None] * len(positions)
+
+        def host(node):
+            return data[node].get('host')
+
+        def children(node):
+            return sorted(graph.successors(node), cmp=tree_node_cmp)
+
+        def tree_node_cmp(node_a, node_b):
+            # as TreeNode.__lt__: sort only tests for less than
+            host_a = host(node_a)
+            host_b = host(node_b)
+            if host_a and host_b:
+                return -1 if host_a < host_b else 1
+            return -1 if node_a < node_b else 1
+
+        def is_interface(node):
+            return isinstance(host(node), autonetkit.anm.NmPort)
+
+        def is_broadcast_domain(node):
+            return host(node) and host(node).broadcast_domain
+
+        def allocate_hosts(node, subnet, group):
+            """Allocates the host addresses of subnet to the children of
+            node, a broadcast domain or loopback group, or the root if a
+            single group"""
+            hosts = _iter_hosts(*subnet)
+            for sub_child in children(node):
+                index = positions[sub_child]
+                interface = host(sub_child)
+                if not is_interface(sub_child):
+                    addresses[index] = hosts.next()
+                elif group == "root":
+                    if interface.is_loopback:
+                        ip_addresses[index] = hosts.next()
+                        if not interface.is_loopback_zero:
+                            subnets[index] = subnet
+                    elif interface.is_physical:
+                        ip_addresses[index] = hosts.next()
+                        subnets[index] = subnet
+                    else:
+                        addresses[index] = hosts.next()
+                elif group == "broadcast_domain":
+                    if interface.is_physical or (interface.is_loopback
+                                                 and not
+                                                 interface.is_loopback_zero):
+                        ip_addresses[index] = hosts.next()
+                        subnets[index] = subnet
+                elif interface.is_loopback_zero:
+                    addresses[index] = hosts.next()
+                else:
+                    ip_addresses[index] = hosts.next()
+                    subnets[index] = subnet
+
+        root_subnet = data[root]['subnet']
+        subnets[positions[root]] = (root_subnet.first, root_subnet.prefixlen)
+        to_allocate = [root]
+        while to_allocate:
+            node = to_allocate.pop()
+            first, subnet_prefixlen = subnets[positions[node]]
+            prefixlen = data[node]['prefixlen'] + 1
+            blocks = _SubnetBlocks(first, subnet_prefixlen, prefixlen)
+
+            if data[node].get('loopback_group') or is_broadcast_domain(node):
+                # single group, eg single AS loopbacks
+                allocate_hosts(node, subnets[positions[node]], "root")
+                continue
+
+            for child in children(node):
+                index = positions[child]
+                if is_broadcast_domain(child):
+                    subnets[index] = (blocks.next(), prefixlen)
+                    blocks.unbounded = True
+                    allocate_hosts(child, subnets[index], "broadcast_domain")
+                elif host(child):
+                    subnets[index] = (blocks.next(), prefixlen)
+                elif data[child].get('loopback_group'):
+                    subnets[index] = (blocks.next(), prefixlen)
+                    allocate_hosts(child, subnets[index], "loopback_group")
+                else:
+                    subnets[index] = (blocks.next(), prefixlen)
+                    to_allocate.append(child)
+
+        # and store as netaddr objects, sharing as per the subnets allocated
+        networks = {subnets[positions[root]]: root_subnet}
+        for (node, index) in positions.items():
+            if subnets[index] is not None and node != root:
+                if subnets[index] not in networks:
+                    networks[subnets[index]] = netaddr.IPNetwork(
+                        subnets[index], version=4)
+                data[node]['subnet'] = networks[subnets[index]]
+            if addresses[index] is not None:
+                data[node]['subnet'] = netaddr.IPAddress(addresses[index], 4)
+            if ip_addresses[index] is not None:
+                data[node]['ip_address'] = netaddr.IPAddress(
+                    ip_addresses[index], 4)
+
     def group_allocations(self):
         allocs = {}
         for node in self:
@@ -620,27 +669,186 @@ def assign_asn_to_interasn_cds(g_ip, address_block=None):
     return
 
 
+def _domain_interfaces(broadcast_domain):
+    return sorted(edge.dst_int for edge in broadcast_domain.edges())
+
+
+def _record_infra(g_ip, broadcast_domains, section):
+    """Records the infrastructure allocations in the ledger section"""
+    section['groups'] = dict((str(asn), str(blocks[0])) for (asn, blocks)
+                             in g_ip.data.infra_blocks.items() if blocks)
+    section['domains'] = {}
+    for broadcast_domain in broadcast_domains:
+        if broadcast_domain.subnet is None:
+            continue
+        interfaces = _domain_interfaces(broadcast_domain)
+        key = ",".join(sorted(ip_ledger.interface_key(interface)
+                              for interface in interfaces))
+        section['domains'][key] = {
+            'subnet': str(broadcast_domain.subnet),
+            'interfaces': dict((ip_ledger.interface_key(interface),
+                                str(interface.ip_address))
+                               for interface in interfaces
+                               if interface.ip_address is not None),
+        }
+
+
+def _allocate_infra_from_ledger(g_ip, broadcast_domains, address_block,
+                                section, domain_slack=0):
+    """Allocates infrastructure subnets, keeping those in the ledger
+    section that still fit. Returns False if unable to, eg if an ASN's
+    block is full, without modifying g_ip"""
+
+    root_pool = ip_ledger.BlockPool(address_block)
+    groups = ip_ledger.group_pools(section, root_pool)
+    interfaces = dict((broadcast_domain,
+                       _domain_interfaces(broadcast_domain))
+                      for broadcast_domain in broadcast_domains)
+    if any(not interface.is_physical for domain_interfaces
+           in interfaces.values() for interface in domain_interfaces):
+        return False  # eg secondary loopbacks, allocated by the IpTree
+
+    keys = dict((broadcast_domain, [ip_ledger.interface_key(interface)
+                                    for interface in domain_interfaces])
+                for (broadcast_domain, domain_interfaces)
+                in interfaces.items())
+    previous = ip_ledger.match_domains(section.get('domains', {}), keys)
+
+    # keep previous subnets first, so new domains can't take their space
+    subnets = {}
+    for broadcast_domain in broadcast_domains:
+        entry = previous.get(broadcast_domain)
+        pool = groups.get(str(broadcast_domain.asn))
+        if entry is None or pool is None:
+            continue
+        subnet = netaddr.IPNetwork(entry['subnet'])
+        if subnet.size - 2 >= len(keys[broadcast_domain]) \
+                and pool.claim(subnet):
+            subnets[broadcast_domain] = subnet
+
+    for broadcast_domain in broadcast_domains:
+        if broadcast_domain in subnets:
+            continue
+        asn = str(broadcast_domain.asn)
+        if asn not in groups:
+            block = root_pool.allocate(16)  # as per IpTree
+            if block is None:
+                return False
+            groups[asn] = ip_ledger.BlockPool(block)
+        prefixlen = 32 - subnet_size(len(keys[broadcast_domain])
+                                     + domain_slack)
+        subnets[broadcast_domain] = groups[asn].allocate(prefixlen)
+        if subnets[broadcast_domain] is None:
+            return False
+
+    addresses = {}
+    for broadcast_domain in broadcast_domains:
+        subnet = subnets[broadcast_domain]
+        pool = ip_ledger.HostPool(subnet.first + 1, subnet.last - 1, 4)
+        entry = previous.get(broadcast_domain, {})
+        addresses[broadcast_domain] = ip_ledger.allocate_hosts(
+            pool, entry.get('interfaces', {}), keys[broadcast_domain])
+        if addresses[broadcast_domain] is None:
+            return False
+
+    for broadcast_domain in broadcast_domains:
+        subnet = subnets[broadcast_domain]
+        broadcast_domain.subnet = subnet
+        for interface in interfaces[broadcast_domain]:
+            key = ip_ledger.interface_key(interface)
+            interface.ip_address = addresses[broadcast_domain][key]
+            interface.subnet = subnet
+
+    asns = set(broadcast_domain.asn for broadcast_domain in broadcast_domains)
+    g_ip.data.infra_blocks = dict((asn, [groups[str(asn)].block])
+                                  for asn in asns)
+    return True
+
+
 def allocate_infra(g_ip, address_block=None):
     if not address_block:
         address_block = netaddr.IPNetwork('10.0.0.0/8')
     log.debug('Allocating v4 Infrastructure IPs')
-    ip_tree = IpTree(address_block)
+    (asn_slack, domain_slack) = ip_ledger.slack()
     assign_asn_to_interasn_cds(g_ip)
     nodes_to_allocate = sorted(n for n in g_ip.nodes('broadcast_domain')
         if n.allocate)
-    ip_tree.add_nodes(nodes_to_allocate)
-    ip_tree.build()
-
-    # cd_tree = ip_tree.json()
-
-    ip_tree.assign()
-
-    g_ip.data.infra_blocks = ip_tree.group_allocations()
-
-    # total_tree = { 'name': "ip", 'children': [cd_tree], }
-    # jsontree = json.dumps(total_tree, cls=autonetkit.ank_json.AnkEncoder, indent = 4)
 
-    g_ip.data.infra_blocks = ip_tree.group_allocations()
+    with ip_ledger.ledger_section("ipv4_infra", address_block) as section:
+        if section is not None and section.get('domains'):
+            if _allocate_infra_from_ledger(g_ip, nodes_to_allocate,
+                                           address_block, section,
+                                           domain_slack):
+                _record_infra(g_ip, nodes_to_allocate, section)
+                return
+            log.info("Unable to keep previous IPv4 infrastructure "
+                     "allocations, reallocating from %s" % address_block)
+
+        ip_tree = IpTree(address_block, asn_slack, domain_slack)
+        ip_tree.add_nodes(nodes_to_allocate)
+        ip_tree.build()
+
+        # cd_tree = ip_tree.json()
+
+        ip_tree.assign()
+
+        # total_tree = { 'name': "ip", 'children': [cd_tree], }
+        # jsontree = json.dumps(total_tree, cls=autonetkit.ank_json.AnkEncoder, indent = 4)
+
+        g_ip.data.infra_blocks = ip_tree.group_allocations()
+
+        if section is not None:
+            _record_infra(g_ip, nodes_to_allocate, section)
+
+
+def _record_loopbacks(g_ip, section):
+    """Records the loopback allocations in the ledger section"""
+    section['groups'] = dict((str(asn), str(blocks[0])) for (asn, blocks)
+                             in g_ip.data.loopback_blocks.items() if blocks)
+    section['hosts'] = dict((ip_ledger.node_key(node), str(node.loopback))
+                            for node in g_ip.l3devices()
+                            if node.loopback is not None)
+
+
+def _allocate_loopbacks_from_ledger(g_ip, address_block, section,
+                                    asn_slack=0):
+    """Allocates loopbacks, keeping those in the ledger section that still
+    fit. Returns False if unable to, without modifying g_ip"""
+
+    root_pool = ip_ledger.BlockPool(address_block)
+    groups = ip_ledger.group_pools(section, root_pool)
+    devices_by_asn = defaultdict(list)
+    for node in sorted(g_ip.l3devices()):
+        devices_by_asn[node.asn].append(node)
+
+    # new ASNs get blocks after those kept, so sort by if kept
+    asns = sorted(devices_by_asn, key=lambda asn: (str(asn) not in groups,
+                                                   asn))
+    loopbacks = {}
+    for asn in asns:
+        devices = devices_by_asn[asn]
+        if str(asn) not in groups:
+            prefixlen = 32 - subnet_size(len(devices) + asn_slack)
+            block = root_pool.allocate(prefixlen)
+            if block is None:
+                return False
+            groups[str(asn)] = ip_ledger.BlockPool(block)
+
+        block = groups[str(asn)].block
+        pool = ip_ledger.HostPool(block.first + 1, block.last - 1, 4)
+        hosts = ip_ledger.allocate_hosts(pool, section.get('hosts', {}),
+                                         [ip_ledger.node_key(node)
+                                          for node in devices])
+        if hosts is None:
+            return False
+        for node in devices:
+            loopbacks[node] = hosts[ip_ledger.node_key(node)]
+
+    for (node, loopback) in loopbacks.items():
+        node.loopback = loopback
+    g_ip.data.loopback_blocks = dict((asn, [groups[str(asn)].block])
+                                     for asn in asns)
+    return True
 
 
 # TODO: apply directly here
@@ -649,14 +857,29 @@ def allocate_loopbacks(g_ip, address_block=None):
     if not address_block:
         address_block = netaddr.IPNetwork('192.168.0.0/22')
     log.debug('Allocating v4 Primary Host loopback IPs')
-    ip_tree = IpTree(address_block)
-    ip_tree.add_nodes(sorted(g_ip.l3devices()))
-    ip_tree.build()
+    (asn_slack, _) = ip_ledger.slack()
+
+    with ip_ledger.ledger_section("ipv4_loopbacks",
+                                  address_block) as section:
+        if section is not None and section.get('hosts'):
+            if _allocate_loopbacks_from_ledger(g_ip, address_block, section,
+                                               asn_slack):
+                _record_loopbacks(g_ip, section)
+                return
+            log.info("Unable to keep previous IPv4 loopback allocations, "
+                     "reallocating from %s" % address_block)
 
-    # loopback_tree = ip_tree.json()
+        ip_tree = IpTree(address_block, asn_slack)
+        ip_tree.add_nodes(sorted(g_ip.l3devices()))
+        ip_tree.build()
 
-    ip_tree.assign()
-    g_ip.data.loopback_blocks = ip_tree.group_allocations()
+        # loopback_tree = ip_tree.json()
+
+        ip_tree.assign()
+        g_ip.data.loopback_blocks = ip_tree.group_allocations()
+
+        if section is not None:
+            _record_loopbacks(g_ip, section)
 
 
 def allocate_secondary_loopbacks(g_ip, address_block=None):
@@ -7,9 +7,7 @@ import autonetkit.ank_json
 import autonetkit.ank_messaging
 import autonetkit.log as log
 import netaddr
-
-# TODO: allow slack in allocations: both for ASN (group level), and for
-# collision domains to allow new nodes to be easily added
+from autonetkit.plugins import ip_ledger
 
 try:
     import cPickle as pickle
@@ -37,81 +35,265 @@ def assign_asn_to_interasn_cds(G_ip):
     return
 
 
-def allocate_loopbacks(g_ip, address_block=None):
-    # TODO: handle no block specified
-    loopback_blocks = {}
-    loopback_pool = address_block.subnet(80)
+def _root_pool(address_block):
+    """Returns a pool for the /80 blocks of address_block, skipping the
+    first, as for the network address"""
+    root_pool = ip_ledger.BlockPool(address_block)
+    root_pool.claim(address_block.subnet(80).next())
+    return root_pool
 
-    # consume the first address as it is the network address
-
-    _ = loopback_pool.next()  # network address
 
-    unique_asns = set(n.asn for n in g_ip)
-    for asn in sorted(unique_asns):
-        loopback_blocks[asn] = loopback_pool.next()
+def _host_pool(subnet):
+    """Returns a pool for the host addresses of subnet, skipping the first,
+    as the allocators below do"""
+    first = subnet.first + 1
+    if subnet.first == 0:
+        first += 1  # iter_hosts() doesn't return ::
+    return ip_ledger.HostPool(first, subnet.last, 6)
 
-    for (asn, devices) in g_ip.groupby('asn').items():
-        loopback_hosts = loopback_blocks[asn].iter_hosts()
-        # drop .0 as a host address (valid but can be confusing)
-        loopback_hosts.next()
-        l3hosts = set(d for d in devices if d.is_l3device())
-        for host in sorted(l3hosts, key=lambda x: x.label):
-            host.loopback = loopback_hosts.next()
 
-    g_ip.data.loopback_blocks = dict((asn, [subnet]) for (asn,
-                                                          subnet) in loopback_blocks.items())
+def _allocate_loopbacks_from_ledger(g_ip, address_block, section):
+    """Allocates loopbacks, keeping those in the ledger section that still
+    fit. Returns False if unable to, without modifying g_ip"""
 
+    root_pool = _root_pool(address_block)
+    groups = ip_ledger.group_pools(section, root_pool)
+    loopbacks = {}
+    loopback_blocks = {}
+    for (asn, devices) in sorted(g_ip.groupby('asn').items()):
+        if str(asn) not in groups:
+            block = root_pool.allocate(80)
+            if block is None:
+                return False
+            groups[str(asn)] = ip_ledger.BlockPool(block)
+        loopback_blocks[asn] = groups[str(asn)].block
+
+        l3hosts = sorted(set(d for d in devices if d.is_l3device()),
+                         key=lambda x: x.label)
+        hosts = ip_ledger.allocate_hosts(_host_pool(loopback_blocks[asn]),
+                                         section.get('hosts', {}),
+                                         [ip_ledger.node_key(host)
+                                          for host in l3hosts])
+        if hosts is None:
+            return False
+        for host in l3hosts:
+            loopbacks[host] = hosts[ip_ledger.node_key(host)]
+
+    for (host, loopback) in loopbacks.items():
+        host.loopback = loopback
+    g_ip.data.loopback_blocks = dict((asn, [block]) for (asn, block)
+                                     in loopback_blocks.items())
+    return True
+
+
+def _record_loopbacks(g_ip, section):
+    """Records the loopback allocations in the ledger section"""
+    section['groups'] = dict((str(asn), str(blocks[0])) for (asn, blocks)
+                             in g_ip.data.loopback_blocks.items())
+    section['hosts'] = dict((ip_ledger.node_key(node), str(node.loopback))
+                            for node in g_ip if node.is_l3device()
+                            and node.loopback is not None)
 
-def allocate_infra(g_ip, address_block=None):
-    infra_blocks = {}
 
-# TODO: check if need to do network address... possibly only for
-# loopback_pool and infra_pool so maps to asn
+def allocate_loopbacks(g_ip, address_block=None):
+    # TODO: handle no block specified
+    with ip_ledger.ledger_section("ipv6_loopbacks",
+                                  address_block) as section:
+        if section is not None and section.get('hosts'):
+            if _allocate_loopbacks_from_ledger(g_ip, address_block, section):
+                _record_loopbacks(g_ip, section)
+                return
+            log.info("Unable to keep previous IPv6 loopback allocations, "
+                     "reallocating from %s" % address_block)
 
-    infra_pool = address_block.subnet(80)
+        loopback_blocks = {}
+        loopback_pool = address_block.subnet(80)
 
-    # consume the first address as it is the network address
+        # consume the first address as it is the network address
 
-    _ = infra_pool.next()  # network address
+        _ = loopback_pool.next()  # network address
 
-    unique_asns = set(n.asn for n in g_ip)
-    for asn in sorted(unique_asns):
-        infra_blocks[asn] = infra_pool.next()
+        unique_asns = set(n.asn for n in g_ip)
+        for asn in sorted(unique_asns):
+            loopback_blocks[asn] = loopback_pool.next()
 
-    for (asn, devices) in sorted(g_ip.groupby('asn').items()):
-        subnets = infra_blocks[asn].subnet(96)
-        subnets.next()  # network address
-        ptp_subnet = subnets.next().subnet(126)
-        ptp_subnet.next()  # network address
-        all_bcs = set(d for d in devices if d.broadcast_domain
-            and d.allocate)
-        ptp_bcs = [bc for bc in all_bcs if bc.degree() == 2]
-
-        for bc in sorted(ptp_bcs):
-            subnet = ptp_subnet.next()
-            hosts = subnet.iter_hosts()
+        for (asn, devices) in g_ip.groupby('asn').items():
+            loopback_hosts = loopback_blocks[asn].iter_hosts()
             # drop .0 as a host address (valid but can be confusing)
-            hosts.next()
-            bc.subnet = subnet
-            # TODO: check: should sort by default on dst as tie-breaker
-            for edge in sorted(bc.edges(), key=lambda x: x.dst.label):
-                edge.ip = hosts.next()
+            loopback_hosts.next()
+            l3hosts = set(d for d in devices if d.is_l3device())
+            for host in sorted(l3hosts, key=lambda x: x.label):
+                host.loopback = loopback_hosts.next()
+
+        g_ip.data.loopback_blocks = dict((asn, [subnet]) for (asn,
+                                                              subnet) in loopback_blocks.items())
+
+        if section is not None:
+            _record_loopbacks(g_ip, section)
+
+
+def _infra_pools(block):
+    """Returns pools for the /96 subnets of an ASN's infrastructure block,
+    and the /126 subnets of its point-to-point block, skipping the first of
+    each, as for the network address"""
+    subnets = block.subnet(96)
+    pool = ip_ledger.BlockPool(block)
+    pool.claim(subnets.next())  # network address
+    ptp_block = subnets.next()
+    pool.claim(ptp_block)
+    ptp_pool = ip_ledger.BlockPool(ptp_block)
+    ptp_pool.claim(ptp_block.subnet(126).next())  # network address
+    return pool, ptp_pool
+
+
+def _domain_edges(broadcast_domain):
+    return sorted(broadcast_domain.edges(), key=lambda x: x.dst.label)
+
+
+def _allocate_infra_from_ledger(g_ip, address_block, section):
+    """Allocates infrastructure subnets, keeping those in the ledger
+    section that still fit. Returns False if unable to, without modifying
+    g_ip"""
+
+    root_pool = _root_pool(address_block)
+    groups = ip_ledger.group_pools(section, root_pool)
+    pools = {}
+    for asn in sorted(set(str(n.asn) for n in g_ip)):
+        if asn not in groups:
+            block = root_pool.allocate(80)
+            if block is None:
+                return False
+            groups[asn] = ip_ledger.BlockPool(block)
+        pools[asn] = _infra_pools(groups[asn].block)
+
+    broadcast_domains = sorted(d for d in g_ip if d.broadcast_domain
+                               and d.allocate)
+    edges = dict((bc, _domain_edges(bc)) for bc in broadcast_domains)
+    keys = dict((bc, [ip_ledger.interface_key(edge.dst_int)
+                      for edge in edges[bc]]) for bc in broadcast_domains)
+    previous = ip_ledger.match_domains(section.get('domains', {}), keys)
+
+    def pool_for(bc):
+        (pool, ptp_pool) = pools[str(bc.asn)]
+        if bc.degree() == 2:
+            return ptp_pool, 126
+        return pool, 96
+
+    # keep previous subnets first, so new domains can't take their space
+    subnets = {}
+    for bc in broadcast_domains:
+        if bc not in previous:
+            continue
+        subnet = netaddr.IPNetwork(previous[bc]['subnet'])
+        (pool, prefixlen) = pool_for(bc)
+        if subnet.prefixlen == prefixlen and pool.claim(subnet):
+            subnets[bc] = subnet
+
+    for bc in broadcast_domains:
+        if bc not in subnets:
+            (pool, prefixlen) = pool_for(bc)
+            subnets[bc] = pool.allocate(prefixlen)
+            if subnets[bc] is None:
+                return False
+
+    addresses = {}
+    for bc in broadcast_domains:
+        entry = previous.get(bc, {})
+        addresses[bc] = ip_ledger.allocate_hosts(
+            _host_pool(subnets[bc]), entry.get('interfaces', {}), keys[bc])
+        if addresses[bc] is None:
+            return False
+
+    for bc in broadcast_domains:
+        bc.subnet = subnets[bc]
+        for edge in edges[bc]:
+            edge.ip = addresses[bc][ip_ledger.interface_key(edge.dst_int)]
+
+    g_ip.data.infra_blocks = dict((n.asn, [groups[str(n.asn)].block])
+                                  for n in g_ip)
+    return True
+
+
+def _record_infra(g_ip, section):
+    """Records the infrastructure allocations in the ledger section"""
+    section['groups'] = dict((str(asn), str(blocks[0])) for (asn, blocks)
+                             in g_ip.data.infra_blocks.items())
+    section['domains'] = {}
+    for bc in g_ip:
+        if not (bc.broadcast_domain and bc.allocate) or bc.subnet is None:
+            continue
+        edges = _domain_edges(bc)
+        key = ",".join(sorted(ip_ledger.interface_key(edge.dst_int)
+                              for edge in edges))
+        section['domains'][key] = {
+            'subnet': str(bc.subnet),
+            'interfaces': dict((ip_ledger.interface_key(edge.dst_int),
+                                str(edge.ip)) for edge in edges
+                               if edge.ip is not None),
+        }
 
-        non_ptp_cds = all_bcs - set(ptp_bcs)
 
-        # break into /96 subnets
+def allocate_infra(g_ip, address_block=None):
+    with ip_ledger.ledger_section("ipv6_infra", address_block) as section:
+        if section is not None and section.get('domains'):
+            if _allocate_infra_from_ledger(g_ip, address_block, section):
+                _record_infra(g_ip, section)
+                return
+            log.info("Unable to keep previous IPv6 infrastructure "
+                     "allocations, reallocating from %s" % address_block)
 
-        for bc in sorted(non_ptp_cds):
-            subnet = subnets.next()
-            hosts = subnet.iter_hosts()
-            # drop .0 as a host address (valid but can be confusing)
-            hosts.next()
-            bc.subnet = subnet
-            for edge in sorted(bc.edges(), key=lambda x: x.dst.label):
-                edge.ip = hosts.next()
+        infra_blocks = {}
+
+# TODO: check if need to do network address... possibly only for
+# loopback_pool and infra_pool so maps to asn
 
-    g_ip.data.infra_blocks = dict((asn, [subnet]) for (asn, subnet) in
-                                  infra_blocks.items())
+        infra_pool = address_block.subnet(80)
+
+        # consume the first address as it is the network address
+
+        _ = infra_pool.next()  # network address
+
+        unique_asns = set(n.asn for n in g_ip)
+        for asn in sorted(unique_asns):
+            infra_blocks[asn] = infra_pool.next()
+
+        for (asn, devices) in sorted(g_ip.groupby('asn').items()):
+            subnets = infra_blocks[asn].subnet(96)
+            subnets.next()  # network address
+            ptp_subnet = subnets.next().subnet(126)
+            ptp_subnet.next()  # network address
+            all_bcs = set(d for d in devices if d.broadcast_domain
+                and d.allocate)
+            ptp_bcs = [bc for bc in all_bcs if bc.degree() == 2]
+
+            for bc in sorted(ptp_bcs):
+                subnet = ptp_subnet.next()
+                hosts = subnet.iter_hosts()
+                # drop .0 as a host address (valid but can be confusing)
+                hosts.next()
+                bc.subnet = subnet
+                # TODO: check: should sort by default on dst as tie-breaker
+                for edge in sorted(bc.edges(), key=lambda x: x.dst.label):
+                    edge.ip = hosts.next()
+
+            non_ptp_cds = all_bcs - set(ptp_bcs)
+
+            # break into /96 subnets
+
+            for bc in sorted(non_ptp_cds):
+                subnet = subnets.next()
+                hosts = subnet.iter_hosts()
+                # drop .0 as a host address (valid but can be confusing)
+                hosts.next()
+                bc.subnet = subnet
+                for edge in sorted(bc.edges(), key=lambda x: x.dst.label):
+                    edge.ip = hosts.next()
+
+        g_ip.data.infra_blocks = dict((asn, [subnet]) for (asn, subnet) in
+                                      infra_blocks.items())
+
+        if section is not None:
+            _record_infra(g_ip, section)
 
 
 def allocate_secondary_loopbacks(g_ip, address_block=None):
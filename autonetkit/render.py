@@ -1,8 +1,17 @@
 import fnmatch
+import hashlib
+import itertools
+import json
 import os
+import re
 import shutil
+import tarfile
 import time
+import zipfile
+from multiprocessing import Pool
+from StringIO import StringIO
 
+import autonetkit.config
 import autonetkit.log as log
 import mako
 import pkg_resources
@@ -19,15 +28,45 @@ def resource_path(relative):
     return pkg_resources.resource_filename(__name__, relative)
 
 # TODO: fix support here for template lookups, internal, user provided
-#template_cache_dir = config.template_cache_dir
-template_cache_dir = "cache"
+template_cache_dir = os.path.join(autonetkit.config.ank_user_dir,
+                                  "template_cache")
 
-# disable cache for cleaner folder structure
+
+def template_module_path(filename, uri=None):
+    """Returns the path of the compiled module for template filename in
+    the template cache, keyed on the template's path, mtime and content.
+    Returns None, to compile in memory, if the template_cache setting is
+    disabled or the cache directory is unavailable.
+    Used as the mako modulename_callable, so also accepts the uri"""
+    if not autonetkit.config.settings['General']['template_cache']:
+        return None
+
+    filename = os.path.abspath(filename)
+    try:
+        with open(filename, 'rb') as fh:
+            content = fh.read()
+        mtime = os.stat(filename).st_mtime
+    except (IOError, OSError):
+        return None  # let mako report the missing template
+
+    if not os.path.isdir(template_cache_dir):
+        try:
+            os.makedirs(template_cache_dir)
+        except OSError:
+            if not os.path.isdir(template_cache_dir):
+                log.debug("Unable to create template cache %s"
+                          % template_cache_dir)
+                return None  # not created by another process
+
+    key = hashlib.sha1("%s\0%r\0%s" % (filename, mtime, content))
+    name = re.sub(r"\W", "_", os.path.basename(filename))
+    return os.path.join(template_cache_dir,
+                        "%s_%s.py" % (name, key.hexdigest()))
 
 
 def initialise_lookup():
     retval = TemplateLookup(directories=[resource_path("")],
-                            #module_directory= template_cache_dir,
+                            modulename_callable=template_module_path,
                             cache_type='memory',
                             cache_enabled=True,
                             )
@@ -77,11 +116,398 @@ def format_version_banner():
 
     return version_banner
 
-# TODO: make a render class, that caches traversed folders for speed
+
+class RenderContext(object):
+
+    """Values shared by everything rendered in a run, computed once per
+    run rather than per node: the version banner, the date, the resolved
+    paths of package resources such as base folders, and whether static
+    files are deduplicated (default from the dedupe_static setting)"""
+
+    def __init__(self, version_banner=None, date=None, dedupe_static=None):
+        if version_banner is None:
+            version_banner = format_version_banner()
+        if date is None:
+            date = time.strftime("%Y-%m-%d %H:%M", time.localtime())
+        if dedupe_static is None:
+            dedupe_static = autonetkit.config.settings[
+                'General']['dedupe_static']
+        self.version_banner = version_banner
+        self.date = date
+        self.dedupe_static = dedupe_static
+        self._resource_paths = {}
+
+    def resource_path(self, relative):
+        if relative not in self._resource_paths:
+            self._resource_paths[relative] = resource_path(relative)
+        return self._resource_paths[relative]
+
+
+class ArchiveMember(StringIO):
+
+    """File-like buffer for one file, written to the archive on close"""
+
+    def __init__(self, archive, arcname):
+        StringIO.__init__(self)
+        self.archive = archive
+        self.arcname = arcname
+
+    def close(self):
+        if not self.closed:
+            self.archive.writestr(self.arcname, self.getvalue())
+        StringIO.close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RenderArchive(object):
+
+    """Sink that streams rendered files into a compressed tar (.tar.gz,
+    .tgz) or zip archive, instead of the filesystem. Each file is written
+    to the archive as it is rendered, so only one file is held in memory.
+    Files are named by their path, as they would be rendered to disk.
+    Has the writestr interface of zipfile.ZipFile, as used by render2.
+
+    If dedupe (default from the dedupe_static setting) is set, a tar
+    archive stores each static file, and each byte-identical output, once,
+    with later copies added as hard links to the first. Zip archives
+    don't support links, so are written in full"""
+
+    def __init__(self, filename, fileobj=None, format=None, dedupe=None):
+        self.filename = filename
+        if format is None:
+            format = "zip" if filename.endswith(".zip") else "tar"
+        if dedupe is None:
+            dedupe = autonetkit.config.settings['General']['dedupe_static']
+        self.format = format
+        self.dedupe = dedupe and format == "tar"
+        self._stored = {}  # file or content key: first arcname
+        if format == "zip":
+            self._archive = zipfile.ZipFile(fileobj or filename, mode='w',
+                                            compression=zipfile.ZIP_DEFLATED)
+        elif format == "tar":
+            # stream mode: written sequentially, without seeking
+            self._archive = tarfile.open(filename, mode='w|gz',
+                                         fileobj=fileobj)
+        else:
+            raise ValueError("Unsupported archive format %s" % format)
+
+    @staticmethod
+    def arcname(path):
+        return os.path.normpath(path).lstrip(os.sep)
+
+    def _link(self, key, arcname):
+        """Adds arcname as a hard link to the file previously stored with
+        key, returns success. Otherwise records arcname for key"""
+        if not self.dedupe:
+            return False
+        if key in self._stored:
+            info = tarfile.TarInfo(arcname)
+            info.type = tarfile.LNKTYPE
+            info.linkname = self._stored[key]
+            info.mtime = time.time()
+            info.mode = 0644
+            self._archive.addfile(info)
+            return True
+        self._stored[key] = arcname
+        return False
+
+    def writestr(self, arcname, data):
+        """Writes data to the file arcname"""
+        arcname = self.arcname(arcname)
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
+        if self._link(("data", hashlib.sha1(data).digest()), arcname):
+            return
+        if self.format == "zip":
+            info = zipfile.ZipInfo(arcname,
+                                   time.localtime(time.time())[:6])
+            info.external_attr = 0644 << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            self._archive.writestr(info, data)
+            return
+        info = tarfile.TarInfo(arcname)
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0644
+        self._archive.addfile(info, StringIO(data))
+
+    def write(self, filename, arcname):
+        """Copies the file filename from disk to arcname"""
+        arcname = self.arcname(arcname)
+        if self._link(("file", os.path.abspath(filename)), arcname):
+            return
+        if self.format == "zip":
+            self._archive.write(filename, arcname)
+        else:
+            self._archive.add(filename, arcname, recursive=False)
+
+    def mkdir(self, arcname):
+        """Adds the (possibly empty) folder arcname"""
+        arcname = self.arcname(arcname)
+        if self.format == "zip":
+            info = zipfile.ZipInfo(arcname + "/",
+                                   time.localtime(time.time())[:6])
+            info.external_attr = (040755 << 16) | 0x10  # MS-DOS directory
+            self._archive.writestr(info, "")
+            return
+        info = tarfile.TarInfo(arcname)
+        info.type = tarfile.DIRTYPE
+        info.mtime = time.time()
+        info.mode = 0755
+        self._archive.addfile(info)
+
+    def open(self, arcname):
+        """Returns a file-like object to write arcname"""
+        return ArchiveMember(self, arcname)
+
+    def close(self):
+        self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RecordingArchive(object):
+
+    """Records the writes to an archive, eg in a worker process, to replay
+    to the RenderArchive in the parent"""
+
+    def __init__(self):
+        self.entries = []
+
+    def writestr(self, arcname, data):
+        self.entries.append(("writestr", arcname, data))
+
+    def write(self, filename, arcname):
+        self.entries.append(("write", filename, arcname))
+
+    def mkdir(self, arcname):
+        self.entries.append(("mkdir", arcname))
+
+    def open(self, arcname):
+        return ArchiveMember(self, arcname)
+
+    def take(self):
+        """Returns and clears the writes recorded"""
+        retval = self.entries
+        self.entries = []
+        return retval
+
+    @staticmethod
+    def replay(entries, archive):
+        for entry in entries:
+            getattr(archive, entry[0])(*entry[1:])
+
+
+def output_file(filename, archive=None):
+    """Opens filename to write, in archive if set"""
+    if archive is None:
+        return open(filename, 'wb')
+    return archive.open(filename)
+
+
+class TemplateFolder(object):
+
+    """Base folder of static files and mako templates, walked and compiled
+    once, to render for each node using the folder.
+
+    If link_static is set, the static files are copied for the first node,
+    and hard linked to those copies for later nodes, so the disk space
+    used doesn't grow with the number of nodes. The linked files are
+    shared, so editing one in place edits it for every node"""
+
+    def __init__(self, path, link_static=False):
+        self.path = path
+        self.link_static = link_static
+        self._copies = {}  # static file: first copy
+        self.folders = []  # relative to path
+        self.files = []
+        self.templates = []  # (relative path, compiled template)
+        fingerprint = hashlib.sha1()
+        for root, dirnames, filenames in os.walk(path):
+            rel_root = os.path.relpath(root, path)
+            for dirname in dirnames:
+                self.folders.append(os.path.join(rel_root, dirname))
+            for filename in filenames:
+                rel_path = os.path.normpath(os.path.join(rel_root, filename))
+                with open(os.path.join(path, rel_path), 'rb') as fh:
+                    fingerprint.update("%s\0%s\0" % (rel_path, fh.read()))
+                if fnmatch.fnmatch(filename, '*.mako'):
+                    template_file = os.path.join(path, rel_path)
+                    template = mako.template.Template(
+                        filename=template_file,
+                        module_filename=template_module_path(template_file))
+                    self.templates.append((rel_path, template))
+                else:
+                    self.files.append(rel_path)
+        # identifies the folder contents, for the render manifest
+        self.fingerprint = fingerprint.hexdigest()
+
+    def copy(self, dst_folder):
+        """Replaces dst_folder with a copy of the static files"""
+        try:
+            shutil.rmtree(dst_folder)
+        except OSError:
+            pass  # doesn't exist
+        os.makedirs(dst_folder)
+        for folder in self.folders:
+            os.makedirs(os.path.join(dst_folder, folder))
+        for filename in self.files:
+            dst_file = os.path.join(dst_folder, filename)
+            if self.link_static and self.link(filename, dst_file):
+                continue
+            shutil.copy2(os.path.join(self.path, filename), dst_file)
+            if self.link_static:
+                self._copies[filename] = dst_file
+        for folder in reversed(self.folders):
+            shutil.copystat(os.path.join(self.path, folder),
+                            os.path.join(dst_folder, folder))
+        shutil.copystat(self.path, dst_folder)
+
+    def link(self, filename, dst_file):
+        """Hard links dst_file to the first copy of the static file
+        filename, returns success"""
+        if filename not in self._copies:
+            return False
+        try:
+            os.link(self._copies[filename], dst_file)
+        except (AttributeError, OSError):
+            # eg first copy removed, or links unsupported by the platform
+            # or across filesystems
+            del self._copies[filename]
+            return False
+        return True
+
+    def add_to(self, archive, dst_folder):
+        """Adds the folders and static files to archive, under dst_folder"""
+        archive.mkdir(dst_folder)
+        for folder in self.folders:
+            archive.mkdir(os.path.join(dst_folder, folder))
+        for filename in self.files:
+            archive.write(os.path.join(self.path, filename),
+                          os.path.join(dst_folder, filename))
+
+    def render(self, dst_folder, archive=None, **kwargs):
+        """Copies the static files to dst_folder, and renders the
+        templates with kwargs. Written to archive instead, if set"""
+        if archive is None:
+            self.copy(dst_folder)
+        else:
+            self.add_to(archive, dst_folder)
+        for template_file, template in self.templates:
+            dst_file = os.path.normpath(os.path.join(dst_folder,
+                                                     template_file))
+            dst_file, _ = os.path.splitext(dst_file)  # remove .mako suffix
+            with output_file(dst_file, archive) as dst_fh:
+                dst_fh.write(template.render(**kwargs))
+
+
+class RenderManifest(object):
+
+    """Fingerprints of the files and folders rendered by the previous run,
+    stored in a JSON file, to skip rendering outputs whose inputs are
+    unchanged. An output's fingerprint combines the node's compiled data,
+    the template (or base folder) content and the version banner"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.previous = {}
+        self.current = {}
+        self.rendered = 0
+        self.skipped = 0
+        self._template_hashes = {}
+        if os.path.isfile(filename):
+            try:
+                with open(filename) as fh:
+                    self.previous = json.load(fh)
+            except ValueError:
+                log.warning("Unable to read render manifest %s, "
+                            "rendering all configurations" % filename)
+
+    def template_hash(self, template):
+        """Returns the hash of a compiled template's source file"""
+        filename = template.filename
+        if filename not in self._template_hashes:
+            with open(filename, 'rb') as fh:
+                self._template_hashes[filename] = hashlib.sha1(
+                    fh.read()).hexdigest()
+        return self._template_hashes[filename]
+
+    @staticmethod
+    def node_fingerprint(node, version_banner):
+        import autonetkit.ank_json
+        data = json.dumps(node._node_data, cls=autonetkit.ank_json.AnkEncoder,
+                          sort_keys=True)
+        return hashlib.sha1("%s\0%s" % (version_banner, data)).hexdigest()
+
+    @staticmethod
+    def fingerprint(node_fingerprint, template_fingerprint):
+        return hashlib.sha1("%s\0%s" % (node_fingerprint,
+                                        template_fingerprint)).hexdigest()
+
+    def is_current(self, dst, fingerprint):
+        """Returns if dst exists, and was rendered with the same
+        fingerprint by the previous run, recording it as skipped"""
+        dst = os.path.normpath(dst)
+        if self.previous.get(dst) == fingerprint and os.path.exists(dst):
+            self.current[dst] = fingerprint
+            self.skipped += 1
+            return True
+        return False
+
+    def add(self, dst, fingerprint):
+        self.current[os.path.normpath(dst)] = fingerprint
+        self.rendered += 1
+
+    def take(self):
+        """Returns and clears the outputs and counts recorded, eg to merge
+        from a worker process"""
+        retval = (self.current, self.rendered, self.skipped)
+        self.current = {}
+        self.rendered = self.skipped = 0
+        return retval
+
+    def merge(self, state):
+        current, rendered, skipped = state
+        self.current.update(current)
+        self.rendered += rendered
+        self.skipped += skipped
+
+    def save(self):
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.filename, "w") as fh:
+            json.dump(self.current, fh, indent=4, sort_keys=True)
+
+
+def template_folder(render_base, template_folders=None, context=None):
+    """Returns the TemplateFolder for render_base, from template_folders
+    (keyed by render_base) if set. The path is resolved by context (a
+    RenderContext) if set"""
+    if context is None:
+        path = resource_path(render_base)
+        link_static = False
+    else:
+        path = context.resource_path(render_base)
+        link_static = context.dedupe_static
+    if template_folders is None:
+        return TemplateFolder(path, link_static)
+    if render_base not in template_folders:
+        template_folders[render_base] = TemplateFolder(path, link_static)
+    return template_folders[render_base]
 
 
 def render_inline(node, render_template_file, to_memory=True,
-                  render_dst_file=None):
+                  render_dst_file=None, context=None):
     """Generic rendering of a node attribute rather than the standard location.
     Needs to be called by render_node.
     Doesn't support base folders - only single attributes.
@@ -89,9 +515,11 @@ def render_inline(node, render_template_file, to_memory=True,
     """
 
     node.log.debug("Rendering template %s" % (render_template_file))
-    version_banner = format_version_banner()
+    if context is None:
+        context = RenderContext()
+    version_banner = context.version_banner
 
-    date = time.strftime("%Y-%m-%d %H:%M", time.localtime())
+    date = context.date
 
     if render_template_file:
         try:
@@ -116,7 +544,14 @@ def render_inline(node, render_template_file, to_memory=True,
 # servers)
 
 
-def render_node(node):
+def render_node(node, template_folders=None, manifest=None, archive=None,
+                context=None):
+    """Renders node. template_folders caches the base folders across
+    nodes, see template_folder. If manifest (a RenderManifest) is set,
+    files and folders unchanged since the previous run aren't rendered.
+    If archive (eg a RenderArchive) is set, files are written to it,
+    rather than to the filesystem. context (a RenderContext) holds the
+    values shared by the nodes of a run, created for the node if None"""
     if not node.do_render:
         node.log.debug("Rendering disabled for node")
         return
@@ -132,15 +567,22 @@ def render_node(node):
         # TODO: make sure allows case of just custom render
         return
 
-    version_banner = format_version_banner()
+    if context is None:
+        context = RenderContext()
+    version_banner = context.version_banner
 
-    date = time.strftime("%Y-%m-%d %H:%M", time.localtime())
+    date = context.date
     if render_custom:
         # print render_custom
         pass
 
+    node_fingerprint = None
+    if manifest is not None:
+        node_fingerprint = manifest.node_fingerprint(node, version_banner)
+
 # TODO: make sure is an abspath here so don't wipe user directory!!!
-    if render_output_dir and not os.path.isdir(render_output_dir):
+    if (archive is None and render_output_dir
+            and not os.path.isdir(render_output_dir)):
         try:
             os.makedirs(render_output_dir)
         except OSError, e:
@@ -158,9 +600,17 @@ def render_node(node):
                         "Syntax error in template: %s" % (node, error))
             return
 
+        dst_file = fingerprint = None
         if node.render.dst_file:
             dst_file = os.path.join(render_output_dir, node.render.dst_file)
-            with open(dst_file, 'wb') as dst_fh:
+        if dst_file and manifest is not None:
+            fingerprint = manifest.fingerprint(
+                node_fingerprint, manifest.template_hash(render_template))
+            if manifest.is_current(dst_file, fingerprint):
+                dst_file = None  # unchanged since the previous run
+
+        if dst_file:
+            with output_file(dst_file, archive) as dst_fh:
                 try:
                     dst_fh.write(render_template.render(
                         node=node,
@@ -183,6 +633,9 @@ def render_node(node):
                     log.warning("Unable to render %s: %s." % (node, error))
                     from mako import exceptions
                     log.debug(exceptions.text_error_template().render())
+                else:
+                    if fingerprint is not None:
+                        manifest.add(dst_file, fingerprint)
 
         if node.render.to_memory:
             # Render directly to DeviceModel
@@ -193,60 +646,158 @@ def render_node(node):
             )
 
     if render_base:
-        # TODO: revert to shutil copy
-        if render_base:
-            render_base = resource_path(render_base)
-            fs_mako_templates = []
-            for root, _, filenames in os.walk(render_base):
-                for filename in fnmatch.filter(filenames, '*.mako'):
-                    # relative to fs root
-                    rel_root = os.path.relpath(root, render_base)
-                    fs_mako_templates.append(os.path.join(rel_root, filename))
-
-            try:
-                shutil.rmtree(render_base_output_dir)
-            except OSError:
-                pass  # doesn't exist
-            shutil.copytree(render_base, render_base_output_dir,
-                            ignore=shutil.ignore_patterns('*.mako'))
-            for template_file in fs_mako_templates:
-                template_file_path = os.path.normpath(
-                    os.path.join(render_base, template_file))
-                mytemplate = mako.template.Template(filename=template_file_path,
-                                                    )
-                dst_file = os.path.normpath(
-                    (os.path.join(render_base_output_dir, template_file)))
-                dst_file, _ = os.path.splitext(dst_file)  # remove .mako suffix
-                with open(dst_file, 'wb') as dst_fh:
-                    dst_fh.write(mytemplate.render(
-                        node=node,
-                        version_banner=version_banner,
-                        date=date,
-                    ))
+        folder = template_folder(render_base, template_folders, context)
+        fingerprint = None
+        if manifest is not None:
+            fingerprint = manifest.fingerprint(node_fingerprint,
+                                               folder.fingerprint)
+            if manifest.is_current(render_base_output_dir, fingerprint):
+                return  # unchanged since the previous run
+
+        folder.render(render_base_output_dir, archive=archive, node=node,
+                      version_banner=version_banner, date=date)
+        if fingerprint is not None:
+            manifest.add(render_base_output_dir, fingerprint)
         return
 
 
-def render(nidb):
-    # TODO: config option for single or multi threaded
+def render(nidb, workers=None, archive=None):
+    """Renders the nodes and topologies of nidb, to archive (eg a
+    RenderArchive) if set, otherwise to the filesystem"""
     log.debug("Rendering Configuration Files")
-    render_single(nidb)
-    render_topologies(nidb)
+    context = RenderContext()
+    render_single(nidb, workers, archive, context)
+    render_topologies(nidb, archive, context)
 
 
-def render_single(nidb):
-    for node in sorted(nidb):
-        render_node(node)
+_job = None  # function to map, inherited by forked workers
 
 
-def render_topologies(nidb):
+def _call_job(item):
+    return _job(item)
+
+
+def imap_forked(func, items, processes):
+    """Yields func(item) for item in items, in order, using a pool of
+    processes forked from this one, so func and the data it uses needn't
+    be picklable, only the items and results. Results are yielded as they
+    are returned, rather than held until all items are done"""
+    global _job
+    items = list(items)
+    processes = min(processes, len(items))
+    if processes <= 1 or not hasattr(os, "fork"):
+        for item in items:
+            yield func(item)
+        return
+
+    _job = func
+    pool = Pool(processes)
+    try:
+        chunksize = max(1, len(items) // (processes * 4))
+        for result in pool.imap(_call_job, items, chunksize):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+        _job = None
+
+
+def map_forked(func, items, processes):
+    """Returns [func(item) for item in items], see imap_forked"""
+    return list(imap_forked(func, items, processes))
+
+
+def render_single(nidb, workers=None, archive=None, context=None):
+    """Renders each node, across workers processes (default from the
+    render_workers setting) if > 1, to archive if set"""
+    settings = autonetkit.config.settings['General']
+    if workers is None:
+        workers = settings['render_workers']
+    if context is None:
+        context = RenderContext()
+
+    manifest = None
+    if settings['incremental_render'] and archive is None:
+        # an archive is written from scratch, so nothing can be skipped
+        manifest = RenderManifest(settings['render_manifest'])
+
+    nodes = sorted(nidb)
+    template_folders = {}
+    if workers <= 1:
+        for node in nodes:
+            render_node(node, template_folders, manifest, archive, context)
+    else:
+        render_forked(nodes, template_folders, manifest, workers, archive,
+                      context)
+
+    if manifest is not None:
+        manifest.save()
+        log.info("Rendered %s configurations, skipped %s unchanged"
+                 % (manifest.rendered, manifest.skipped))
+
+
+def render_forked(nodes, template_folders, manifest, workers,
+                  archive=None, context=None):
+    """Renders nodes across workers forked processes. Files for archive
+    are recorded by the workers, and written to it by this process as
+    each node's results are returned"""
+    # walk and compile templates before forking, to share with the workers
+    if context is None:
+        context = RenderContext()
+    for node in nodes:
+        if not node.do_render or not node.render:
+            continue
+        if node.render.base:
+            template_folder(node.render.base, template_folders, context)
+        if node.render.template:
+            try:
+                TEMPLATE_LOOKUP.get_template(node.render.template)
+            except SyntaxException:
+                pass  # warned when rendering the node
+
+    recording = None
+    if archive is not None:
+        recording = RecordingArchive()
+
+    def render_in_worker(index):
+        node = nodes[index]
+        render_node(node, template_folders, manifest, recording, context)
+        output = manifest_state = entries = None
+        if node.do_render and node.render and node.render.to_memory:
+            output = node.render.render_output
+        if manifest is not None:
+            manifest_state = manifest.take()
+        if recording is not None:
+            entries = recording.take()
+        return output, manifest_state, entries
+
+    log.debug("Rendering %s nodes using %s processes"
+              % (len(nodes), workers))
+    results = imap_forked(render_in_worker, range(len(nodes)), workers)
+    for node, result in itertools.izip(nodes, results):
+        output, manifest_state, entries = result
+        if output is not None:
+            # rendered to memory in the worker
+            node.render.render_output = output
+        if manifest_state is not None:
+            manifest.merge(manifest_state)
+        if entries is not None:
+            RecordingArchive.replay(entries, archive)
+
+
+def render_topologies(nidb, archive=None, context=None):
+    if context is None:
+        context = RenderContext()
     for topology in nidb.topologies():
-        render_topology(topology)
+        render_topology(topology, archive, context)
 
 
-def render_topology(topology):
-    version_banner = format_version_banner()
+def render_topology(topology, archive=None, context=None):
+    if context is None:
+        context = RenderContext()
+    version_banner = context.version_banner
 
-    date = time.strftime("%Y-%m-%d %H:%M", time.localtime())
+    date = context.date
     try:
         render_output_dir = topology.render_dst_folder
         render_template_file = topology.render_template
@@ -265,7 +816,7 @@ def render_topology(topology):
             "Unable to render %s: Syntax error in template: %s" % (topology, error))
         return
 
-    if not os.path.isdir(render_output_dir):
+    if archive is None and not os.path.isdir(render_output_dir):
         try:
             os.makedirs(render_output_dir)
         except OSError, e:
@@ -281,7 +832,7 @@ def render_topology(topology):
 
     # TODO: capture mako errors better
 
-    with open(dst_file, 'wb') as dst_fh:
+    with output_file(dst_file, archive) as dst_fh:
         try:
             dst_fh.write(render_template.render(
                 topology=topology,
@@ -1,5 +1,7 @@
 from collections import defaultdict
+import itertools
 import os
+import autonetkit.config
 import autonetkit.log as log
 
 
@@ -118,9 +120,16 @@ class MakoRenderer(object):
         # be required though)
         pass
 
-    def prepare(self, template_data):
+    def prepare(self, template_data, filename=None):
+        """Compiles template_data, or the template at filename, using the
+        compiled template cache"""
         from mako.template import Template
-        return Template(template_data)
+        if filename is None:
+            return Template(template_data)
+        import autonetkit.render
+        return Template(filename=filename,
+                        module_filename=autonetkit.render.template_module_path(
+                            filename))
 
     def render(self, template, node, version_banner, date, template_data=None):
         if template_data is None:
@@ -172,153 +181,146 @@ def get_folder_contents(folder):
 extension_renderers = {'.mako': MakoRenderer()}
 
 
+def render_context():
+    """Returns the autonetkit.render.RenderContext for a render run"""
+    import autonetkit.render
+    import pkg_resources
+    version_banner = ("autonetkit_%s" %
+                      pkg_resources.get_distribution("autonetkit").version)
+    return autonetkit.render.RenderContext(version_banner=version_banner)
+
+
+def prepare_file(src, context=None):
+    """Returns (template_renderer, template) for the template file src"""
+    if context is None:
+        context = render_context()
+    filename = os.path.join(*src)  # "splat" list for os.path.join
+    # TODO: specify the full file path (or provide wrapper for this to
+    # specify the package)
+    abs_filename = context.resource_path(filename)
+
+    # TODO: Only do the following for .mako
+    extension = os.path.splitext(filename)[1]
+    template_renderer = extension_renderers[extension]
+    return template_renderer, template_renderer.prepare(
+        None, filename=abs_filename)
+
+
+def prepare_folder(src, context=None):
+    """Returns [(out_filename, template_renderer, template or file data)]
+    for the files in folder src, with template_renderer None for static
+    files. Walks the folder and prepares its templates once, to render for
+    each node using the folder"""
+    if context is None:
+        context = render_context()
+    src_folder = os.path.join(*src)  # "splat" list for os.path.join
+    abs_folder = context.resource_path(src_folder)
+    retval = []
+    # get structure of each folder
+    for filename in get_folder_contents(abs_folder):
+        out_filename = filename
+        abs_filename = os.path.join(abs_folder, filename)
+
+        extension = os.path.splitext(filename)[1]
+        if extension in extension_renderers:
+            template_renderer = extension_renderers[extension]
+            # and strip extension from output file
+            out_filename = out_filename[:-len(extension)]
+            retval.append((out_filename, template_renderer,
+                           template_renderer.prepare(None,
+                                                     filename=abs_filename)))
+        else:
+            with open(abs_filename) as fh:
+                file_data = fh.read()
+            retval.append((out_filename, None, file_data))
+
+    return retval
+
+
 def render_nodes(nodes, base_folder="",
-                 archive=None):
+                 archive=None, workers=None, context=None):
+    """Renders the files and folders of nodes, to the node if archive is
+    None, otherwise to archive (eg an autonetkit.render.RenderArchive),
+    as each node is rendered. Nodes are rendered across workers
+    processes (default from the render_workers setting) if > 1.
+    context is the RenderContext of the run, see render_context"""
+    import autonetkit.render
 
     if archive is None:
         to_memory = True
     else:
         to_memory = False
 
-    # extracts common paths from the nodes
-    # first build up list of all paths
-    common_files = defaultdict(list)
-    common_folders = defaultdict(list)
+    if workers is None:
+        workers = autonetkit.config.settings['General']['render_workers']
+    if context is None:
+        context = render_context()
 
     if isinstance(base_folder, basestring):
         pass
     else:
         base_folder = os.path.join(*base_folder)
 
-    # store destinations
-    file_dsts = defaultdict(dict)
-    folder_dsts = defaultdict(dict)
-
+    # walk each folder, and prepare each template, once for all nodes
+    # TODO: need to iterate over all passes
+    nodes = list(nodes)
+    folders = {}
+    files = {}
     for node in nodes:
-        # print node.render2.get_pass()
-        # TODO: need to iterate over all passes
+        for path in node.render2.get_folders():
+            src = tuple(path.src)
+            if src not in folders:
+                folders[src] = prepare_folder(src, context)
         for path in node.render2.get_files():
             src = tuple(path.src)
-            common_files[src].append(node)
-            file_dsts[node][src] = path.dst
-        # TODO: need to skip templates..... defined programatically in mapping
-        # TODO: probably need to make a render class for this...
+            if src not in files:
+                files[src] = prepare_file(src, context)
+
+    version_banner = context.version_banner
+    date = context.date
+
+    def render_node_files(index):
+        """Returns [(dst, data)] for the node at index"""
+        node = nodes[index]
+        retval = []
+        # TODO: do folders first so more specific precedence over less
+        # specific in case of a clash (like in routing)
         for path in node.render2.get_folders():
-            src = tuple(path.src)
-            common_folders[src].append(node)
-            folder_dsts[node][src] = path.dst
-
-    # print common_files
-    # print common_folders
-
-    # load common files into cache
-    # TODO: no cache now do file-by-file
-    # TODO: do folders first so more specific precedence over less specific
-    # in case of a clash (like in routing)
-
-    # Prepare static classes for extensions
-
-    # TODO: fix up naming
-    for src_base, nodes in common_folders.items():
-        src_folder = os.path.join(*src_base)  # "splat" list for os.path.join
-        import pkg_resources
-        src_path = pkg_resources.resource_filename(__name__, src_folder)
-        # get structure of each folder
-        contents = get_folder_contents(src_path)
-        # TODO: treat per-file the same as for files below
-        # TODO: could optimise so that if clobber, don't render previous
-        # (unlikely to occur though)
-        for filename in contents:
-            out_filename = filename
-            abs_filename = os.path.join(src_folder, filename)
-            abs_filename = pkg_resources.resource_filename(
-                __name__, abs_filename)
-            with open(abs_filename) as fh:
-                file_data = fh.read()
-
-            template_renderer = None
-            extension = os.path.splitext(filename)[1]
-            if extension in extension_renderers:
-                template_renderer = extension_renderers[extension]
-
-                # and strip extension from output file
-                out_filename = out_filename[:-len(extension)]
-
-                import time
-                version_banner = ("autonetkit_%s" %
-                                  pkg_resources.get_distribution("autonetkit").version)
-                date = time.strftime("%Y-%m-%d %H:%M", time.localtime())
-                render_template = template_renderer.prepare(file_data)
-
-            for node in nodes:
-                # node_data = template_renderer.render(render_template,
-                 # node, version_banner, date)
+            dst = path.dst
+            if isinstance(dst, basestring):
+                pass
+            else:
+                dst = os.path.join(*dst)
+            dst = os.path.join(base_folder, dst)
+            entries = folders[tuple(path.src)]
+            for out_filename, template_renderer, template in entries:
                 if template_renderer:
-                    node_data = template_renderer.render(render_template,
-                                                         node, version_banner, date)
-                else:
-                    node_data = file_data
-
-                # to memory -> store
-
-                dst = folder_dsts[node][src_base]
-                if isinstance(dst, basestring):
-                    pass
+                    node_data = template_renderer.render(
+                        template, node, version_banner, date)
                 else:
-                    dst = os.path.join(*dst)
-                dst = os.path.join(dst, out_filename)
-                dst = os.path.join(base_folder, dst)
-
-                # else to file
-                if to_memory:
-                    node.set(dst, node_data)
-                else:
-                    archive.writestr(dst, node_data)
-
-    for src, nodes in common_files.items():
-        # TODO: write this to a separate function
-        filename = os.path.join(*src)  # "splat" list for os.path.join
-        import pkg_resources
-        # TODO: specify the full file path (or provide wrapper for this to
-        # specify the package)
-        abs_filename = pkg_resources.resource_filename(__name__, filename)
-        with open(abs_filename) as fh:
-            file_data = fh.read()
-
-        # TODO: Only do the following for .mako
-        extension = os.path.splitext(filename)[1]
-        template_renderer = extension_renderers[extension]
-
-        import time
-        version_banner = ("autonetkit_%s" %
-                          pkg_resources.get_distribution("autonetkit").version)
-        date = time.strftime("%Y-%m-%d %H:%M", time.localtime())
-        render_template = template_renderer.prepare(file_data)
-
-        # get extension
-
-        for node in nodes:
-            node_data = template_renderer.render(render_template,
-                                                 node, version_banner, date)
+                    node_data = template  # static file
+                retval.append((os.path.join(dst, out_filename), node_data))
 
+        for path in node.render2.get_files():
+            dst = os.path.join(base_folder, path.dst)
+            template_renderer, template = files[tuple(path.src)]
+            node_data = template_renderer.render(
+                template, node, version_banner, date)
+            retval.append((dst, node_data))
+        return retval
+
+    results = autonetkit.render.imap_forked(render_node_files,
+                                            range(len(nodes)), workers)
+    for node, node_results in itertools.izip(nodes, results):
+        for dst, node_data in node_results:
             # to memory -> store
-            dst = file_dsts[node][src]
-            dst = os.path.join(base_folder, dst)
-
-            # else to file
             if to_memory:
                 node.set(dst, node_data)
             else:
                 archive.writestr(dst, node_data)
 
-    # TODO: to save memory could process for each node that has this file, etc?
-    # then write that to the archive, and continue on
-    # eg file by file rather than node by node?
-
     # TODO: if a file is greater than a certain size dont cache in memory
 
-    # TODO: alternative would be to cache on the fly as seen, but this could s
-    # another alternative is to cache if seen for second time?
 
 # note: may want "platform render data" and a "platform renderer"
 
@@ -327,29 +329,35 @@ def render_nodes(nodes, base_folder="",
 # note that we don't have as much need to do caching as much less
 # topologies than node
 
-def render_topology(topology):
-    """Pre-caches"""
+def render_topology(topology, archive=None, context=None):
+    """Pre-caches. Renders to archive if set, otherwise to the archive
+    named by the topology, or to memory"""
     # TODO: also need to render the topology template eg lab.conf
+    if context is None:
+        context = render_context()
 
     render_data = topology.render2
     base_folder = render_data.base_folder
 
     archive_filename = render_data.archive
-    archive = None
+    close_archive = False
     to_memory = True
-    if archive_filename:
+    if archive is not None:
         to_memory = False
-        import zipfile
+    elif archive_filename:
+        to_memory = False
+        import autonetkit.render
         archive_filename = "%s.zip" % archive_filename
         # TODO: make rendered folder set in config, and check exists
         archive_path = os.path.join("rendered", archive_filename)
-        # TODO: look at compression levels
-        archive = zipfile.ZipFile(archive_path, mode='w')
+        archive = autonetkit.render.RenderArchive(archive_path)
+        close_archive = True
 
     nodes = render_data.nodes
     render_nodes(nodes,
                  archive=archive,
-                 base_folder=base_folder)
+                 base_folder=base_folder,
+                 context=context)
 
     if isinstance(base_folder, basestring):
         pass
@@ -359,25 +367,12 @@ def render_topology(topology):
     for entry in render_data.get_files():
         src = entry.src
         dst = entry.dst
-    # TODO: write this to a separate function
         filename = os.path.join(*src)  # "splat" list for os.path.join
         print filename
-        import pkg_resources
-        # TODO: specify the full file path (or provide wrapper for this to
-        # specify the package)
-        abs_filename = pkg_resources.resource_filename(__name__, filename)
-        with open(abs_filename) as fh:
-            file_data = fh.read()
-
-        # TODO: Only do the following for .mako
-        extension = os.path.splitext(filename)[1]
-        template_renderer = extension_renderers[extension]
+        template_renderer, render_template = prepare_file(src, context)
 
-        import time
-        version_banner = ("autonetkit_%s" %
-                          pkg_resources.get_distribution("autonetkit").version)
-        date = time.strftime("%Y-%m-%d %H:%M", time.localtime())
-        render_template = template_renderer.prepare(file_data)
+        version_banner = context.version_banner
+        date = context.date
 
         # get extension
         # TODO: clean up placeholder for node renderer
@@ -402,15 +397,16 @@ def render_topology(topology):
 
     # render files
 
-    if archive:
+    if close_archive:
         archive.close()
 
     # warn if any folders that not supported yet for topologies
 
 
-def render(nidb):
+def render(nidb, archive=None):
     log.info("Rendering v2")
     # TODO: should allow render to take list of nodes in case different namespace
     # perhaps allow render to take list of topologies/nodes to render?
+    context = render_context()
     for topology in nidb.topologies():
-        render_topology(topology)
+        render_topology(topology, archive, context)
@@ -0,0 +1,153 @@
+"""Delta updates of topologies published to the visualisation server.
+
+A published topology is {overlay_id: node-link data}, as ank_json.dumps.
+Rather than re-sending all of it on each publish, update_vis sends the
+overlays, nodes and links that changed since its last publish for the
+uuid, and the webserver's AnkAccessor applies them to its stored copy.
+
+Nodes are keyed by id, and links by [source id, target id, n], where n
+counts the earlier links between the same nodes (for multigraphs). Links
+are sent with source and target ids, rather than node-link indices. A
+delta is:
+
+    {"base": version it applies to, "" for the empty topology,
+     "version": version it creates,
+     "removed": [overlay_id],
+     "overlays": {overlay_id: {
+         "graph": {"directed": .., "multigraph": .., "graph": ..},
+         "nodes": [node data], "removed_nodes": [node id],
+         "links": [[link key, link data]], "removed_links": [link key]}}}
+
+where graph is only sent if it changed. The server replies with
+{"version": version} once applied. If it doesn't hold the base version
+(eg it was restarted) it replies 409, and the client sends the delta from
+the empty topology instead.
+"""
+
+import json
+from collections import OrderedDict
+
+
+def link_keys(links):
+    """Returns the keys of links, [(src, dst, data)], in order"""
+    counts = {}
+    keys = []
+    for src, dst, _ in links:
+        n = counts.get((src, dst), 0)
+        counts[src, dst] = n + 1
+        keys.append((src, dst, n))
+    return keys
+
+
+def _object(pairs):
+    return "{%s}" % ", ".join("%s: %s" % (json.dumps(key), value)
+                              for key, value in pairs)
+
+
+def _array(values):
+    return "[%s]" % ", ".join(values)
+
+
+class Snapshot(object):
+
+    """Topology as published by a client, with each element encoded as
+    JSON so that changes are found by comparing strings.
+
+    overlays is {overlay_id: (graph, nodes, links)}, with the JSON of
+    the graph data, nodes {node id: JSON} and links {link key: JSON}"""
+
+    def __init__(self, version="", overlays=None):
+        self.version = version
+        self.overlays = overlays or {}
+
+    def delta_from(self, base):
+        """Returns the JSON delta from the Snapshot base to this one"""
+        overlays = []
+        for overlay_id, (graph, nodes, links) in sorted(
+                self.overlays.items()):
+            base_graph, base_nodes, base_links = base.overlays.get(
+                overlay_id, (None, {}, {}))
+            changes = []
+            if graph != base_graph:
+                changes.append(("graph", graph))
+            changed = [node for node_id, node in nodes.iteritems()
+                       if base_nodes.get(node_id) != node]
+            if changed:
+                changes.append(("nodes", _array(changed)))
+            removed = [node_id for node_id in base_nodes
+                       if node_id not in nodes]
+            if removed:
+                changes.append(("removed_nodes", json.dumps(removed)))
+            changed = [_array([json.dumps(key), link])
+                       for key, link in links.iteritems()
+                       if base_links.get(key) != link]
+            if changed:
+                changes.append(("links", _array(changed)))
+            removed = [key for key in base_links if key not in links]
+            if removed:
+                changes.append(("removed_links", json.dumps(removed)))
+            if changes:
+                overlays.append((overlay_id, _object(changes)))
+
+        removed = [overlay_id for overlay_id in base.overlays
+                   if overlay_id not in self.overlays]
+        return _object([
+            ("base", json.dumps(base.version)),
+            ("version", json.dumps(self.version)),
+            ("removed", json.dumps(sorted(removed))),
+            ("overlays", _object(overlays)),
+        ])
+
+
+class PublishedTopology(object):
+
+    """Topology published by deltas, as stored by the server. Nodes and
+    links are kept by key to apply deltas, and the node-link data of
+    each overlay is rebuilt when it changes"""
+
+    def __init__(self):
+        self.version = ""
+        self._overlays = {}  # {overlay_id: (graph, nodes, links)}
+        self.node_link = {}  # {overlay_id: node-link data}
+
+    def apply(self, delta):
+        """Applies the (decoded) delta, which must be from this
+        version. Returns the ids of the overlays changed"""
+        for overlay_id in delta["removed"]:
+            self._overlays.pop(overlay_id, None)
+            self.node_link.pop(overlay_id, None)
+
+        for overlay_id, changes in delta["overlays"].items():
+            graph, nodes, links = self._overlays.setdefault(
+                overlay_id, ({}, OrderedDict(), OrderedDict()))
+            graph.update(changes.get("graph", {}))
+            for node in changes.get("nodes", []):
+                nodes[node["id"]] = node
+            for node_id in changes.get("removed_nodes", []):
+                del nodes[node_id]
+            for key, link in changes.get("links", []):
+                links[tuple(key)] = link
+            for key in changes.get("removed_links", []):
+                del links[tuple(key)]
+            self.node_link[overlay_id] = node_link_data(graph, nodes, links)
+
+        self.version = delta["version"]
+        return sorted(delta["overlays"])
+
+
+def node_link_data(graph, nodes, links):
+    """Returns node-link data from the graph data, nodes {id: node data}
+    and links {key: link data, with source and target ids}"""
+    mapping = dict((node_id, index) for index, node_id in enumerate(nodes))
+    return dict(graph, nodes=nodes.values(),
+                links=[dict(link, source=mapping[link["source"]],
+                            target=mapping[link["target"]])
+                       for link in links.itervalues()])
+
+
+def node_link_topology(snapshot):
+    """Returns the topology of the Snapshot as {overlay_id: node-link
+    data}, as for a server that doesn't apply deltas"""
+    topology = PublishedTopology()
+    topology.apply(json.loads(snapshot.delta_from(Snapshot())))
+    return topology.node_link
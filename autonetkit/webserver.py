@@ -1,13 +1,22 @@
 # based on
 # http://reminiscential.wordpress.com/2012/04/07/realtime-notification-delivery-using-rabbitmq-tornado-and-websocket/
+import cPickle as pickle
+import gzip
+import hashlib
 import json
 import logging
 import os
+import re
 import socket
+import time
+from collections import OrderedDict, defaultdict
+from cStringIO import StringIO
 
 import autonetkit.config as config
 import pkg_resources
+from autonetkit.vis_delta import PublishedTopology
 import tornado
+import tornado.escape
 import tornado.websocket as websocket
 
 
@@ -50,24 +59,128 @@ class MyWebHandler(tornado.web.RequestHandler):
             for listener in uuid_socket_listeners:
                 listener.update_overlay()
 
+        elif data_type == "anm_delta":
+            delta = json.loads(data)
+            version = self.ank_accessor.apply_delta(uuid, delta)
+            if version is None:
+                # client sends the delta from the empty topology instead
+                self.set_status(409)
+                self.write({'version': None})
+                return
+
+            self.write({'version': version})
+            logging.info("Updating listeners")
+            for listener in uuid_socket_listeners:
+                listener.update_overlay()
+
         elif data_type == "highlight":
             body_parsed = json.loads(data)
+            message = tornado.escape.json_encode({'highlight': body_parsed})
             for listener in uuid_socket_listeners:
-                listener.write_message({'highlight': body_parsed})
+                listener.send("highlight", message)
         else:
             pass
 
 
+class SendQueue(object):
+
+    """Messages waiting to be written to a websocket client.
+
+    One message is written at a time, and the next once tornado has
+    flushed it to the socket, so that a slow client doesn't build up an
+    unbounded write buffer. A message replaces the queued message of the
+    same kind (eg the overlay viewed), which is stale, and beyond
+    max_queued messages the oldest are dropped. write(message) writes a
+    message, returning a Future that is done once flushed"""
+
+    def __init__(self, write, max_queued=4):
+        self.write = write
+        self.max_queued = max_queued
+        self.sent = 0
+        self.bytes_sent = 0
+        self.replaced = 0
+        self.dropped = 0
+        self._queue = OrderedDict()  # {kind: (message, time queued)}
+        self._writing = None  # time the message being written was queued
+
+    def __len__(self):
+        return len(self._queue)
+
+    def send(self, kind, message):
+        if self._queue.pop(kind, None) is not None:
+            self.replaced += 1
+        self._queue[kind] = (message, time.time())
+        while len(self._queue) > self.max_queued:
+            self._queue.popitem(last=False)
+            self.dropped += 1
+        self._write_next()
+
+    def _write_next(self):
+        while self._writing is None and self._queue:
+            kind, (message, queued) = self._queue.popitem(last=False)
+            future = self.write(message)
+            self.sent += 1
+            self.bytes_sent += len(message)
+            if future is not None and not future.done():
+                self._writing = queued
+                future.add_done_callback(self._written)
+
+    def _written(self, future):
+        future.exception()  # retrieved, if the client disconnected
+        self._writing = None
+        self._write_next()
+
+    def lag(self):
+        """Returns the seconds since the oldest message not yet written
+        to the socket was sent"""
+        queued = [queued for _, queued in self._queue.values()]
+        if self._writing is not None:
+            queued.append(self._writing)
+        if not queued:
+            return 0.0
+        return time.time() - min(queued)
+
+    def stats(self):
+        return dict(queued=len(self._queue), sent=self.sent,
+                    bytes_sent=self.bytes_sent, replaced=self.replaced,
+                    dropped=self.dropped, lag=round(self.lag(), 3))
+
+
 class MyWebSocketHandler(websocket.WebSocketHandler):
 
-    def initialize(self, ank_accessor, overlay_id, singleuser_mode=False):
+    def initialize(self, ank_accessor, overlay_id, singleuser_mode=False,
+                   compression=False, max_queued=4):
         """ Store the overlay_id this listener is currently viewing.
-        Used when updating."""
+        Used when updating. Messages are compressed (permessage-deflate)
+        if compression is set and the client supports it"""
         self.ank_accessor = ank_accessor
         self.overlay_id = overlay_id
         self.uuid = None  # set by the client
         self.uuid_socket_listeners = set()
         self.singleuser_mode = singleuser_mode
+        self.compression = compression
+        self.send_queue = SendQueue(self._write, max_queued)
+
+    def get_compression_options(self):
+        if self.compression:
+            return {}  # default compression settings
+        return None
+
+    def _write(self, message):
+        try:
+            return self.write_message(message)
+        except websocket.WebSocketClosedError:
+            return None  # removed from listeners by on_close
+
+    def send(self, kind, message):
+        """Sends message, queued behind any message being written, see
+        SendQueue"""
+        self.send_queue.send(kind, message)
+
+    def client_stats(self):
+        return dict(self.send_queue.stats(), uuid=self.uuid,
+                    overlay_id=self.overlay_id,
+                    remote_ip=self.request.remote_ip)
 
     def allow_draft76(self):
         # for iOS 5.0 Safari
@@ -108,28 +221,305 @@ class MyWebSocketHandler(websocket.WebSocketHandler):
             self.overlay_id = overlay_id
             self.update_overlay()
         elif "overlay_list" in message:
-            body = json.dumps(
-                {'overlay_list': self.ank_accessor.overlay_list(self.uuid)})
-            self.write_message(body)
+            self.send("overlay_list",
+                      self.ank_accessor.overlay_list_json(self.uuid))
         elif "ip_allocations" in message:
             pass
 
     def update_overlay(self):
-        body = self.ank_accessor.get_overlay(self.uuid, self.overlay_id)
-        self.write_message(body)
-        body = json.dumps(
-            {'overlay_list': self.ank_accessor.overlay_list(self.uuid)})
-        self.write_message(body)
+        overlay = self.ank_accessor.get_serialised_overlay(self.uuid,
+                                                           self.overlay_id)
+        if overlay is not None:
+            self.send("overlay", overlay.json)
+        self.send("overlay_list",
+                  self.ank_accessor.overlay_list_json(self.uuid))
+
+
+class OverlayHandler(tornado.web.RequestHandler):
+
+    """Serves the JSON of an overlay, as sent to websocket clients"""
+
+    def initialize(self, ank_accessor, singleuser_mode=False):
+        self.ank_accessor = ank_accessor
+        self.singleuser_mode = singleuser_mode
+
+    def get(self):
+        if self.singleuser_mode:
+            uuid = "singleuser"
+        else:
+            uuid = self.get_argument('uuid', 'singleuser')
+        overlay_id = self.get_argument('overlay_id', 'phy')
+        overlay = self.ank_accessor.get_serialised_overlay(uuid, overlay_id)
+        if overlay is None:
+            raise tornado.web.HTTPError(404)
+
+        # the gzip and json representations differ, so need their own etags
+        send_gzip = accepts_gzip(self.request.headers.get("Accept-Encoding"))
+        etag = '"%s%s"' % (overlay.etag, "-gzip" if send_gzip else "")
+        self.set_header("Etag", etag)
+        self.set_header("Vary", "Accept-Encoding")
+        self.set_header("Cache-Control", "no-cache")  # always revalidate
+        if etag_matches(self.request.headers.get("If-None-Match"), etag):
+            self.set_status(304)
+            return
+
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        if send_gzip:
+            self.set_header("Content-Encoding", "gzip")
+            self.write(overlay.gzip)
+        else:
+            self.write(overlay.json)
+
+
+class StatsHandler(tornado.web.RequestHandler):
+
+    """Serves the counters of the stored topologies, see AnkAccessor.stats,
+    and of each websocket client, see SendQueue.stats"""
+
+    def initialize(self, ank_accessor):
+        self.ank_accessor = ank_accessor
+
+    def get(self):
+        clients = [listener.client_stats()
+                   for listeners in self.application.socket_listeners.values()
+                   for listener in listeners]
+        stats = self.ank_accessor.stats()
+        stats['clients'] = clients
+        stats['max_lag'] = max([client['lag'] for client in clients] or [0])
+        self.write(stats)
+
+
+def accepts_gzip(accept_encoding):
+    """Returns if the Accept-Encoding header value allows gzip"""
+    for coding in (accept_encoding or "").split(","):
+        params = coding.split(";")
+        if params[0].strip().lower() not in ("gzip", "x-gzip"):
+            continue
+        for param in params[1:]:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def etag_matches(if_none_match, etag):
+    """Returns if the If-None-Match header value matches etag, comparing
+    weakly, as for GET requests"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in re.findall(r'(?:W/)?("[^"]*")', if_none_match)
+
+
+def gzip_compress(data):
+    """Returns data gzip-compressed, without a timestamp so that the
+    same data is always compressed the same"""
+    fh = StringIO()
+    with gzip.GzipFile(fileobj=fh, mode="wb", mtime=0) as gzip_fh:
+        gzip_fh.write(data)
+    return fh.getvalue()
+
+
+class SerialisedOverlay(object):
+
+    """Overlay stored by the AnkAccessor, serialised once when stored
+    rather than for each client: json as sent to clients, gzip, the json
+    compressed for HTTP clients that accept it, and etag, the hash of the
+    json, for HTTP clients to check if their copy is current"""
+
+    def __init__(self, json_data, gzip_data=None):
+        self.json = json_data
+        if gzip_data is None:
+            gzip_data = gzip_compress(json_data)
+        self.gzip = gzip_data
+        self.etag = hashlib.sha1(json_data).hexdigest()
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(tornado.escape.json_encode(data))
+
+    def data(self):
+        return json.loads(self.json)
+
+    @property
+    def nbytes(self):
+        return len(self.json) + len(self.gzip)
+
+
+class JoinedOverlays(SerialisedOverlay):
+
+    """All of the overlays of a topology, {overlay_id: SerialisedOverlay},
+    as a single JSON object. The etag is from those of the overlays, so
+    that HTTP clients' copies are checked without joining them: the JSON
+    is joined, and compressed, only when first read"""
+
+    def __init__(self, overlays):
+        self.overlays = overlays
+        self.etag = hashlib.sha1(" ".join(
+            "%s:%s" % (overlay_id.encode("utf-8"), overlay.etag)
+            for overlay_id, overlay in sorted(overlays.items()))).hexdigest()
+        self._json = self._gzip = None
+
+    @property
+    def json(self):
+        if self._json is None:
+            # join the stored JSON rather than serialising again
+            self._json = "{%s}" % ", ".join(
+                "%s: %s" % (json.dumps(key), overlay.json)
+                for key, overlay in sorted(self.overlays.items()))
+        return self._json
+
+    @property
+    def gzip(self):
+        if self._gzip is None:
+            self._gzip = gzip_compress(self.json)
+        return self._gzip
+
+
+class StoredTopology(object):
+
+    """The SerialisedOverlays of a topology, {overlay_id:
+    SerialisedOverlay}, and the JSON of its overlay list message"""
+
+    def __init__(self, overlays, overlay_list_json):
+        self.overlays = overlays
+        self.overlay_list_json = overlay_list_json
+        self.nbytes = len(overlay_list_json) + sum(
+            overlay.nbytes for overlay in overlays.values())
+
+
+class TopologyStore(object):
+
+    """StoredTopology by uuid, bounded by their total serialised size,
+    and by their number if max_count is set.
+
+    Once over either bound, the least recently read topologies are
+    evicted, calling on_evict(uuid). A new topology counts as read when
+    stored, but storing a topology again doesn't. If spill_dir is set,
+    evicted topologies are written there, and reloaded when next read.
+    counters has the hits and misses of reads, and the evictions, spills
+    and reloads"""
+
+    def __init__(self, max_bytes=None, max_count=None, spill_dir=None,
+                 on_evict=None):
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self.spill_dir = spill_dir
+        self.on_evict = on_evict
+        self.nbytes = 0
+        self.counters = dict(hits=0, misses=0, evictions=0, spills=0,
+                             reloads=0)
+        self._topologies = OrderedDict()  # least recently read first
+        if spill_dir and not os.path.isdir(spill_dir):
+            os.makedirs(spill_dir)
+
+    def __len__(self):
+        return len(self._topologies)
+
+    def __contains__(self, uuid):
+        return (uuid in self._topologies
+                or bool(self.spill_dir)
+                and os.path.isfile(self._spill_file(uuid)))
+
+    def peek(self, uuid):
+        """Returns the topology of uuid if in memory, otherwise None,
+        without counting as a read"""
+        return self._topologies.get(uuid)
+
+    def get(self, uuid):
+        """Returns the topology of uuid, or None if not stored"""
+        topology = self._topologies.pop(uuid, None)
+        if topology is not None:
+            self.counters['hits'] += 1
+            self._topologies[uuid] = topology  # now most recently read
+            return topology
+
+        self.counters['misses'] += 1
+        topology = self._reload(uuid)
+        if topology is not None:
+            self.put(uuid, topology)
+        return topology
+
+    def put(self, uuid, topology):
+        previous = self._topologies.get(uuid)
+        if previous is not None:
+            self.nbytes -= previous.nbytes
+        self._topologies[uuid] = topology
+        self.nbytes += topology.nbytes
+        self._evict(uuid)
+
+    def pop(self, uuid):
+        topology = self._topologies.pop(uuid, None)
+        if topology is not None:
+            self.nbytes -= topology.nbytes
+        return topology
+
+    def _over(self):
+        return ((self.max_bytes is not None and self.nbytes > self.max_bytes)
+                or (self.max_count is not None
+                    and len(self._topologies) > self.max_count))
+
+    def _evict(self, keep):
+        """Evicts topologies, other than keep, until within bounds"""
+        while self._over() and len(self._topologies) > 1:
+            uuid = next(key for key in self._topologies if key != keep)
+            topology = self.pop(uuid)
+            logging.info("Evicting topology with UUID %s (%s bytes)"
+                         % (uuid, topology.nbytes))
+            self.counters['evictions'] += 1
+            if self.spill_dir:
+                self._spill(uuid, topology)
+            if self.on_evict:
+                self.on_evict(uuid)
+
+    def _spill_file(self, uuid):
+        filename = hashlib.sha1(uuid.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, filename + ".pickle")
+
+    def _spill(self, uuid, topology):
+        overlays = dict((overlay_id, (overlay.json, overlay.gzip))
+                        for overlay_id, overlay in topology.overlays.items())
+        with open(self._spill_file(uuid), "wb") as fh:
+            pickle.dump((uuid, topology.overlay_list_json, overlays), fh,
+                        pickle.HIGHEST_PROTOCOL)
+        self.counters['spills'] += 1
+
+    def _reload(self, uuid):
+        if not self.spill_dir:
+            return None
+        spill_file = self._spill_file(uuid)
+        try:
+            with open(spill_file, "rb") as fh:
+                spilled_uuid, overlay_list_json, overlays = pickle.load(fh)
+        except IOError:
+            return None
+        os.remove(spill_file)  # written again if evicted again
+        if spilled_uuid != uuid:
+            return None
+        logging.info("Reloaded topology with UUID %s" % uuid)
+        self.counters['reloads'] += 1
+        overlays = dict((overlay_id, SerialisedOverlay(*buffers))
+                        for overlay_id, buffers in overlays.items())
+        return StoredTopology(overlays, overlay_list_json)
+
+
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
 
 
 class AnkAccessor():
 
-    """ Used to store published topologies"""
+    """ Used to store published topologies, see TopologyStore"""
 
-    def __init__(self, maxlen=25, simplified_overlays=False):
-        from collections import deque
-        self.anm_index = {}
-        self.uuid_list = deque(maxlen=maxlen)  # use for circular buffer
+    def __init__(self, maxlen=None, simplified_overlays=False,
+                 max_bytes=DEFAULT_MAX_BYTES, spill_dir=None):
+        self.topologies = TopologyStore(max_bytes, maxlen, spill_dir,
+                                        on_evict=self.evicted)
+        self.published = {}  # PublishedTopology of uuids updated by deltas
         self.anm = {}
         self.ip_allocation = {}
         self.simplified_overlays = simplified_overlays
@@ -139,8 +529,12 @@ class AnkAccessor():
             default_file = pkg_resources.resource_filename(
                 "autonetkit_cisco_webui", "cisco.json.gz")
         except ImportError:
-            vis_content = pkg_resources.resource_filename(
-                "autonetkit_vis", "web_content")
+            try:
+                vis_content = pkg_resources.resource_filename(
+                    "autonetkit_vis", "web_content")
+            except ImportError, e:
+                logging.warning(e)
+                return  # use default blank anm
             default_file = os.path.join(vis_content, "default.json.gz")
 
         try:
@@ -148,13 +542,43 @@ class AnkAccessor():
             fh = gzip.open(default_file, "r")
             data = json.load(fh)
             #data = json.loads(loaded)
-            self.anm_index['singleuser'] = data
+            self.store_serialised('singleuser', data)
         except IOError, e:
             logging.warning(e)
             pass  # use default blank anm
 
-    def store_overlay(self, uuid, overlay_input):
+    def apply_delta(self, uuid, delta):
+        """Applies the delta (see vis_delta) to the topology published
+        to uuid. Returns the new version, or None if the topology isn't
+        at the base version of the delta"""
+        published = self.published.get(uuid)
+        if not delta["base"]:
+            published = PublishedTopology()
+        elif published is None or published.version != delta["base"]:
+            logging.info("Topology with UUID %s is not at version %s"
+                         % (uuid, delta["base"]))
+            return None
+
+        try:
+            changed = published.apply(delta)
+        except (KeyError, TypeError), e:
+            logging.warning("Unable to apply delta to topology with UUID "
+                            "%s: %s" % (uuid, e))
+            self.published.pop(uuid, None)
+            return None
+        if not delta["base"]:
+            changed = None  # nothing to reuse
+        self.store_overlay(uuid, dict(published.node_link), published,
+                           changed)
+        return published.version
+
+    def store_overlay(self, uuid, overlay_input, published=None,
+                      changed=None):
+        """Stores the overlays of overlay_input, {overlay_id: node-link
+        data}, for uuid. If changed is set, only the overlays in changed
+        are serialised, and the others are as previously stored"""
         logging.info("Storing overlay_input with UUID %s" % uuid)
+        sources = {}  # overlay_id in overlay_input, by stored overlay_id
 
         if self.simplified_overlays:
             overlays_tidied = {}
@@ -200,64 +624,99 @@ class AnkAccessor():
                 # use from labels if present
                 store_key = labels.get(key) or key
                 overlays_tidied[store_key] = overlay_input[key]
+                sources[store_key] = key
 
         else:
             overlays_tidied = overlay_input
 
-        # New uuid
-        if len(self.uuid_list) == self.uuid_list.maxlen:
-            # list is full
-            oldest_uuid = self.uuid_list.popleft()
-            logging.info("UUID list full, removing UUID %s" % oldest_uuid)
-
-            try:
-                del self.anm_index[oldest_uuid]
-            except KeyError:
-                logging.warning("Unable to remove UUID %s" % oldest_uuid)
-
-        # If uuid already present, then remove from the queue, and then add to the end
-        # This avoids erroneously removing recently updated (i.e. non-stale
-        # uuids)
-        if uuid in self.uuid_list:
-            logging.info("Removing UUID %s to add to end of queue" % uuid)
-            self.uuid_list.remove(uuid)
-
-        self.uuid_list.append(uuid)
+        previous = self.topologies.peek(uuid)
+        previous = previous.overlays if previous else {}
+        serialised = {}
+        for overlay_id, data in overlays_tidied.items():
+            source = sources.get(overlay_id, overlay_id)
+            if (changed is not None and source not in changed
+                    and overlay_id in previous):
+                serialised[overlay_id] = previous[overlay_id]
+            else:
+                serialised[overlay_id] = SerialisedOverlay.from_data(data)
+
+        if published:
+            self.published[uuid] = published
+        else:
+            self.published.pop(uuid, None)
+        self.store_serialised(uuid, serialised)
         logging.info("Stored overlay with UUID %s" % uuid)
-        self.anm_index[uuid] = overlays_tidied
 
-    def get_overlay(self, uuid, overlay_id):
+    def evicted(self, uuid):
+        self.published.pop(uuid, None)  # deltas are sent from empty
+
+    def store_serialised(self, uuid, overlays):
+        """Stores overlays, {overlay_id: SerialisedOverlay, or data to
+        serialise}, for uuid, and its overlay list"""
+        anm = dict((overlay_id, overlay
+                    if isinstance(overlay, SerialisedOverlay)
+                    else SerialisedOverlay.from_data(overlay))
+                   for overlay_id, overlay in overlays.items())
+        overlay_list_json = json.dumps(
+            {'overlay_list': self._overlay_list(anm)})
+        self.topologies.put(uuid, StoredTopology(anm, overlay_list_json))
+
+    def stats(self):
+        """Returns the counters of the stored topologies, and their
+        number and total serialised size"""
+        return dict(self.topologies.counters,
+                    topologies=len(self.topologies),
+                    bytes=self.topologies.nbytes,
+                    max_bytes=self.topologies.max_bytes)
+
+    def get_serialised_overlay(self, uuid, overlay_id):
+        """Returns the SerialisedOverlay of overlay_id, or of all of the
+        overlays if "*", or None if not stored"""
         logging.info("Getting overlay %s with UUID %s" % (overlay_id, uuid))
+        topology = self.topologies.get(uuid)
+        if topology is None:
+            logging.warning("Unable to find topology with UUID %s" % uuid)
+            return None
+        anm = topology.overlays
+
+        if overlay_id == "*":
+            return JoinedOverlays(anm)
         try:
-            anm = self.anm_index[uuid]
+            return anm[overlay_id]
         except KeyError:
-            logging.warning("Unable to find topology with UUID %s" % uuid)
+            logging.warning(
+                "Unable to find overlay %s in topoplogy with UUID %s" % (overlay_id, uuid))
+
+    def get_overlay(self, uuid, overlay_id):
+        if uuid not in self.topologies:
             return ""
-        else:
-            try:
-                if overlay_id == "*":
-                    return anm
-                # elif self.simplified_overlays and overlay_id == "phy":
-                    # print "Returning physical for phy"
-                    # return anm["Physical"]
-                else:
-                    return anm[overlay_id]
-            except KeyError:
-                logging.warning(
-                    "Unable to find overlay %s in topoplogy with UUID %s" % (overlay_id, uuid))
+        overlay = self.get_serialised_overlay(uuid, overlay_id)
+        if overlay is not None:
+            return overlay.data()
+
+    @staticmethod
+    def _overlay_list(anm):
+        if not len(anm):
+            return [""]
+
+        return sorted(anm.keys(), key=lambda x: str(x[0]).lower())
 
     def overlay_list(self, uuid):
         logging.info("Trying for anm list with UUID %s" % uuid)
-        try:
-            anm = self.anm_index[uuid]
-        except KeyError:
+        topology = self.topologies.get(uuid)
+        if topology is None:
             logging.warning("Unable to find topology with UUID %s" % uuid)
             return [""]
 
-        if not len(anm):
-            return [""]
+        return self._overlay_list(topology.overlays)
 
-        return sorted(anm.keys(), key=lambda x: str(x[0]).lower())
+    def overlay_list_json(self, uuid):
+        """Returns the JSON of the overlay list message for uuid"""
+        topology = self.topologies.get(uuid)
+        if topology is None:
+            logging.warning("Unable to find topology with UUID %s" % uuid)
+            return json.dumps({'overlay_list': [""]})
+        return topology.overlay_list_json
 
     def __getitem__(self, key):
         try:
@@ -312,6 +771,40 @@ class IndexHandler(tornado.web.RequestHandler):
         self.render(template, uuid=uuid)
 
 
+def make_application(ank_accessor, settings=None, singleuser_mode=False,
+                     websocket_compression=False, max_queued=4):
+    """Returns the webserver Application. Visualisation pages are served
+    from settings['static_path'] if set"""
+    settings = settings or {}
+    handlers = [
+        (r'/ws', MyWebSocketHandler, {"ank_accessor": ank_accessor,
+                                      'singleuser_mode': singleuser_mode,
+                                      "overlay_id": "phy",
+                                      "compression": websocket_compression,
+                                      "max_queued": max_queued}),
+        (r'/publish', MyWebHandler, {"ank_accessor": ank_accessor,
+                                     'singleuser_mode': singleuser_mode,
+                                     }),
+        (r'/overlay', OverlayHandler, {"ank_accessor": ank_accessor,
+                                       'singleuser_mode': singleuser_mode,
+                                       }),
+        (r'/stats', StatsHandler, {"ank_accessor": ank_accessor}),
+    ]
+    if settings.get('static_path'):
+        # TODO: inherit the IndexHandler to switch based on browser version
+        handlers += [
+            # TODO: merge the two below into a single handler that captures
+            # both cases
+            (r'/', IndexHandler, {"path": settings['static_path']}),
+            (r'/index.html', IndexHandler, {"path": settings['static_path']}),
+            ("/(.*)", tornado.web.StaticFileHandler,
+             {"path": settings['static_path']})
+        ]
+    application = tornado.web.Application(handlers, **settings)
+    application.socket_listeners = defaultdict(set)  # Indexed by uuid
+    return application
+
+
 def main():
 
     try:
@@ -329,6 +822,15 @@ def main():
         '--multi_user', action="store_true", default=False, help="Multi-User mode")
     parser.add_argument('--ank_vis', action="store_true",
                         default=False, help="Force AutoNetkit visualisation system")
+    parser.add_argument('--max_memory', type=int,
+                        default=DEFAULT_MAX_BYTES // 2 ** 20,
+                        help="Size of published topologies to keep in memory, in MB (default %(default)s)")
+    parser.add_argument('--spill_dir',
+                        help="Directory to write topologies evicted from memory to, and reload from")
+    parser.add_argument('--websocket_compression', action="store_true",
+                        default=False, help="Compress websocket messages (permessage-deflate)")
+    parser.add_argument('--max_queued', type=int, default=4,
+                        help="Messages to queue for each websocket client before dropping the oldest (default %(default)s)")
     arguments = parser.parse_args()
 
 # check if most recent outdates current most recent
@@ -376,30 +878,17 @@ def main():
     if singleuser_mode:
         logging.info("Running webserver in single-user mode")
 
-    ank_accessor = AnkAccessor(simplified_overlays=simplified_overlays)
-
-    # TODO: inherit the IndexHandler to switch based on browser version
-    application = tornado.web.Application([
-        (r'/ws', MyWebSocketHandler, {"ank_accessor": ank_accessor,
-                                      'singleuser_mode': singleuser_mode,
-                                      "overlay_id": "phy"}),
-        (r'/publish', MyWebHandler, {"ank_accessor": ank_accessor,
-                                     'singleuser_mode': singleuser_mode,
-                                     }),
+    ank_accessor = AnkAccessor(simplified_overlays=simplified_overlays,
+                               max_bytes=arguments.max_memory * 2 ** 20,
+                               spill_dir=arguments.spill_dir)
 
-        # TODO: merge the two below into a single handler that captures both
-        # cases
-        (r'/', IndexHandler, {"path": settings['static_path']}),
-        (r'/index.html', IndexHandler, {"path": settings['static_path']}),
-        ("/(.*)", tornado.web.StaticFileHandler,
-         {"path": settings['static_path']})
-    ], **settings)
+    application = make_application(
+        ank_accessor, settings, singleuser_mode,
+        websocket_compression=arguments.websocket_compression,
+        max_queued=arguments.max_queued)
 
     logging.getLogger().setLevel(logging.INFO)
 
-    from collections import defaultdict
-    application.socket_listeners = defaultdict(set)  # Indexed by uuid
-
     io_loop = tornado.ioloop.IOLoop.instance()
 
     port = config.settings['Http Post']['port']
@@ -46,8 +46,12 @@ def file_monitor(filename):
 def manage_network(input_graph_string, timestamp, build=True,
                    visualise=True, compile=True, validate=True, render=True,
                    monitor=False, deploy=False, measure=False, diff=False,
-                   archive=False, grid=None, ):
-    """Build, compile, render network as appropriate"""
+                   archive=False, grid=None, profile=False, incremental=None):
+    """Build, compile, render network as appropriate
+
+    If incremental is an IncrementalBuild (see autonetkit.build_network), it
+    is used to only re-apply the design rules affected by changes to the
+    input since its last build, eg in monitor mode."""
 
     # import build_network_simple as build_network
 
@@ -59,10 +63,18 @@ def manage_network(input_graph_string, timestamp, build=True,
         elif grid:
             graph = build_network.grid_2d(grid)
 
+        profiler = None
+        if profile:
+            import autonetkit.ank_profile as ank_profile
+            profiler = ank_profile.StageProfiler()
+
         # TODO: integrate the code to visualise on error (enable in config)
         anm = None
         try:
-            anm = build_network.build(graph)
+            if incremental is not None:
+                anm = incremental.build(graph, profiler=profiler)
+            else:
+                anm = build_network.build(graph, profiler=profiler)
         except Exception, e:
             # Send the visualisation to help debugging
             try:
@@ -83,6 +95,11 @@ def manage_network(input_graph_string, timestamp, build=True,
                 # autonetkit.update_vis(anm)
                 pass
 
+        if profiler:
+            log.info("Design rule profile:\n%s" % profiler.table())
+            profile_file = profiler.save()
+            log.info("Wrote design rule profile to %s" % profile_file)
+
         if not compile and visualise:
             autonetkit.update_vis(anm)
             pass
@@ -112,7 +129,13 @@ def manage_network(input_graph_string, timestamp, build=True,
         if render:
             import time
             #start = time.clock()
-            autonetkit.render.render(nidb)
+            render_archive = config.settings['General']['render_archive']
+            if render_archive:
+                log.info("Rendering to %s" % render_archive)
+                with autonetkit.render.RenderArchive(render_archive) as sink:
+                    autonetkit.render.render(nidb, archive=sink)
+            else:
+                autonetkit.render.render(nidb)
             # print time.clock() - start
             #import autonetkit.render2
             #start = time.clock()
@@ -125,7 +148,7 @@ def manage_network(input_graph_string, timestamp, build=True,
 
         import autonetkit.anm
         anm = autonetkit.anm.NetworkModel()
-        anm.restore_latest()
+        anm.restore_latest(lazy=True)
         nidb = DeviceModel()
         nidb.restore_latest()
         #autonetkit.update_vis(anm, nidb)
@@ -252,13 +275,16 @@ def deploy_network(anm, nidb, input_graph_string=None):
 
             if platform == 'netkit':
                 import autonetkit.deploy.netkit as netkit_deploy
-                tar_file = netkit_deploy.package(config_path, 'nklab')
+                tar_file = netkit_deploy.rendered_archive()
+                if not tar_file:
+                    tar_file = netkit_deploy.package(config_path, 'nklab')
+                remote_tar_file = os.path.basename(tar_file)
                 netkit_deploy.transfer(host, username, tar_file,
-                                       tar_file, key_file)
+                                       remote_tar_file, key_file)
                 netkit_deploy.extract(
                     host,
                     username,
-                    tar_file,
+                    remote_tar_file,
                     config_path,
                     timeout=60,
                     key_filename=key_file,
@@ -0,0 +1,91 @@
+"""Microbenchmark for the NmNode, NmEdge and NmPort handle cache.
+
+Runs a design rule style workload (nested loops over nodes, neighbors,
+interfaces and edges) with the handle cache disabled and enabled, and
+reports the number of handles constructed and the time taken.
+
+Usage: python benchmarks/handles.py [grid dimension]
+"""
+
+import sys
+import time
+
+import autonetkit.build_network as build_network
+from autonetkit.anm.edge import NmEdge
+from autonetkit.anm.interface import NmPort
+from autonetkit.anm.node import NmNode
+
+HANDLE_CLASSES = [NmNode, NmEdge, NmPort]
+
+
+def count_constructions(func):
+    """Returns the number of handles constructed by func"""
+    counts = {"total": 0}
+    originals = {}
+
+    def counting_init(original):
+        def init(self, *args, **kwargs):
+            counts["total"] += 1
+            original(self, *args, **kwargs)
+        return init
+
+    for cls in HANDLE_CLASSES:
+        originals[cls] = cls.__init__
+        cls.__init__ = counting_init(cls.__init__)
+    try:
+        func()
+    finally:
+        for cls, original in originals.items():
+            cls.__init__ = original
+
+    return counts["total"]
+
+
+def workload(anm):
+    for overlay_id in ["phy", "layer3"]:
+        g_overlay = anm[overlay_id]
+        for node in g_overlay.nodes():
+            for neighbor in node.neighbors():
+                neighbor.asn
+            for interface in node.interfaces():
+                interface.node
+                interface.is_loopback
+        for edge in g_overlay.edges():
+            edge.src_int
+            edge.dst_int
+            edge.src.asn
+
+
+def best_time(func, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main(dim=10):
+    anm = build_network.build(build_network.grid_2d(dim))
+
+    anm._handles = None  # disable the cache
+    uncached_count = count_constructions(lambda: workload(anm))
+    uncached_time = best_time(lambda: workload(anm))
+
+    anm._handles = {}
+    first_count = count_constructions(lambda: workload(anm))
+    cached_count = count_constructions(lambda: workload(anm))
+    cached_time = best_time(lambda: workload(anm))
+
+    print "Grid %sx%s, %s nodes" % (dim, dim, len(anm['phy']))
+    print "%-24s %12s %10s" % ("", "Handles", "Time (s)")
+    print "%-24s %12s %10.3f" % ("Uncached", uncached_count, uncached_time)
+    print "%-24s %12s %10s" % ("Cached (first pass)", first_count, "-")
+    print "%-24s %12s %10.3f" % ("Cached", cached_count, cached_time)
+
+
+if __name__ == "__main__":
+    dim = 10
+    if len(sys.argv) > 1:
+        dim = int(sys.argv[1])
+    main(dim)
@@ -0,0 +1,144 @@
+"""Benchmark for the IPv4 allocation of IpTree.
+
+Allocates the infrastructure subnets of a grid topology, with a grid of
+dimension 71 giving about 10k broadcast domains, using both the integer
+allocator of IpTree and the netaddr tree walk it replaced, and checks
+that the allocations are identical.
+
+Usage: python benchmarks/ipv4_allocation.py [grid dimension]
+"""
+
+import gc
+import sys
+import time
+
+import autonetkit.build_network as build_network
+import autonetkit.plugins.ipv4 as ipv4
+import netaddr
+from autonetkit.plugins.ipv4 import IpTree, TreeNode
+
+
+class NetaddrIpTree(IpTree):
+
+    """IpTree allocating using netaddr objects at each level of the tree"""
+
+    def allocate(self, graph, root):
+
+        def allocate(node):
+            children = sorted(node.children())
+            prefixlen = node.prefixlen + 1
+            subnet = node.subnet.subnet(prefixlen)
+
+            if node.is_loopback_group() or node.is_broadcast_domain():
+                iterhosts = node.subnet.iter_hosts()
+                for sub_child in sorted(node.children()):
+                    if sub_child.is_interface() \
+                            and sub_child.host.is_loopback:
+                        if sub_child.host.is_loopback_zero:
+                            sub_child.ip_address = iterhosts.next()
+                        else:
+                            sub_child.ip_address = iterhosts.next()
+                            sub_child.subnet = node.subnet
+                    elif sub_child.is_interface() \
+                            and sub_child.host.is_physical:
+                        sub_child.ip_address = iterhosts.next()
+                        sub_child.subnet = node.subnet
+                    else:
+                        sub_child.subnet = iterhosts.next()
+                return
+
+            for child in children:
+                if child.is_broadcast_domain():
+                    subnet = subnet.next()
+                    child.subnet = subnet
+                    iterhosts = child.subnet.iter_hosts()
+                    for sub_child in sorted(child.children()):
+                        if sub_child.is_interface():
+                            interface = sub_child.host
+                            if interface.is_physical:
+                                sub_child.ip_address = iterhosts.next()
+                                sub_child.subnet = subnet
+                            elif interface.is_loopback \
+                                    and not interface.is_loopback_zero:
+                                sub_child.ip_address = iterhosts.next()
+                                sub_child.subnet = subnet
+                        else:
+                            sub_child.subnet = iterhosts.next()
+                elif child.is_host():
+                    child.subnet = subnet.next()
+                elif child.is_loopback_group():
+                    child.subnet = subnet.next()
+                    iterhosts = child.subnet.iter_hosts()
+                    for sub_child in sorted(child.children()):
+                        if sub_child.is_interface() \
+                                and not sub_child.host.is_loopback_zero:
+                            sub_child.ip_address = iterhosts.next()
+                            sub_child.subnet = child.subnet
+                        else:
+                            sub_child.subnet = iterhosts.next()
+                else:
+                    child.subnet = subnet.next()
+                    allocate(child)
+
+        allocate(TreeNode(graph, root))
+
+
+def timed_allocate(tree_class, g_ip):
+    """Returns (allocation time, build time, allocations) for g_ip"""
+    timings = {"allocate": 0}
+    allocate = tree_class.allocate
+
+    def timed(self, graph, root):
+        start = time.time()
+        allocate(self, graph, root)
+        timings["allocate"] += time.time() - start
+
+    ip_tree = tree_class(netaddr.IPNetwork('10.0.0.0/8'))
+    ip_tree.allocate = lambda graph, root: timed(ip_tree, graph, root)
+    ip_tree.add_nodes(sorted(n for n in g_ip.nodes('broadcast_domain')
+                             if n.allocate))
+    gc.collect()
+    start = time.time()
+    ip_tree.build()
+    build_time = time.time() - start
+
+    allocations = sorted((node, repr(data.get('subnet')),
+                          repr(data.get('ip_address')))
+                         for node, data in ip_tree.graph.nodes(data=True))
+    return timings["allocate"], build_time, allocations
+
+
+def best_times(tree_class, g_ip, repeat=3):
+    """Returns the best (allocation time, build time), and allocations"""
+    runs = [timed_allocate(tree_class, g_ip) for _ in range(repeat)]
+    return (min(run[0] for run in runs), min(run[1] for run in runs),
+            runs[0][2])
+
+
+def main(dim=20):
+    input_graph = build_network.grid_2d(dim)
+    # enough loopbacks for large grids
+    input_graph.graph['ipv4_loopback_subnet'] = "192.168.0.0"
+    input_graph.graph['ipv4_loopback_prefix'] = 16
+    anm = build_network.build(input_graph)
+    g_ip = anm['ipv4']
+    ipv4.assign_asn_to_interasn_cds(g_ip)
+    broadcast_domains = len(g_ip.nodes('broadcast_domain'))
+
+    netaddr_alloc, netaddr_build, netaddr_result = best_times(
+        NetaddrIpTree, g_ip)
+    int_alloc, int_build, int_result = best_times(IpTree, g_ip)
+
+    print "Grid %sx%s, %s broadcast domains" % (dim, dim, broadcast_domains)
+    print "%-12s %14s %14s" % ("", "Allocate (s)", "Build (s)")
+    print "%-12s %14.3f %14.3f" % ("netaddr", netaddr_alloc, netaddr_build)
+    print "%-12s %14.3f %14.3f" % ("Integer", int_alloc, int_build)
+    print "Speedup: %.1fx" % (netaddr_alloc / int_alloc)
+    print "Identical allocations: %s" % (netaddr_result == int_result)
+
+
+if __name__ == "__main__":
+    dim = 20
+    if len(sys.argv) > 1:
+        dim = int(sys.argv[1])
+    main(dim)
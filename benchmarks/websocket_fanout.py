@@ -0,0 +1,186 @@
+"""Load test for the webserver's websocket fan-out.
+
+Runs the webserver in a child process, connects hundreds of local
+websocket clients viewing the phy overlay, and publishes a synthetic
+topology to it repeatedly from a stand-in publisher. Some of the clients
+are stalled: they connect, and then never read, so that the server can
+only write to them until their socket buffers are full.
+
+Reports the time for each publish to reach all of the reading clients,
+the server's memory, and the per-client counters from /stats (messages
+replaced or dropped for the stalled clients, and their lag).
+
+Usage: python benchmarks/websocket_fanout.py [--clients 200] [--stalled 20]
+    [--publishes 20] [--nodes 500] [--interval 0.2] [--compression]
+"""
+
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import re
+import socket
+import threading
+import time
+import urllib
+
+import autonetkit.ank_messaging as ank_messaging
+import autonetkit.webserver as webserver
+import tornado.ioloop
+from tornado import gen
+from tornado.websocket import websocket_connect
+
+VERSION = re.compile(r'"publish_version", (\d+)')
+
+
+def serve(port, compression, max_queued):
+    application = webserver.make_application(
+        webserver.AnkAccessor(), websocket_compression=compression,
+        max_queued=max_queued)
+    application.listen(port)
+    tornado.ioloop.IOLoop.current().start()
+
+
+def server_rss(pid):
+    """Returns the resident memory of process pid, in kB"""
+    with open("/proc/%s/status" % pid) as fh:
+        for line in fh:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+
+
+def topology(version, nodes):
+    """Returns a synthetic topology, {overlay_id: node-link data}, of a
+    ring of nodes, marked with version"""
+    return {"phy": {
+        "directed": False, "multigraph": False,
+        "graph": [["publish_version", version]],
+        "nodes": [{"id": "r%s" % i, "label": "r%s" % i, "x": i, "y": i,
+                   "asn": 1, "device_type": "router"}
+                  for i in range(nodes)],
+        "links": [{"source": i, "target": (i + 1) % nodes}
+                  for i in range(nodes)],
+    }}
+
+
+def stalled_client(port):
+    """Connects a websocket client that never reads"""
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    key = base64.b64encode(os.urandom(16))
+    sock.sendall("GET /ws HTTP/1.1\r\nHost: 127.0.0.1:%s\r\n"
+                 "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                 "Sec-WebSocket-Key: %s\r\nSec-WebSocket-Version: 13\r\n"
+                 "\r\n" % (port, key))
+    return sock
+
+
+@gen.coroutine
+def reading_client(url, compression, received):
+    """Connects a websocket client, and records in received the time
+    each version of the overlay arrives"""
+    connection = yield websocket_connect(
+        url, compression_options={} if compression else None)
+    connection.write_message("overlay_id=phy")
+    while True:
+        message = yield connection.read_message()
+        if message is None:
+            break
+        match = VERSION.search(message)
+        if match:
+            received.setdefault(int(match.group(1)), time.time())
+
+
+def publish(port, arguments, published):
+    http_url = "http://127.0.0.1:%s/publish" % port
+    for version in range(1, arguments.publishes + 1):
+        body = json.dumps(topology(version, arguments.nodes))
+        published[version] = time.time()
+        ank_messaging.post(http_url, {"body": body, "type": "anm",
+                                      "uuid": "singleuser"})
+        time.sleep(arguments.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--stalled", type=int, default=20)
+    parser.add_argument("--publishes", type=int, default=20)
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=0.2)
+    parser.add_argument("--max_queued", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--compression", action="store_true")
+    arguments = parser.parse_args()
+
+    server = multiprocessing.Process(
+        target=serve, args=(arguments.port, arguments.compression,
+                            arguments.max_queued))
+    server.daemon = True
+    server.start()
+    time.sleep(1)
+    rss_start = server_rss(server.pid)
+
+    io_loop = tornado.ioloop.IOLoop.current()
+    url = "ws://127.0.0.1:%s/ws" % arguments.port
+    received = [{} for _ in range(arguments.clients)]
+    for index in range(arguments.clients):
+        reading_client(url, arguments.compression, received[index])
+    stalled = [stalled_client(arguments.port)
+               for _ in range(arguments.stalled)]
+
+    published = {}
+    publisher = threading.Thread(target=publish,
+                                 args=(arguments.port, arguments, published))
+    io_loop.call_later(1, publisher.start)
+
+    def finished():
+        return (not publisher.is_alive() and published
+                and all(arguments.publishes in times for times in received))
+
+    deadline = time.time() + 60 + arguments.publishes * arguments.interval
+
+    @gen.coroutine
+    def wait():
+        while not finished() and time.time() < deadline:
+            yield gen.sleep(0.1)
+
+    io_loop.run_sync(wait)
+    stats = json.loads(urllib.urlopen(
+        "http://127.0.0.1:%s/stats" % arguments.port).read())
+    rss_end = server_rss(server.pid)
+    server.terminate()
+    for sock in stalled:
+        sock.close()
+
+    print "%s reading clients, %s stalled, %s publishes of %s nodes" % (
+        arguments.clients, arguments.stalled, arguments.publishes,
+        arguments.nodes)
+    latencies = []
+    for version, publish_time in sorted(published.items()):
+        arrivals = [times[version] for times in received if version in times]
+        if arrivals:
+            latencies.append(max(arrivals) - publish_time)
+    complete = sum(1 for times in received if arguments.publishes in times)
+    print "latest version reached %s/%s reading clients" % (
+        complete, arguments.clients)
+    if latencies:
+        print "publish to all reading clients: mean %.3fs, max %.3fs" % (
+            sum(latencies) / len(latencies), max(latencies))
+    print "server memory: %s kB at start, %s kB at end" % (rss_start, rss_end)
+
+    clients = stats["clients"]
+    lagging = sorted(clients, key=lambda client: client["lag"])[-len(stalled):]
+    if stalled:
+        print "stalled clients: %s dropped, %s replaced, max lag %.1fs" % (
+            sum(client["dropped"] for client in lagging),
+            sum(client["replaced"] for client in lagging),
+            stats["max_lag"])
+    print "total sent: %s messages, %.1f MB" % (
+        sum(client["sent"] for client in clients),
+        sum(client["bytes_sent"] for client in clients) / 1e6)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import gzip
+import json
+from cStringIO import StringIO
+
+import autonetkit.webserver as webserver
+import tornado.escape
+import tornado.httpclient
+import tornado.httpserver
+import tornado.ioloop
+import tornado.testing
+from autonetkit.vis_delta import Snapshot
+
+
+def test():
+    accessor = webserver.AnkAccessor()
+    phy = {"nodes": [{"id": "r1", "label": "</r1>"}], "links": []}
+    ospf = {"nodes": [], "links": []}
+    accessor.store_overlay("test", {"phy": phy, "ospf": ospf})
+
+    overlay = accessor.get_serialised_overlay("test", "phy")
+    assert(overlay is accessor.get_serialised_overlay("test", "phy"))
+    assert(overlay.json == tornado.escape.json_encode(phy))
+    assert(gzip.GzipFile(fileobj=StringIO(overlay.gzip)).read()
+           == overlay.json)
+    assert(accessor.get_overlay("test", "phy") == phy)
+    assert(accessor.get_overlay("test", "*") == {"phy": phy, "ospf": ospf})
+    assert(accessor.get_serialised_overlay("test", "isis") is None)
+    assert(accessor.get_overlay("missing", "phy") == "")
+    assert(json.loads(accessor.overlay_list_json("test"))
+           == {"overlay_list": ["ospf", "phy"]})
+
+    # only the overlays changed by a delta are serialised again
+    graph = json.dumps({"directed": False, "multigraph": False,
+                        "graph": []})
+    node = json.dumps({"id": "r1"})
+    first = Snapshot("1", {"phy": (graph, {"r1": node}, {}),
+                           "ospf": (graph, {"r1": node}, {})})
+    accessor.apply_delta("test", json.loads(first.delta_from(Snapshot())))
+    ospf = accessor.get_serialised_overlay("test", "ospf")
+    second = Snapshot("2", {"phy": (graph, {}, {}),
+                            "ospf": (graph, {"r1": node}, {})})
+    assert(accessor.apply_delta(
+        "test", json.loads(second.delta_from(first))) == "2")
+    assert(accessor.get_serialised_overlay("test", "ospf") is ospf)
+    assert(accessor.get_overlay("test", "phy")["nodes"] == [])
+
+
+def test_lru():
+    import shutil
+    import tempfile
+    phy = {"nodes": [{"id": "r%s" % i} for i in range(100)], "links": []}
+
+    def stored_size():
+        accessor = webserver.AnkAccessor()
+        accessor.store_overlay("size", {"phy": phy})
+        return accessor.stats()["bytes"]
+
+    size = stored_size()
+    accessor = webserver.AnkAccessor(max_bytes=int(2.5 * size))
+    for uuid in ["a", "b"]:
+        accessor.store_overlay(uuid, {"phy": phy})
+    accessor.get_overlay("a", "phy")  # b is now least recently read
+    accessor.store_overlay("a", {"phy": phy})  # writes don't count
+    accessor.store_overlay("c", {"phy": phy})
+    assert(accessor.get_overlay("b", "phy") == "")
+    assert(accessor.get_overlay("a", "phy") == phy)
+    stats = accessor.stats()
+    assert(stats["topologies"] == 2 and stats["bytes"] == 2 * size)
+    assert(stats["evictions"] == 1)
+    assert(stats["hits"] == 2 and stats["misses"] == 0)
+
+    spill_dir = tempfile.mkdtemp()
+    try:
+        accessor = webserver.AnkAccessor(max_bytes=int(1.5 * size),
+                                         spill_dir=spill_dir)
+        for uuid in ["a", "b"]:
+            accessor.store_overlay(uuid, {"phy": phy})
+        assert(accessor.get_overlay("a", "phy") == phy)  # reloaded
+        assert(accessor.get_overlay("b", "phy") == phy)
+        stats = accessor.stats()
+        assert(stats["topologies"] == 1)
+        assert(stats["spills"] == 3 and stats["reloads"] == 2)
+        assert(stats["misses"] == 2)
+    finally:
+        shutil.rmtree(spill_dir)
+
+
+def test_http_caching():
+    accessor = webserver.AnkAccessor()
+    phy = {"nodes": [{"id": "r1"}], "links": []}
+    accessor.store_overlay("test", {"phy": phy, "ospf": phy})
+    io_loop = tornado.ioloop.IOLoop()
+    io_loop.make_current()
+    sock, port = tornado.testing.bind_unused_port()
+    server = tornado.httpserver.HTTPServer(
+        webserver.make_application(accessor))
+    server.add_sockets([sock])
+    client = tornado.httpclient.AsyncHTTPClient()
+
+    def fetch(overlay_id, **headers):
+        url = ("http://127.0.0.1:%s/overlay?uuid=test&overlay_id=%s"
+               % (port, overlay_id))
+        return io_loop.run_sync(lambda: client.fetch(
+            url, headers=headers, decompress_response=False,
+            raise_error=False))
+
+    try:
+        response = fetch("phy")
+        etag = response.headers["Etag"]
+        assert(response.code == 200 and "Content-Encoding" not in
+               response.headers)
+        assert(json.loads(response.body) == phy)
+        assert(fetch("phy", **{"If-None-Match": etag}).code == 304)
+        assert(fetch("phy", **{"If-None-Match": "W/%s" % etag}).code == 304)
+        assert(fetch("phy", **{"If-None-Match": '"other"'}).code == 200)
+
+        response = fetch("phy", **{"Accept-Encoding": "deflate, gzip"})
+        assert(response.headers["Content-Encoding"] == "gzip")
+        assert(response.headers["Etag"] != etag)
+        assert(gzip.GzipFile(fileobj=StringIO(response.body)).read()
+               == tornado.escape.json_encode(phy))
+        assert(fetch("phy", **{"Accept-Encoding": "gzip;q=0"}).headers[
+            "Etag"] == etag)
+
+        # all overlays, checked against the etags of each
+        etag = fetch("*").headers["Etag"]
+        assert(fetch("*", **{"If-None-Match": etag}).code == 304)
+        accessor.store_overlay("test", {"phy": phy, "ospf": {"nodes": []}})
+        response = fetch("*", **{"If-None-Match": etag})
+        assert(response.code == 200 and response.headers["Etag"] != etag)
+        assert(fetch("isis").code == 404)
+    finally:
+        server.stop()
+        client.close()
+        io_loop.close(all_fds=True)
+        tornado.ioloop.IOLoop.clear_current()
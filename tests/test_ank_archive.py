@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+
+import autonetkit.ank_archive as ank_archive
+import autonetkit.build_network as build_network
+from autonetkit.exception import AnkIncorrectFileFormat
+
+
+def test():
+    dirname, filename = os.path.split(os.path.abspath(__file__))
+    with open(os.path.join(dirname, "house.json")) as fh:
+        anm = build_network.build(build_network.load(fh.read()))
+
+    base = tempfile.mkdtemp()
+    try:
+        archive_file = os.path.join(base, "anm" + ank_archive.EXTENSION)
+        ank_archive.save(archive_file, sorted(anm._overlays.items()))
+        assert(ank_archive.section_names(archive_file)
+               == sorted(anm._overlays))
+
+        graphs = ank_archive.load(archive_file, ["ipv4"])
+        assert(graphs.keys() == ["ipv4"])
+        original = anm._overlays["ipv4"]
+        restored = graphs["ipv4"]
+        assert(sorted(restored.nodes()) == sorted(original.nodes()))
+        assert(restored.number_of_edges() == original.number_of_edges())
+        for node, data in original.nodes(data=True):
+            assert(restored.node[node] == data)  # eg IPAddress values
+
+        not_archive = os.path.join(base, "anm.json.gz")
+        with open(not_archive, "w") as fh:
+            fh.write("{}")
+        try:
+            ank_archive.load(not_archive)
+        except AnkIncorrectFileFormat:
+            pass
+        else:
+            assert(False)
+    finally:
+        shutil.rmtree(base)
+
+
+def test_lazy_restore():
+    import autonetkit.anm
+    import autonetkit.config
+    dirname, filename = os.path.split(os.path.abspath(__file__))
+    with open(os.path.join(dirname, "house.json")) as fh:
+        anm = build_network.build(build_network.load(fh.read()))
+    anm._overlays.pop("mct")  # node references can't be saved to JSON
+    for node, data in anm._overlays["input"].nodes(data=True):
+        data.pop("mct", None)
+
+    settings = autonetkit.config.settings['General']
+    previous_format = settings['archive_format']
+    cwd = os.getcwd()
+    base = tempfile.mkdtemp()
+    os.chdir(base)
+    try:
+        for archive_format in ["json", "binary"]:
+            settings['archive_format'] = archive_format
+            anm.save()
+            restored = autonetkit.anm.NetworkModel()
+            restored.restore_latest(lazy=True)
+            assert(sorted(restored.overlays()) == sorted(anm.overlays()))
+            assert(restored.overlay_nx_graphs.pending
+                   == sorted(anm.overlays()))
+
+            ipv4 = restored['ipv4']
+            assert(sorted(str(node) for node in ipv4)
+                   == sorted(str(node) for node in anm['ipv4']))
+            pending = restored.overlay_nx_graphs.pending
+            assert("ipv4" not in pending and "ospf" in pending)
+            r1 = ipv4.node("r1")
+            assert(r1.loopback == anm['ipv4'].node("r1").loopback)
+            assert(sorted(r1.raw_interfaces)
+                   == sorted(anm['ipv4'].node("r1").raw_interfaces))
+            shutil.rmtree("versions")
+    finally:
+        settings['archive_format'] = previous_format
+        os.chdir(cwd)
+        shutil.rmtree(base)
@@ -0,0 +1,57 @@
+import os
+from cStringIO import StringIO
+
+import autonetkit.ank_json as ank_json
+import autonetkit.build_network as build_network
+import netaddr
+
+
+def test():
+    data = {"b": [1, {"c": netaddr.IPAddress("10.0.0.1")}], "a": {}, "d": []}
+    fh = StringIO()
+    ank_json.dump_json_object([(key, lambda val=val: val)
+                               for key, val in data.items()], fh)
+    assert(fh.getvalue() == ank_json.json.dumps(
+        data, cls=ank_json.AnkEncoder, indent=4, sort_keys=True))
+    fh = StringIO()
+    ank_json.dump_json_object([], fh)
+    assert(fh.getvalue() == "{}")
+
+    dirname, filename = os.path.split(os.path.abspath(__file__))
+    with open(os.path.join(dirname, "house.json")) as fh:
+        anm = build_network.build(build_network.load(fh.read()))
+    phy_data = dict(anm['phy']._graph.node['r1'])
+    overlays = ank_json.json.loads(ank_json.jsonify_anm_with_graphics(anm))
+    assert(sorted(overlays) == sorted(anm.overlays()))
+    nodes = dict((node['id'], node) for node in overlays['phy']['nodes'])
+    assert(nodes['r1']['label'] == "r1")
+    assert(len(overlays['phy']['links'])
+           == anm['phy']._graph.number_of_edges())
+    # overlay data isn't modified
+    assert(anm['phy']._graph.node['r1'] == phy_data)
+
+
+def test_tagged_loads():
+    import networkx as nx
+    from autonetkit.nidb import ConfigStanza
+    graph = nx.Graph()
+    stanza = ConfigStanza(subnet=netaddr.IPNetwork("10.0.0.0/30"))
+    graph.add_node("r1", loopback=netaddr.IPAddress("192.168.0.1"),
+                   version="12.4", ospf=stanza,
+                   peers=[netaddr.IPAddress("10.0.0.2"), "10.0.0.3"])
+
+    for tagged in [True, False]:
+        restored = ank_json.ank_json_loads(
+            ank_json.ank_json_dumps(graph, tagged=tagged))
+        r1 = restored.node["r1"]
+        assert(r1["loopback"] == netaddr.IPAddress("192.168.0.1"))
+        assert(r1["ospf"].subnet == netaddr.IPNetwork("10.0.0.0/30"))
+        assert(r1["peers"][0] == netaddr.IPAddress("10.0.0.2"))
+    # only tagged values are restored as netaddr objects
+    assert(r1["version"] == netaddr.IPAddress("12.4"))  # heuristic
+    restored = ank_json.ank_json_loads(
+        ank_json.ank_json_dumps(graph, tagged=True))
+    assert(restored.node["r1"]["version"] == "12.4")
+    assert(restored.node["r1"]["peers"][1] == "10.0.0.3")
+    assert([key for key, _ in restored.node["r1"]["ospf"].items()]
+           == ["subnet"])
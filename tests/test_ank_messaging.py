@@ -0,0 +1,28 @@
+import threading
+
+import autonetkit.ank_messaging as ank_messaging
+
+
+def test():
+    publisher = ank_messaging.Publisher(max_pending=2)
+    sending = threading.Event()
+    release = threading.Event()
+    sent = []
+
+    def send(name):
+        def send():
+            sending.set()
+            release.wait()
+            sent.append(name)
+        return send
+
+    publisher.submit("a", send("a1"))
+    sending.wait()  # a1 is being sent, so later publishes are queued
+    publisher.submit("b", send("b1"))
+    publisher.submit("a", send("a2"))
+    publisher.submit("b", send("b2"))  # replaces b1
+    publisher.submit("c", send("c1"))  # queue full, drops a2
+    assert(not publisher.flush(timeout=0.01))
+    release.set()
+    assert(publisher.flush())
+    assert(sent == ["a1", "b2", "c1"])
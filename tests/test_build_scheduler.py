@@ -0,0 +1,83 @@
+import os
+
+import networkx as nx
+
+import autonetkit.ank_profile as ank_profile
+import autonetkit.build_network as build_network
+import autonetkit.build_scheduler as build_scheduler
+
+
+def test():
+    dirname, filename = os.path.split(os.path.abspath(__file__))
+    input_file = os.path.join(dirname, "house.json")
+    with open(input_file, "r") as fh:
+        input_string = fh.read()
+
+    anm_serial = build_network.build(build_network.load(input_string),
+                                     workers=1)
+    profiler = ank_profile.StageProfiler()
+    anm_parallel = build_network.build(build_network.load(input_string),
+                                       workers=4, profiler=profiler)
+
+    assert(sorted(anm_serial.overlays()) == sorted(anm_parallel.overlays()))
+    for overlay_id in anm_serial.overlays():
+        g_serial = anm_serial.overlay_nx_graphs[overlay_id]
+        g_parallel = anm_parallel.overlay_nx_graphs[overlay_id]
+        assert(sorted(g_serial.nodes()) == sorted(g_parallel.nodes()))
+        assert(g_serial.number_of_edges() == g_parallel.number_of_edges())
+
+    stages = build_network.design_stages()
+    assert(len(profiler.stages) == len(stages))
+    assert(build_scheduler.undeclared_dependencies(anm_parallel, stages)
+           == [])
+
+
+def test_dependency_graph():
+    graph = build_scheduler.dependency_graph(build_network.design_stages())
+    # igp protocols only depend on the shared igp defaults
+    for stage_name in ["build_ospf", "build_isis", "build_eigrp", "build_rip"]:
+        assert(graph.predecessors(stage_name) == ["set_igp_defaults"])
+    assert(not nx.has_path(graph, "build_snmp", "build_ntp"))
+    assert(not nx.has_path(graph, "build_ntp", "build_snmp"))
+
+
+def test_error():
+    def fail(anm):
+        raise ValueError("stage failed")
+
+    stages = [
+        build_scheduler.DesignStage("a", fail, reads=["input"], writes=["a"]),
+        build_scheduler.DesignStage("b", lambda anm: None, reads=["a"],
+                                    writes=["b"]),
+    ]
+    scheduler = build_scheduler.StageScheduler(stages, workers=2)
+    try:
+        scheduler.run(None)
+    except ValueError:
+        pass
+    else:
+        assert(False)
+
+
+def test_incremental():
+    dirname, filename = os.path.split(os.path.abspath(__file__))
+    input_file = os.path.join(dirname, "house.json")
+    with open(input_file, "r") as fh:
+        input_string = fh.read()
+
+    incremental = build_network.IncrementalBuild()
+    incremental.build(build_network.load(input_string))
+    assert(incremental.stages is None)  # first build is a full build
+
+    input_graph = build_network.load(input_string)
+    input_graph.node["r1"]['ospf_area'] = 5
+    anm = incremental.build(input_graph)
+    assert([stage.name for stage in incremental.stages]
+           == ["build_ospf", "build_igp"])
+    assert(anm['ospf'].node("r1").area == 5)
+
+    # moving a node is applied by initialise, so needs a full build
+    input_graph = build_network.load(input_string)
+    input_graph.node["r1"]['x'] = 0
+    incremental.build(input_graph)
+    assert(incremental.stages is None)
@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+
+import autonetkit.build_network as build_network
+import autonetkit.config
+
+
+def addresses(anm):
+    retval = {}
+    for overlay_id in ["ipv4", "ipv6"]:
+        for node in anm[overlay_id].l3devices():
+            retval[(overlay_id, str(node), "loopback")] = str(node.loopback)
+            for interface in node.physical_interfaces():
+                if interface.is_bound:
+                    key = (overlay_id, str(node), interface.interface_id)
+                    retval[key] = str(interface.ip_address)
+    return retval
+
+
+def grid(add_router=False):
+    graph = build_network.grid_2d(3)
+    graph.graph['address_family'] = "dual_stack"
+    if add_router:
+        graph.add_node("new", dict(graph.node["2_2"]))
+        graph.add_edge("2_2", "new", type="physical")
+    return graph
+
+
+def test():
+    settings = autonetkit.config.settings['IP Addressing']
+    previous_settings = dict(settings)
+    ledger_dir = tempfile.mkdtemp()
+    settings['ledger'] = True
+    settings['ledger_file'] = os.path.join(ledger_dir, "ledger.json")
+    try:
+        before = addresses(build_network.build(grid()))
+        assert(os.path.isfile(settings['ledger_file']))
+        after = addresses(build_network.build(grid(add_router=True)))
+    finally:
+        settings.update(previous_settings)
+        shutil.rmtree(ledger_dir)
+
+    # existing allocations kept, and only the new objects allocated
+    assert(all(after[key] == value for key, value in before.items()))
+    new = set(after) - set(before)
+    assert(new == set([("ipv4", "new", "loopback"), ("ipv4", "new", 1),
+                       ("ipv4", "2_2", 3), ("ipv6", "new", "loopback"),
+                       ("ipv6", "new", 1), ("ipv6", "2_2", 3)]))
+    assert(len(set(after.values())) == len(after))
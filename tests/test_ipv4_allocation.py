@@ -0,0 +1,36 @@
+import itertools
+
+import netaddr
+from autonetkit.plugins.ipv4 import _SubnetBlocks, _iter_hosts
+
+
+def test():
+    # integer blocks and hosts are as per netaddr
+    for network in ["10.0.0.0/8", "192.168.1.0/24", "172.16.0.4/30",
+                    "10.0.0.1/32"]:
+        network = netaddr.IPNetwork(network)
+        for prefixlen in range(network.prefixlen - 1, 33):
+            blocks = _SubnetBlocks(network.first, network.prefixlen,
+                                   prefixlen)
+            expected = network.subnet(prefixlen)
+            for _ in range(4):
+                try:
+                    value = expected.next().first
+                except StopIteration:
+                    try:
+                        blocks.next()
+                    except StopIteration:
+                        break
+                    raise AssertionError("block past end of subnet")
+                assert(blocks.next() == value)
+
+        hosts = [int(ip) for ip in itertools.islice(network.iter_hosts(), 10)]
+        assert(list(itertools.islice(_iter_hosts(network.first,
+                                                 network.prefixlen), 10))
+               == hosts)
+
+    # continue past the subnet once unbounded, as for IPNetwork.next()
+    blocks = _SubnetBlocks(int(netaddr.IPAddress("10.0.0.0")), 31, 31)
+    blocks.next()
+    blocks.unbounded = True
+    assert(blocks.next() == int(netaddr.IPAddress("10.0.0.2")))
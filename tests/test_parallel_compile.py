@@ -0,0 +1,30 @@
+import os
+
+import autonetkit.ank_json as ank_json
+import autonetkit.build_network as build_network
+import autonetkit.config
+import autonetkit.workflow as workflow
+from networkx.readwrite import json_graph
+
+
+def compiled_nodes(anm, workers):
+    settings = autonetkit.config.settings['Compiler']
+    previous_workers = settings['workers']
+    settings['workers'] = workers
+    try:
+        nidb = workflow.compile_network(anm)
+    finally:
+        settings['workers'] = previous_workers
+
+    nodes = json_graph.node_link_data(nidb.raw_graph())['nodes']
+    for node in nodes:
+        del node['render']  # timestamped folder
+    return ank_json.json.dumps(nodes, cls=ank_json.AnkEncoder,
+                               sort_keys=True)
+
+
+def test():
+    dirname, filename = os.path.split(os.path.abspath(__file__))
+    with open(os.path.join(dirname, "house.json")) as fh:
+        anm = build_network.build(build_network.load(fh.read()))
+    assert(compiled_nodes(anm, workers=2) == compiled_nodes(anm, workers=1))
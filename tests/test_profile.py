@@ -0,0 +1,40 @@
+import json
+import os
+
+import autonetkit.ank_profile as ank_profile
+import autonetkit.build_network as build_network
+
+
+def test():
+    dirname, filename = os.path.split(os.path.abspath(__file__))
+    input_file = os.path.join(dirname, "house.json")
+    with open(input_file, "r") as fh:
+        input_string = fh.read()
+
+    input_graph = build_network.load(input_string)
+    profiler = ank_profile.StageProfiler()
+    anm = build_network.build(input_graph, profiler=profiler)
+
+    stage_names = [stage['name'] for stage in profiler.stages]
+    for expected in ["build_phy", "build_layer3", "build_ipv4", "build_ospf",
+                     "build_bgp", "build_radius"]:
+        assert(expected in stage_names)
+
+    stages = dict((stage['name'], stage) for stage in profiler.stages)
+    assert("ospf" in stages['build_ospf']['overlays'])
+    assert(stages['build_ospf']['overlays']['ospf']['nodes']
+           == anm['ospf']._graph.number_of_nodes())
+    assert(all(stage['wall_time'] >= 0 for stage in profiler.stages))
+
+    report = json.loads(profiler.dumps())
+    assert(len(report['stages']) == len(stage_names))
+
+    table = profiler.table()
+    assert("build_igp" in table)
+
+
+def test_disabled():
+    input_graph = build_network.grid_2d(2)
+    profiler = ank_profile.StageProfiler(enabled=False)
+    build_network.build(input_graph, profiler=profiler)
+    assert(profiler.stages == [])
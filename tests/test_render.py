@@ -0,0 +1,206 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+import autonetkit.config
+import autonetkit.render as render
+import mako.template
+from autonetkit.nidb import ConfigStanza
+
+
+def test():
+    base = tempfile.mkdtemp()
+    try:
+        src = os.path.join(base, "src")
+        os.makedirs(os.path.join(src, "etc", "empty"))
+        with open(os.path.join(src, "etc", "static.txt"), "w") as fh:
+            fh.write("static")
+        with open(os.path.join(src, "etc", "hostname.mako"), "w") as fh:
+            fh.write("${node}")
+
+        folder = render.TemplateFolder(src)
+        for node in ["r1", "r2"]:
+            dst = os.path.join(base, node)
+            folder.render(dst, node=node)
+            assert(sorted(os.listdir(os.path.join(dst, "etc")))
+                   == ["empty", "hostname", "static.txt"])
+            with open(os.path.join(dst, "etc", "hostname")) as fh:
+                assert(fh.read() == node)
+
+        # replaces previous output
+        with open(os.path.join(base, "r1", "stale"), "w") as fh:
+            fh.write("stale")
+        folder.render(os.path.join(base, "r1"), node="r1")
+        assert(not os.path.exists(os.path.join(base, "r1", "stale")))
+    finally:
+        shutil.rmtree(base)
+
+    squares = render.map_forked(lambda x: x * x, range(10), processes=2)
+    assert(squares == [x * x for x in range(10)])
+
+
+def test_template_cache():
+    settings = autonetkit.config.settings['General']
+    previous_settings = dict(settings)
+    previous_cache_dir = render.template_cache_dir
+    base = tempfile.mkdtemp()
+    render.template_cache_dir = os.path.join(base, "cache")
+    try:
+        template_file = os.path.join(base, "hostname.mako")
+        with open(template_file, "w") as fh:
+            fh.write("${node}")
+        settings['template_cache'] = True
+        module_path = render.template_module_path(template_file)
+        assert(os.path.dirname(module_path) == render.template_cache_dir)
+        template = mako.template.Template(filename=template_file,
+                                          module_filename=module_path)
+        assert(template.render(node="r1") == "r1")
+        assert(os.path.isfile(module_path))
+
+        # new module if the template changes
+        with open(template_file, "w") as fh:
+            fh.write("hostname ${node}")
+        assert(render.template_module_path(template_file) != module_path)
+
+        settings['template_cache'] = False
+        assert(render.template_module_path(template_file) is None)
+    finally:
+        settings.update(previous_settings)
+        render.template_cache_dir = previous_cache_dir
+        shutil.rmtree(base)
+
+
+class Node(object):
+
+    """Node data for render_node, as for a DmNode"""
+
+    def __init__(self, **kwargs):
+        object.__setattr__(self, '_node_data', kwargs)
+
+    def __getattr__(self, key):
+        return self._node_data.get(key)
+
+    def __setattr__(self, key, value):
+        self._node_data[key] = value
+
+
+def test_render_manifest():
+    base = tempfile.mkdtemp()
+    try:
+        src = os.path.join(base, "src")
+        os.makedirs(src)
+        with open(os.path.join(src, "hostname.mako"), "w") as fh:
+            fh.write("${node.hostname}")
+        template_folders = {"src": render.TemplateFolder(src)}
+        manifest_file = os.path.join(base, "manifest.json")
+        dst = os.path.join(base, "r1")
+        node = Node(do_render=True, hostname="r1",
+                    render=ConfigStanza(base="src", base_dst_folder=dst))
+
+        def render_counts():
+            manifest = render.RenderManifest(manifest_file)
+            render.render_node(node, template_folders, manifest)
+            manifest.save()
+            return manifest.rendered, manifest.skipped
+
+        assert(render_counts() == (1, 0))
+        mtime = os.stat(os.path.join(dst, "hostname")).st_mtime
+        assert(render_counts() == (0, 1))
+        assert(os.stat(os.path.join(dst, "hostname")).st_mtime == mtime)
+
+        node.hostname = "r1a"
+        assert(render_counts() == (1, 0))
+        with open(os.path.join(dst, "hostname")) as fh:
+            assert(fh.read() == "r1a")
+
+        # rendered again if the output is removed
+        shutil.rmtree(dst)
+        assert(render_counts() == (1, 0))
+    finally:
+        shutil.rmtree(base)
+
+
+def test_render_archive():
+    base = tempfile.mkdtemp()
+    try:
+        src = os.path.join(base, "src")
+        os.makedirs(os.path.join(src, "etc", "empty"))
+        with open(os.path.join(src, "etc", "static.txt"), "w") as fh:
+            fh.write("static")
+        with open(os.path.join(src, "etc", "hostname.mako"), "w") as fh:
+            fh.write("${node}")
+        folder = render.TemplateFolder(src)
+
+        for filename in ["lab.tar.gz", "lab.zip"]:
+            archive_file = os.path.join(base, filename)
+            with render.RenderArchive(archive_file) as archive:
+                for node in ["r1", "r2"]:
+                    folder.render(os.path.join("rendered", node),
+                                  archive=archive, node=node)
+            assert(not os.path.exists(os.path.join(base, "rendered")))
+
+            dst = os.path.join(base, "extracted")
+            if filename.endswith(".zip"):
+                zipfile.ZipFile(archive_file).extractall(dst)
+            else:
+                tarfile.open(archive_file).extractall(dst)
+            for node in ["r1", "r2"]:
+                etc = os.path.join(dst, "rendered", node, "etc")
+                assert(sorted(os.listdir(etc))
+                       == ["empty", "hostname", "static.txt"])
+                with open(os.path.join(etc, "hostname")) as fh:
+                    assert(fh.read() == node)
+            shutil.rmtree(dst)
+    finally:
+        shutil.rmtree(base)
+
+
+def test_render_context():
+    context = render.RenderContext(version_banner="autonetkit_test",
+                                   date="2014-01-01 00:00")
+    assert(context.resource_path("templates")
+           == render.resource_path("templates"))
+    base = tempfile.mkdtemp()
+    try:
+        src = os.path.join(base, "src")
+        os.makedirs(src)
+        with open(os.path.join(src, "banner.mako"), "w") as fh:
+            fh.write("${version_banner} ${date}")
+        template_folders = {"src": render.TemplateFolder(src)}
+        for hostname in ["r1", "r2"]:
+            dst = os.path.join(base, hostname)
+            node = Node(do_render=True, hostname=hostname,
+                        render=ConfigStanza(base="src", base_dst_folder=dst))
+            render.render_node(node, template_folders, context=context)
+            with open(os.path.join(dst, "banner")) as fh:
+                assert(fh.read() == "autonetkit_test 2014-01-01 00:00")
+    finally:
+        shutil.rmtree(base)
+
+
+def test_dedupe_static():
+    base = tempfile.mkdtemp()
+    try:
+        src = os.path.join(base, "src")
+        os.makedirs(src)
+        with open(os.path.join(src, "static.txt"), "w") as fh:
+            fh.write("static")
+        folder = render.TemplateFolder(src, link_static=True)
+        for node in ["r1", "r2"]:
+            folder.render(os.path.join(base, node))
+        assert(os.path.samefile(os.path.join(base, "r1", "static.txt"),
+                                os.path.join(base, "r2", "static.txt")))
+
+        archive_file = os.path.join(base, "lab.tar.gz")
+        with render.RenderArchive(archive_file, dedupe=True) as archive:
+            for node in ["r1", "r2"]:
+                folder.render(os.path.join("rendered", node),
+                              archive=archive)
+        members = dict((member.name, member)
+                       for member in tarfile.open(archive_file))
+        link = members["rendered/r2/static.txt"]
+        assert(link.islnk() and link.linkname == "rendered/r1/static.txt")
+    finally:
+        shutil.rmtree(base)
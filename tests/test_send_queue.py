@@ -0,0 +1,61 @@
+from autonetkit.webserver import SendQueue
+
+
+class Future(object):
+
+    """Done when the write is flushed, calling its callbacks directly
+    rather than from the IOLoop"""
+
+    def __init__(self):
+        self.callbacks = []
+        self._done = False
+
+    def done(self):
+        return self._done
+
+    def add_done_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def set_result(self, result):
+        self._done = True
+        for callback in self.callbacks:
+            callback(self)
+
+    def exception(self):
+        return None
+
+
+def test():
+    written = []
+    futures = []
+
+    def write(message):
+        written.append(message)
+        futures.append(Future())
+        return futures[-1]
+
+    queue = SendQueue(write, max_queued=2)
+    queue.send("overlay", "v1")
+    queue.send("overlay", "v2")  # queued behind v1
+    queue.send("overlay", "v3")  # replaces v2, which is stale
+    queue.send("overlay_list", "l1")
+    queue.send("highlight", "h1")  # drops v3, the oldest queued
+    assert(written == ["v1"])
+    assert(len(queue) == 2 and queue.lag() > 0)
+
+    futures[-1].set_result(None)
+    assert(written == ["v1", "l1"])
+    futures[-1].set_result(None)
+    futures[-1].set_result(None)
+    assert(written == ["v1", "l1", "h1"])
+    stats = queue.stats()
+    assert(stats["sent"] == 3 and stats["bytes_sent"] == 6)
+    assert(stats["replaced"] == 1 and stats["dropped"] == 1)
+    assert(stats["queued"] == 0 and stats["lag"] == 0)
+
+    # without flush futures (older tornado), messages are written in turn
+    written = []
+    queue = SendQueue(lambda message: written.append(message))
+    queue.send("overlay", "v1")
+    queue.send("overlay_list", "l1")
+    assert(written == ["v1", "l1"])
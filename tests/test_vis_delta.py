@@ -0,0 +1,66 @@
+import json
+import os
+import random
+
+import autonetkit.ank_json as ank_json
+import autonetkit.ank_messaging as ank_messaging
+import autonetkit.build_network as build_network
+import autonetkit.webserver as webserver
+
+
+def published_topology(anm):
+    random.seed(1)  # for the same random positions of nodes without x, y
+    return json.loads(ank_json.dumps(anm))
+
+
+def canonical(overlay):
+    """Node-link data independent of the order of nodes and links"""
+    ids = [node['id'] for node in overlay['nodes']]
+    links = sorted(json.dumps(dict(link, source=ids[link['source']],
+                                   target=ids[link['target']]),
+                              sort_keys=True)
+                   for link in overlay['links'])
+    nodes = sorted(json.dumps(node, sort_keys=True)
+                   for node in overlay['nodes'])
+    return dict(overlay, nodes=nodes, links=links)
+
+
+def test():
+    dirname, filename = os.path.split(os.path.abspath(__file__))
+    with open(os.path.join(dirname, "house.json")) as fh:
+        anm = build_network.build(build_network.load(fh.read()))
+    del anm._overlays['mct']  # node references
+
+    accessor = webserver.AnkAccessor()
+
+    def publish(base):
+        random.seed(1)
+        current = ank_messaging.snapshot(anm)
+        delta = json.loads(current.delta_from(base))
+        assert(accessor.apply_delta("test", delta) == current.version)
+        expected = published_topology(anm)
+        stored = accessor.get_overlay("test", "*")
+        assert(sorted(stored) == sorted(expected))
+        for overlay_id in expected:
+            assert(canonical(stored[overlay_id])
+                   == canonical(expected[overlay_id]))
+        return current, delta
+
+    first, delta = publish(ank_messaging.vis_delta.Snapshot())
+    assert(sorted(delta['overlays']) == sorted(published_topology(anm)))
+
+    anm['ospf'].node("r1").cost = 5
+    anm['ospf']._graph.remove_edge(*anm['ospf']._graph.edges()[0])
+    del anm._overlays['isis']
+    second, delta = publish(first)
+    assert(delta['base'] == first.version)
+    assert(delta['overlays'].keys() == ['ospf'])
+    assert(delta['removed'] == ['isis'])
+    assert([node['id'] for node in delta['overlays']['ospf']['nodes']]
+           == ['r1'])
+    assert(len(delta['overlays']['ospf']['removed_links']) == 1)
+
+    # client is told to resend if the server doesn't hold the base
+    delta = json.loads(ank_messaging.snapshot(anm).delta_from(first))
+    assert(accessor.apply_delta("test", delta) is None)
+    assert(accessor.apply_delta("other", delta) is None)